@@ -39,6 +39,76 @@ cloudinary.config(
 
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 
+# Uploads au-delà de 1 Mo écrits dans un fichier temporaire plutôt qu'en mémoire
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024
+
+DELTAS_MAX_DAYS = 366  # Période max acceptée par /api/deltas
+ROLLUP_MAX_DAYS = 3660  # Période max acceptée par /api/rollups
+IMPORT_MAX_UPLOAD_BYTES = 100 * 1024 * 1024  # Taille max d'un fichier CSV/JSONL envoyé à /api/kpi-daily/import
+IMPORT_CHUNK_SIZE = 1000  # Lignes validées et écrites par bulk_create
+
+# Cache des réponses KPI (invalidé à chaque écriture KpiDaily / StatsPeriod)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'statmulti',
+    }
+}
+KPI_RESPONSE_CACHE_TTL = 300  # secondes
+
+# OCR (EasyOCR)
+OCR_LANGUAGES = ['en']
+OCR_GPU = False
+OCR_READER_POOL_SIZE = 2  # Nombre de Readers chargés par processus
+OCR_READER_TIMEOUT = 30  # Attente max (secondes) pour obtenir un Reader libre
+OCR_WARMUP_AT_STARTUP = True  # False pour les workers API en lecture seule : EasyOCR/torch jamais chargés
+OCR_JOB_WORKERS = 2  # Threads traitant les uploads asynchrones (?async=1)
+OCR_JOB_STALE_AFTER = 600  # Job "running" sans nouvelle depuis ce délai (secondes) : repris par process_ocr_jobs
+OCR_PROCESS_WORKERS = 2  # Processus OCR des vues async (/api/async/kpi-daily)
+OCR_PROCESS_QUEUE_SIZE = 4  # OCR en attente acceptés en plus des workers, au-delà : 429
+OCR_PROCESS_START_METHOD = 'spawn'
+OCR_PROCESS_TIMEOUT = 60  # Attente max (secondes) d'un résultat, au-delà : 503
+OCR_PROCESS_RETRY_AFTER = 5  # En-tête Retry-After des réponses 429
+OCR_PROCESS_PRELOAD = False  # Avec 'fork' : modèle chargé une fois dans le parent, partagé par les workers
+OCR_PROCESS_TORCH_THREADS = None  # Threads torch par worker (None : cœurs / workers)
+OCR_PROCESS_CPU_AFFINITY = False  # Épingler chaque worker sur sa propre tranche de cœurs
+OCR_PROCESS_START_AT_STARTUP = False  # Créer les workers au démarrage du serveur
+# Moteurs OCR dans l'ordre d'essai : les zones manquantes ou peu confiantes
+# sont relues par le suivant (un moteur non installé est ignoré)
+OCR_BACKENDS = ['tesseract', 'easyocr']
+OCR_BACKEND_OPTIONS = {'tesseract': {'lang': 'eng', 'config': '--psm 11'}}
+OCR_FALLBACK_MIN_CONFIDENCE = 0.6  # Confiance moyenne d'une zone en dessous de laquelle elle est relue
+OCR_RETRY_ENABLED = True  # Relire les zones dont un champ manque avant de répondre 400
+OCR_RETRY_BUDGET = 4.0  # Temps max (secondes) consacré aux relectures d'une image
+OCR_RETRY_STEPS = None  # Prétraitements successifs, None = stats/preprocessing.py RETRY_STEPS
+OCR_BATCH_SIZE = 8  # Taille de lot pour readtext_batched
+OCR_BATCH_MAX_FILES = 50  # Nombre max d'images par appel à /api/kpi-daily/batch
+OCR_ROI_ENABLED = True  # Normaliser la résolution et ne lire que les zones utiles
+OCR_LAYOUT = None  # Disposition des zones de l'écran, None = kpi.png (voir stats/layout.py)
+OCR_MAX_UPLOAD_BYTES = 10 * 1024 * 1024  # Taille max d'une capture envoyée
+OCR_MAX_PIXELS = 25_000_000  # Nombre max de pixels accepté avant décodage
+OCR_CACHE_ENABLED = True
+OCR_DEBUG_CAPTURE = DEBUG  # Autoriser ?debug=1 sur POST /api/kpi-daily (logs + détections)
+# Destinations des traces par étape (voir stats/tracing.py)
+OCR_TRACE_SINKS = [
+    'stats.tracing.HistogramSink',  # exposé sur /api/metrics (Prometheus)
+    'stats.tracing.LogSink',  # une ligne JSON par requête sur le logger stats.tracing
+]
+OCR_CACHE_MAX_ENTRIES = 1000  # Au-delà, les entrées les moins récemment utilisées sont supprimées
+OCR_CACHE_TTL = 7 * 24 * 3600  # Durée de vie d'une entrée (secondes)
+OCR_CACHE_VERSION = 1  # A incrémenter pour invalider le cache (ex: changement de modèle)
+
+# Stockage des captures : envoi en arrière-plan, dédupliqué par empreinte
+# (stats.image_store.LocalBackend pour les tests et le travail hors ligne)
+IMAGE_STORE_BACKEND = 'stats.image_store.CloudinaryBackend'
+IMAGE_STORE_OPTIONS = {'folder': 'kpi'}
+IMAGE_UPLOAD_WORKERS = 2  # Threads d'envoi des images
+IMAGE_UPLOAD_STALE_AFTER = 600  # Envoi "uploading" depuis ce délai (secondes) : repris par upload_images
+# Miniatures servies par /api/kpi-daily/<id>/image/<nom> (None = stats/derivatives.py)
+IMAGE_DERIVATIVES = None
+IMAGE_DERIVATIVES_EAGER = True  # Produites dès l'envoi de l'original, sinon à la première demande
+IMAGE_DERIVATIVE_MAX_AGE = 3600  # Cache-Control des miniatures (secondes)
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -123,4 +193,31 @@ STATIC_URL = 'static/'
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
-DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
+DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Logging
+# Les parsers OCR loguent en DEBUG (désactivé par défaut) sur le logger "stats"
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {
+            'format': '{asctime} {levelname} {name} {message}',
+            'style': '{',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'simple',
+        },
+    },
+    'loggers': {
+        'stats': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'statMulti.settings')
 
 application = get_wsgi_application()
+
+# Serveur uniquement : warm-up OCR (voir stats.apps.start_ocr_services)
+from stats.apps import start_ocr_services  # noqa: E402
+
+start_ocr_services()
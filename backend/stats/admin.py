@@ -1,5 +1,46 @@
 from django.contrib import admin
-from .models import KpiDaily, StatsPeriod
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
 
-admin.site.register(KpiDaily)
-admin.site.register(StatsPeriod)
\ No newline at end of file
+from .image_store import store_image
+from .models import KpiDaily, StatsPeriod, OcrJob, OcrCacheEntry, DailyDelta, StoredImage, ImageAttachment
+
+
+class BackgroundImageAdmin(admin.ModelAdmin):
+    """
+    Le fichier choisi dans le formulaire n'est pas envoyé pendant la
+    sauvegarde (CloudinaryField l'enverrait de façon synchrone) : la ligne
+    est enregistrée sans image puis l'envoi passe par stats.image_store
+    """
+    image_field = None
+
+    def save_model(self, request, obj, form, change):
+        uploaded = getattr(obj, self.image_field)
+        if not isinstance(uploaded, UploadedFile):
+            return super().save_model(request, obj, form, change)
+
+        if change:
+            # Garder l'image actuelle jusqu'à la fin de l'envoi
+            setattr(obj, self.image_field, form.initial.get(self.image_field))
+        else:
+            setattr(obj, self.image_field, None)
+        with transaction.atomic():
+            super().save_model(request, obj, form, change)
+            store_image(uploaded, obj, self.image_field)
+
+
+@admin.register(KpiDaily)
+class KpiDailyAdmin(BackgroundImageAdmin):
+    image_field = 'image_kpi'
+
+
+@admin.register(StatsPeriod)
+class StatsPeriodAdmin(BackgroundImageAdmin):
+    image_field = 'image_stats'
+
+
+admin.site.register(OcrJob)
+admin.site.register(OcrCacheEntry)
+admin.site.register(DailyDelta)
+admin.site.register(StoredImage)
+admin.site.register(ImageAttachment)
@@ -1,6 +1,46 @@
+import threading
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class StatsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'stats'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+
+_started = False
+_started_lock = threading.Lock()
+
+
+def start_ocr_services():
+    """
+    Préchargement des Readers EasyOCR et des workers OCR, appelé par les
+    points d'entrée serveur (statMulti/wsgi.py, statMulti/asgi.py) : les
+    commandes manage.py / django-admin, les tests et les workers celery ne
+    chargent rien. runserver importe wsgi.py dans le processus qui sert les
+    requêtes, jamais dans le processus parent de l'autoreloader.
+    """
+    global _started
+    warm_up = getattr(settings, 'OCR_WARMUP_AT_STARTUP', False)
+    start_processes = getattr(settings, 'OCR_PROCESS_START_AT_STARTUP', False)
+    if not (warm_up or start_processes):
+        return
+    with _started_lock:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=_startup, args=(warm_up, start_processes), name='ocr-warmup', daemon=True).start()
+
+
+def _startup(warm_up, start_processes):
+    # Workers OCR forkés avant toute inférence dans ce processus
+    if start_processes:
+        from .ocr_processes import get_ocr_process_pool
+        get_ocr_process_pool().start()
+    if warm_up:
+        from .reader_pool import get_reader_pool
+        get_reader_pool().warm_up()
@@ -0,0 +1,185 @@
+# stats/async_views.py
+#
+# Vues ASGI (async def) : lectures par l'ORM async, OCR dans un pool de
+# processus borné. Une lecture n'attend jamais la fin d'un OCR en cours.
+
+import base64
+import binascii
+import json
+from datetime import date
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import HttpResponseNotAllowed, JsonResponse
+from django.utils.dateparse import parse_date
+from django.views.decorators.csrf import csrf_exempt
+
+from .models import KpiDaily
+from . import ocr_stack
+from .ocr_processes import OcrPoolSaturated, OcrPoolUnavailable, get_ocr_process_pool
+from .ocr_stack import ImageTooLarge, InvalidUpload
+from .pagination import KpiDailyCursorPagination
+from .serializers import KpiDailySerializer, stored_image_ids
+from .tracing import set_attribute, span, trace
+from .utils import alire_deltas, finalize_kpi_data
+from .views import filtrer_kpi_daily, lire_periode
+
+
+def _encode_cursor(kpi):
+    return base64.urlsafe_b64encode(json.dumps([str(kpi.date), kpi.moment]).encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        date_jour, moment = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError, TypeError):
+        return None
+    date_jour = parse_date(date_jour) if isinstance(date_jour, str) else None
+    return (date_jour, moment) if date_jour else None
+
+
+def _page_size(request):
+    try:
+        size = int(request.GET.get(KpiDailyCursorPagination.page_size_query_param, KpiDailyCursorPagination.page_size))
+    except ValueError:
+        size = KpiDailyCursorPagination.page_size
+    return max(1, min(size, KpiDailyCursorPagination.max_page_size))
+
+
+async def _liste(request):
+    kpi, fields, error = filtrer_kpi_daily(request.GET, KpiDaily.objects.order_by('-date', 'moment'))
+    if error:
+        return JsonResponse({
+            'success': False,
+            'error': error
+        }, status=400)
+
+    # Pagination par clé (date décroissante puis moment) : même ordre que la
+    # liste synchrone, sans OFFSET
+    cursor = request.GET.get('cursor')
+    if cursor:
+        position = _decode_cursor(cursor)
+        if position is None:
+            return JsonResponse({
+                'success': False,
+                'error': 'Curseur invalide'
+            }, status=400)
+        date_jour, moment = position
+        kpi = kpi.filter(Q(date__lt=date_jour) | Q(date=date_jour, moment__gt=moment))
+
+    size = _page_size(request)
+    page = [row async for row in kpi[:size + 1].aiterator()]
+
+    next_url = None
+    if len(page) > size:
+        page = page[:size]
+        params = request.GET.copy()
+        params['cursor'] = _encode_cursor(page[-1])
+        next_url = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+    context = {'request': request}
+    if not fields or 'image_kpi_derivatives' in fields:
+        # Lu ici : le sérialiseur ne peut pas interroger l'ORM en contexte async
+        context['_stored_image_ids'] = {object_id async for object_id in stored_image_ids(page)}
+    serializer = KpiDailySerializer(page, many=True, fields=fields, context=context)
+    return JsonResponse({
+        'next': next_url,
+        'previous': None,
+        'results': serializer.data
+    })
+
+
+async def _upload(request):
+    uploaded_image = request.FILES.get('image_kpi')
+    if not uploaded_image:
+        return JsonResponse({
+            'success': False,
+            'error': 'Aucune image téléchargée'
+        }, status=400)
+
+    try:
+        with span('upload_check'):
+            ocr_stack.check_upload_limits(uploaded_image)
+    except ImageTooLarge as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=413)
+    except InvalidUpload as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=400)
+
+    date_jour = request.POST.get('date', str(date.today()))
+    moment = request.POST.get('moment', 'debut')
+    note = request.POST.get('note')
+
+    pool = get_ocr_process_pool()
+    try:
+        with span('ocr'):
+            result = await pool.run(uploaded_image.read(), timeout=getattr(settings, 'OCR_PROCESS_TIMEOUT', 60))
+    except OcrPoolSaturated as e:
+        response = JsonResponse({
+            'success': False,
+            'error': f'OCR saturé, réessayez plus tard ({e})'
+        }, status=429)
+        response['Retry-After'] = str(getattr(settings, 'OCR_PROCESS_RETRY_AFTER', 5))
+        return response
+    except OcrPoolUnavailable as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        }, status=503)
+
+    if not result['success']:
+        return JsonResponse({
+            'success': False,
+            'error': result['error']
+        }, status=500)
+    set_attribute('detections', result.get('detections_count', 0))
+
+    kpi_data, missing_fields = finalize_kpi_data(result['data'], date_jour, moment, note)
+    if missing_fields:
+        return JsonResponse({
+            'success': False,
+            'error': 'Données incomplètes',
+            'extracted_data': kpi_data,
+            'missing_fields': missing_fields,
+            'detections': result.get('detections_count', 0),
+            'retried_zones': result.get('retried_zones', []),
+            'suggestion': 'Vérifiez la qualité/résolution de l\'image'
+        }, status=400)
+
+    return JsonResponse({
+        'data': kpi_data
+    })
+
+
+@csrf_exempt
+async def kpi_daily(request):
+    """
+    GET : liste paginée (mêmes filtres que /api/kpi-daily)
+    POST : extraction OCR d'une capture `image_kpi` ; 429 si le pool OCR est
+    saturé, 503 s'il est indisponible
+    """
+    if request.method == 'GET':
+        return await _liste(request)
+    if request.method == 'POST':
+        with trace('kpi_daily.apost') as current:
+            response = await _upload(request)
+            current.attributes['status'] = response.status_code
+        return response
+    return HttpResponseNotAllowed(['GET', 'POST'])
+
+
+async def deltas(request):
+    # Deltas journaliers sur une période : ?start=AAAA-MM-JJ&end=AAAA-MM-JJ
+    date_debut, date_fin, error = lire_periode(request, 'DELTAS_MAX_DAYS', 366)
+    if error:
+        return error
+
+    return JsonResponse({
+        'status': 'success',
+        'data': await alire_deltas(date_debut, date_fin)
+    })
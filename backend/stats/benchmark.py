@@ -0,0 +1,231 @@
+# stats/benchmark.py
+
+import io
+import json
+import platform
+import random
+import resource
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from statistics import mean, median
+
+from django.conf import settings
+from PIL import Image, ImageDraw, ImageFont
+
+from .ocr_backends import backend_stats, get_backends, read_zones, retry_missing_zones
+from .preprocessing import prepare_image
+from .reader_pool import get_reader_pool
+from .utils import REQUIRED_KPI_FIELDS, parse_by_geographic_zones
+
+
+REFERENCE_IMAGE = Path(settings.BASE_DIR) / 'kpi.png'
+
+GREY = (47, 49, 51)
+RED = (234, 69, 81)
+GREEN = (0, 159, 131)
+ORANGE = (255, 150, 50)
+LABEL = (110, 112, 115)
+WHITE = (255, 255, 255)
+
+# Badges de kpi.png (repère 943 px) : trois lignes par carte
+ROWS_TOP = [306, 357, 407]
+ROWS_BOTTOM = [638, 689, 739]
+BADGE_HEIGHT = 37
+
+# (champ, x0, x1, lignes, valeurs par défaut des badges, gabarit du texte)
+COLUMNS = [
+    ('msg_sent', 41, 214, ROWS_TOP, ['2520 Sent', '2250 Sent', '0 Sent'], '{} Sent'),
+    ('msg_rr', 241, 418, ROWS_TOP, ['90% RR', '78% RR', '0% RR'], '{}% RR'),
+    ('gift_sent', 527, 704, ROWS_TOP, ['540 Sent', '125 Sent', '0 Sent'], '{} Sent'),
+    ('gift_rr', 731, 905, ROWS_TOP, ['90% RR', '78% RR', '0% RR'], '{}% RR'),
+    ('photo_sent', 41, 214, ROWS_BOTTOM, ['540 Sent', '125 Sent', '0 Sent'], '{} Sent'),
+    ('photo_rr', 241, 418, ROWS_BOTTOM, ['90% RR', '78% RR', '0% RR'], '{}% RR'),
+    ('speed_rr', 527, 905, ROWS_BOTTOM, ['65% Messages answered within 1 minute',
+                                         '50% Messages answered within 1 minute',
+                                         '0% Messages answered within 1 minute'],
+     '{}% Messages answered within 1 minute'),
+]
+
+
+def _draw_badge(draw, font, box, text, fill, text_fill):
+    draw.rounded_rectangle(box, radius=6, fill=fill)
+    draw.text((box[0] + 13, (box[1] + box[3]) / 2), text, fill=text_fill, font=font, anchor='lm')
+
+
+def generate_screenshot(seed, scale=1.0):
+    """
+    Capture synthétique à partir de kpi.png : valeurs et position du badge
+    actif tirées au hasard, puis mise à l'échelle.
+    Retourne (bytes PNG, valeurs attendues)
+    """
+    rng = random.Random(seed)
+    image = Image.open(REFERENCE_IMAGE).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=14)
+
+    expected = {}
+    for field, x0, x1, rows, defaults, template in COLUMNS:
+        if field.endswith('_sent'):
+            value = rng.randint(1, 999)
+        else:
+            value = round(rng.uniform(1, 99), 1)
+        expected[field] = value
+
+        active = rng.randrange(len(rows))
+        for index, top in enumerate(rows):
+            box = (x0, top, x1, top + BADGE_HEIGHT)
+            if index == active:
+                fill = ORANGE if field == 'speed_rr' else (RED if field.endswith('_sent') else GREEN)
+                _draw_badge(draw, font, box, template.format(value), fill, WHITE)
+            else:
+                _draw_badge(draw, font, box, defaults[index], GREY, LABEL)
+
+    if scale != 1:
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.Resampling.LANCZOS)
+
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue(), expected
+
+
+def _accuracy(kpi_data, expected):
+    correct = 0
+    for field in REQUIRED_KPI_FIELDS:
+        try:
+            correct += abs(float(kpi_data.get(field)) - float(expected[field])) < 0.05
+        except (TypeError, ValueError):
+            pass
+    return correct / len(REQUIRED_KPI_FIELDS)
+
+
+def _backend_seconds():
+    return {name: data['seconds_total'] for name, data in backend_stats().items()}
+
+
+def run_staged(image_bytes):
+    """
+    Pipeline OCR de production (read_zones puis retry_missing_zones) découpé
+    en étapes chronométrées : decode, read, retry, parse, et le temps passé
+    dans chaque moteur OCR_BACKENDS (ocr_<moteur>, relectures comprises).
+    Durées par moteur lues dans backend_stats : justes en exécution séquentielle
+    Retourne (kpi_data, durées en secondes, nombre de détections)
+    """
+    timings = {'decode': 0.0, 'read': 0.0, 'retry': 0.0, 'parse': 0.0}
+    timings.update({f'ocr_{backend.name}': 0.0 for backend in get_backends()})
+    before = _backend_seconds()
+
+    start = time.perf_counter()
+    crops = prepare_image(io.BytesIO(image_bytes))
+    timings['decode'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = read_zones(crops)
+    timings['read'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results, _ = retry_missing_zones(crops, results)
+    timings['retry'] = time.perf_counter() - start
+
+    for name, seconds in _backend_seconds().items():
+        timings[f'ocr_{name}'] = seconds - before.get(name, 0.0)
+
+    start = time.perf_counter()
+    kpi_data = parse_by_geographic_zones(results)
+    timings['parse'] = time.perf_counter() - start
+    return kpi_data, timings, len(results)
+
+
+def _summary(values):
+    values = sorted(values)
+    if not values:
+        return {}
+    return {
+        'mean': mean(values),
+        'median': median(values),
+        'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+        'min': values[0],
+        'max': values[-1],
+    }
+
+
+def run_benchmark(images=5, scales=(1.0,), concurrency=(1, 2), seed=0, trace_memory=False):
+    """
+    Lance le benchmark complet et retourne un dict sérialisable en JSON
+    trace_memory active tracemalloc (pic mémoire Python, mais timings ralentis)
+    """
+    if trace_memory:
+        tracemalloc.start()
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'images': images,
+            'scales': list(scales),
+            'concurrency': list(concurrency),
+            'seed': seed,
+            'trace_memory': trace_memory,
+            'roi_enabled': getattr(settings, 'OCR_ROI_ENABLED', True),
+        },
+    }
+
+    report['meta']['backends'] = [backend.name for backend in get_backends()]
+
+    # Lecteur à froid : chargement des modèles du pool utilisé par EasyOcrBackend
+    pool = get_reader_pool()
+    pool.resize(max(concurrency))
+    start = time.perf_counter()
+    pool.warm_up()
+    report['cold_start_seconds'] = time.perf_counter() - start
+
+    samples = [
+        (scale, *generate_screenshot(seed + index, scale))
+        for scale in scales
+        for index in range(images)
+    ]
+
+    # Latence à chaud, étape par étape
+    per_scale = {}
+    run_staged(samples[0][1])  # premier passage non compté
+    for scale, image_bytes, expected in samples:
+        start = time.perf_counter()
+        kpi_data, timings, detections = run_staged(image_bytes)
+        total = time.perf_counter() - start
+        entry = per_scale.setdefault(str(scale), {'total': [], 'accuracy': [], 'detections': []})
+        entry['total'].append(total)
+        entry['accuracy'].append(_accuracy(kpi_data, expected))
+        entry['detections'].append(detections)
+        for stage, value in timings.items():
+            entry.setdefault(stage, []).append(value)
+
+    report['warm'] = {
+        scale: {name: _summary(values) for name, values in entry.items()}
+        for scale, entry in per_scale.items()
+    }
+
+    # Débit selon le nombre de requêtes simultanées
+    def _one(image_bytes):
+        run_staged(image_bytes)
+
+    report['throughput'] = {}
+    for workers in concurrency:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(_one, [image_bytes for _, image_bytes, _ in samples]))
+        elapsed = time.perf_counter() - start
+        report['throughput'][str(workers)] = {
+            'seconds': elapsed,
+            'images_per_second': len(samples) / elapsed if elapsed else None,
+        }
+
+    report['memory'] = {'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    if trace_memory:
+        report['memory']['python_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    report['reader_pool'] = pool.stats()
+    return report
+
+
+def save_report(report, path):
+    Path(path).write_text(json.dumps(report, indent=2, default=str))
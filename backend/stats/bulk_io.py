@@ -0,0 +1,322 @@
+# stats/bulk_io.py
+
+import csv
+import io
+import json
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.dateparse import parse_date
+
+from .http_cache import invalider_reponses
+from .models import KpiDaily, StatsPeriod
+from .utils import rafraichir_deltas
+
+
+FORMATS = ('csv', 'jsonl')
+CONFLICT_MODES = ('skip', 'update', 'error')
+
+# Colonnes importées / exportées (même ordre), par type de données
+KPI_COLUMNS = ['date', 'moment', 'msg_sent', 'msg_rr', 'photos_sent', 'photos_rr',
+               'gifts_sent', 'gifts_rr', 'speed_rr', 'note']
+STATS_COLUMNS = ['date', 'kpi_moment', 'moment', 'period_type', 'responses',
+                 'kpi_effect', 'extra_benefits', 'penalites']
+
+
+class ImportFormatError(ValueError):
+    """Fichier d'import illisible (format, en-tête)"""
+
+
+# === LECTURE ===
+
+def iter_records(stream, fmt):
+    """
+    Lit un fichier binaire ligne par ligne : (numéro de ligne, dict)
+    CSV avec en-tête ou JSONL (un objet JSON par ligne)
+    """
+    if fmt not in FORMATS:
+        raise ImportFormatError(f"Format inconnu : {fmt} (attendu : {', '.join(FORMATS)})")
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        yield from (_iter_csv(text) if fmt == 'csv' else _iter_jsonl(text))
+    except UnicodeDecodeError as e:
+        raise ImportFormatError(f"Fichier non UTF-8 (octet {e.object[e.start:e.start + 1]!r} illisible)")
+
+
+def _iter_csv(text):
+    rows = csv.DictReader(text)
+    try:
+        if not rows.fieldnames:
+            raise ImportFormatError("Fichier CSV vide ou sans en-tête")
+        for row in rows:
+            yield rows.line_num, row
+    except csv.Error as e:
+        raise ImportFormatError(f"Ligne {rows.line_num} : CSV invalide ({e})")
+
+
+def _iter_jsonl(text):
+    for line_num, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ImportFormatError(f"Ligne {line_num} : JSON invalide ({e.msg})")
+        if not isinstance(record, dict):
+            raise ImportFormatError(f"Ligne {line_num} : objet JSON attendu")
+        yield line_num, record
+
+
+def _clean(record, columns):
+    # Valeurs vides ignorées : les valeurs par défaut du modèle s'appliquent
+    return {
+        key: value for key, value in record.items()
+        if key in columns and value is not None and value != ''
+    }
+
+
+# === IMPORT ===
+
+class Importer:
+    """
+    Import par morceaux : chaque morceau est validé (full_clean), puis écrit
+    avec un seul bulk_create. Les doublons sur la clé unique sont ignorés
+    (`skip`), mis à jour (`update`) ou signalés comme erreurs (`error`).
+    """
+    model = None
+    columns = None
+    unique_fields = None
+
+    def __init__(self, on_conflict='skip', chunk_size=1000, max_errors=100, progress=None):
+        if on_conflict not in CONFLICT_MODES:
+            raise ImportFormatError(f"on_conflict inconnu : {on_conflict} (attendu : {', '.join(CONFLICT_MODES)})")
+        self.on_conflict = on_conflict
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.progress = progress
+        self.report = {'rows': 0, 'created': 0, 'updated': 0, 'skipped': 0, 'invalid': 0, 'chunks': 0, 'errors': []}
+        self.dates = set()
+
+    def _error(self, line_num, message):
+        self.report['invalid'] += 1
+        if len(self.report['errors']) < self.max_errors:
+            self.report['errors'].append({'line': line_num, 'error': message})
+
+    def build(self, data, context):
+        raise NotImplementedError
+
+    def key(self, instance):
+        return tuple(getattr(instance, field) for field in self.unique_fields)
+
+    def existing_keys(self, instances):
+        raise NotImplementedError
+
+    def context(self, chunk):
+        return None
+
+    def run(self, records):
+        """
+        records : itérable de (numéro de ligne, dict). Retourne le rapport
+        """
+        records = iter(records)
+        try:
+            while True:
+                chunk = list(islice(records, self.chunk_size))
+                if not chunk:
+                    break
+                self._import_chunk(chunk)
+                self.report['chunks'] += 1
+                if self.progress:
+                    self.progress(self.report)
+        except ImportFormatError as e:
+            # Fichier illisible en cours de route : les morceaux précédents
+            # sont déjà écrits, le rapport partiel accompagne l'erreur
+            e.report = self.report
+            raise
+        finally:
+            # bulk_create n'envoie pas de signal : deltas et réponses en cache ici,
+            # y compris pour les morceaux écrits avant une erreur
+            if self.dates:
+                rafraichir_deltas(self.dates)
+                invalider_reponses()
+        return self.report
+
+    def _import_chunk(self, chunk):
+        self.report['rows'] += len(chunk)
+        context = self.context(chunk)
+
+        instances = {}
+        for line_num, record in chunk:
+            data = _clean(record, self.columns)
+            try:
+                instance = self.build(data, context)
+                instance.full_clean(exclude=['image_kpi', 'image_stats'], validate_unique=False)
+            except ValidationError as e:
+                self._error(line_num, e.message_dict if hasattr(e, 'error_dict') else e.messages)
+                continue
+            key = self.key(instance)
+            if key in instances:
+                # Doublon dans le fichier : la dernière ligne l'emporte
+                self.report['skipped'] += 1
+            instances[key] = (line_num, instance)
+
+        existing = self.existing_keys([instance for _, instance in instances.values()])
+        to_write = []
+        for key, (line_num, instance) in instances.items():
+            if key not in existing:
+                self.report['created'] += 1
+            elif self.on_conflict == 'update':
+                self.report['updated'] += 1
+            elif self.on_conflict == 'error':
+                self._error(line_num, 'Déjà enregistré : ' + ', '.join(str(part) for part in key))
+                continue
+            else:
+                self.report['skipped'] += 1
+                continue
+            to_write.append(instance)
+
+        if not to_write:
+            return
+        update_fields = [field for field in self.write_fields if field not in self.unique_fields]
+        with transaction.atomic():
+            if self.on_conflict == 'update':
+                self.model.objects.bulk_create(
+                    to_write, update_conflicts=True,
+                    unique_fields=self.unique_fields, update_fields=update_fields,
+                )
+            else:
+                # Une ligne insérée entre-temps par un autre écrivain est ignorée
+                self.model.objects.bulk_create(to_write, ignore_conflicts=True)
+        self.dates.update(self.date_of(instance) for instance in to_write)
+
+
+class KpiDailyImporter(Importer):
+    model = KpiDaily
+    columns = KPI_COLUMNS
+    unique_fields = ['date', 'moment']
+    write_fields = KPI_COLUMNS + ['updated_at']
+
+    def build(self, data, context):
+        return KpiDaily(**data)
+
+    def existing_keys(self, instances):
+        dates = {instance.date for instance in instances}
+        return set(KpiDaily.objects.filter(date__in=dates).values_list('date', 'moment'))
+
+    def date_of(self, instance):
+        return instance.date
+
+
+class StatsPeriodImporter(Importer):
+    """
+    Chaque ligne désigne son KpiDaily par `date` et `kpi_moment` (par défaut
+    son propre `moment`) ; le KpiDaily doit déjà exister
+    """
+    model = StatsPeriod
+    columns = STATS_COLUMNS
+    unique_fields = ['kpi_daily', 'moment', 'period_type']
+    write_fields = ['kpi_daily', 'moment', 'period_type', 'responses', 'kpi_effect',
+                    'extra_benefits', 'penalites', 'updated_at']
+
+    def context(self, chunk):
+        # KpiDaily des dates du morceau : une seule requête
+        dates = {record.get('date') for _, record in chunk if record.get('date')}
+        kpis = KpiDaily.objects.filter(date__in=[d for d in dates if _is_iso_date(d)]).only('pk', 'date', 'moment')
+        return {(str(kpi.date), kpi.moment): kpi for kpi in kpis}
+
+    def build(self, data, kpis):
+        date_jour = data.pop('date', None)
+        kpi_moment = data.pop('kpi_moment', None) or data.get('moment')
+        kpi = kpis.get((str(date_jour), kpi_moment))
+        if kpi is None:
+            raise ValidationError({'date': [f"Aucun KPI pour {date_jour} ({kpi_moment})"]})
+        return StatsPeriod(kpi_daily=kpi, **data)
+
+    def key(self, instance):
+        return (instance.kpi_daily_id, instance.moment, instance.period_type)
+
+    def existing_keys(self, instances):
+        kpi_ids = {instance.kpi_daily_id for instance in instances}
+        return set(
+            StatsPeriod.objects.filter(kpi_daily_id__in=kpi_ids).values_list('kpi_daily_id', 'moment', 'period_type')
+        )
+
+    def date_of(self, instance):
+        return instance.kpi_daily.date
+
+
+def _is_iso_date(value):
+    try:
+        return parse_date(str(value)) is not None
+    except ValueError:
+        return False
+
+
+IMPORTERS = {'kpi': KpiDailyImporter, 'stats': StatsPeriodImporter}
+
+
+def import_history(stream, fmt, kind='kpi', **options):
+    """
+    Importe un fichier CSV/JSONL de KpiDaily (`kind='kpi'`) ou de
+    StatsPeriod (`kind='stats'`). Retourne le rapport d'import
+    """
+    if kind not in IMPORTERS:
+        raise ImportFormatError(f"Type inconnu : {kind} (attendu : {', '.join(IMPORTERS)})")
+    return IMPORTERS[kind](**options).run(iter_records(stream, fmt))
+
+
+# === EXPORT ===
+
+def export_rows(kind='kpi', date_from=None, date_to=None, chunk_size=2000):
+    """
+    Lignes à exporter (listes de valeurs, en-tête compris), lues par
+    morceaux avec .iterator() : mémoire constante quelle que soit la période
+    """
+    if kind == 'kpi':
+        columns = KPI_COLUMNS
+        rows = KpiDaily.objects.order_by('date', 'moment').values_list(*columns)
+        date_field = 'date'
+    elif kind == 'stats':
+        columns = STATS_COLUMNS
+        rows = StatsPeriod.objects.order_by('kpi_daily__date', 'kpi_daily__moment', 'moment', 'period_type').values_list(
+            'kpi_daily__date', 'kpi_daily__moment', *columns[2:]
+        )
+        date_field = 'kpi_daily__date'
+    else:
+        raise ImportFormatError(f"Type inconnu : {kind} (attendu : {', '.join(IMPORTERS)})")
+
+    if date_from:
+        rows = rows.filter(**{f'{date_field}__gte': date_from})
+    if date_to:
+        rows = rows.filter(**{f'{date_field}__lte': date_to})
+
+    yield columns
+    yield from rows.iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+    """Pseudo-fichier pour csv.writer : retourne la ligne au lieu de l'écrire"""
+
+    def write(self, value):
+        return value
+
+
+def export_lines(fmt, **options):
+    """
+    Fichier d'export ligne par ligne (str), pour StreamingHttpResponse ou un fichier
+    """
+    if fmt not in FORMATS:
+        raise ImportFormatError(f"Format inconnu : {fmt} (attendu : {', '.join(FORMATS)})")
+    rows = export_rows(**options)
+    columns = next(rows)
+
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow(row)
+        return
+
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), default=str) + '\n'
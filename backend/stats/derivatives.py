@@ -0,0 +1,104 @@
+# stats/derivatives.py
+
+import io
+import threading
+
+from django.conf import settings
+
+from . import ocr_stack
+from .image_store import get_backend
+from .logs import get_logger
+from .models import StoredImage
+
+
+logger = get_logger(__name__)
+
+DEFAULT_DERIVATIVES = {
+    'thumb': {'width': 240, 'format': 'WEBP', 'quality': 70},
+    'thumb_jpeg': {'width': 240, 'format': 'JPEG', 'quality': 75},
+    'preview': {'width': 480, 'format': 'WEBP', 'quality': 80},
+}
+
+CONTENT_TYPES = {'WEBP': 'image/webp', 'JPEG': 'image/jpeg', 'PNG': 'image/png'}
+
+# Verrous répartis par empreinte : nombre fixe, la mémoire ne grandit pas
+# avec le nombre d'images traitées (deux empreintes peuvent partager un verrou)
+_locks = [threading.Lock() for _ in range(64)]
+
+
+def get_derivative_specs():
+    """
+    Dérivés configurés : IMAGE_DERIVATIVES dans les settings, sinon DEFAULT_DERIVATIVES
+    """
+    return getattr(settings, 'IMAGE_DERIVATIVES', None) or DEFAULT_DERIVATIVES
+
+
+def derivative_key(name, spec):
+    """
+    Clé de stockage : change avec la taille, le format ou la qualité, un
+    dérivé produit avec une ancienne configuration n'est donc pas réutilisé
+    """
+    return f"{name}_{spec['width']}_q{spec['quality']}_{spec['format'].lower()}"
+
+
+def render_derivative(data, spec):
+    """
+    Réduit une capture à `width` px de large (proportions gardées, jamais
+    agrandie) et l'encode au format demandé. Retourne les octets
+    """
+    Image = ocr_stack.Image
+    with Image.open(io.BytesIO(data)) as img:
+        # Décodage JPEG directement à une résolution réduite
+        img.draft('RGB', (spec['width'], spec['width'] * 4))
+        img = img.convert('RGB')
+        img.thumbnail((spec['width'], img.height), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        options = {'quality': spec['quality']}
+        if spec['format'] == 'JPEG':
+            options.update(optimize=True, progressive=True)
+        elif spec['format'] == 'WEBP':
+            options['method'] = 4
+        img.save(buffer, spec['format'], **options)
+    return buffer.getvalue()
+
+
+def _lock_for(digest):
+    return _locks[hash(digest) % len(_locks)]
+
+
+def generate_derivatives(image, data=None, names=None):
+    """
+    Produit et stocke (à côté de l'original) les dérivés manquants d'une image
+    envoyée. `data` évite de relire l'original quand il est déjà en mémoire.
+    Retourne {nom: référence}
+    """
+    specs = get_derivative_specs()
+    names = list(names or specs)
+    backend = get_backend()
+
+    with _lock_for(image.digest):
+        # Relu sous verrou : un autre thread a pu produire le dérivé entre temps
+        derivatives = dict(StoredImage.objects.filter(pk=image.pk).values_list('derivatives', flat=True).first() or {})
+        missing = [name for name in names if derivative_key(name, specs[name]) not in derivatives]
+        if missing:
+            if data is None:
+                data = backend.read(image.reference)
+            for name in missing:
+                key = derivative_key(name, specs[name])
+                derivatives[key] = backend.upload(render_derivative(data, specs[name]), f"{image.digest}_{key}")
+                logger.debug("dérivé %s produit pour %s", key, image.digest[:12])
+            StoredImage.objects.filter(pk=image.pk).update(derivatives=derivatives)
+        image.derivatives = derivatives
+
+    return {name: derivatives[derivative_key(name, specs[name])] for name in names}
+
+
+def get_derivative(image, name):
+    """
+    Référence du dérivé `name`, produit au premier appel puis réutilisé
+    """
+    spec = get_derivative_specs()[name]
+    reference = image.derivatives.get(derivative_key(name, spec))
+    if reference:
+        return reference
+    return generate_derivatives(image, names=[name])[name]
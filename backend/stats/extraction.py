@@ -0,0 +1,137 @@
+# stats/extraction.py
+
+import re
+
+from .layout import get_layout
+from .logs import get_logger
+
+logger = get_logger(__name__)
+
+
+# Un nombre suivi (éventuellement) de % puis d'un libellé :
+# "385 Sent", "77.1% RR", "7796RR" (% lu "96" par l'OCR), "59.5% Messages"
+TOKEN_PATTERN = re.compile(
+    r'(?P<number>\d+(?:\.\d+)?)\s*(?P<percent>%)?\s*(?P<kind>Sent|RR|Messages)\b',
+    re.IGNORECASE,
+)
+
+KINDS = {'sent': 'Sent', 'rr': 'RR', 'messages': 'Messages'}
+
+
+def _number(match):
+    """
+    Valeur numérique d'un jeton. Sans '%' explicite, un pourcentage se
+    termine souvent par "96" (le signe % mal lu) : ce suffixe est retiré
+    """
+    text = match.group('number')
+    kind = KINDS[match.group('kind').lower()]
+    if kind == 'Sent':
+        return int(float(text))
+    if not match.group('percent') and text.endswith('96') and len(text) > 2:
+        text = text[:-2]
+    return float(text) if text else None
+
+
+def reading_order(zone_items, row_gap=15):
+    """
+    Trie les détections ligne par ligne (écart en y < row_gap), puis de
+    gauche à droite : un nombre précède ainsi son libellé
+    """
+    rows = []
+    for item in sorted(zone_items, key=lambda item: item['y']):
+        if rows and item['y'] - rows[-1][0]['y'] < row_gap:
+            rows[-1].append(item)
+        else:
+            rows.append([item])
+    return [item for row in rows for item in sorted(row, key=lambda item: item['x'])]
+
+
+def scan_zone(zone_items):
+    """
+    Parcourt une zone une seule fois et retourne ses jetons :
+    [{'kind', 'value', 'x', 'y', 'confidence'}, ...]
+    Les textes sont concaténés dans l'ordre de lecture (un nombre et son
+    libellé peuvent être deux détections) ; chaque jeton reprend la position
+    de la détection où il commence
+    """
+    zone_items = reading_order(zone_items)
+    parts = []
+    starts = []
+    offset = 0
+    for item in zone_items:
+        starts.append(offset)
+        parts.append(item['text'])
+        offset += len(item['text']) + 1
+    all_text = ' '.join(parts)
+
+    tokens = []
+    owner = 0
+    for match in TOKEN_PATTERN.finditer(all_text):
+        while owner + 1 < len(starts) and starts[owner + 1] <= match.start():
+            owner += 1
+        value = _number(match)
+        if value is None:
+            continue
+        item = zone_items[owner]
+        tokens.append({
+            'kind': KINDS[match.group('kind').lower()],
+            'value': value,
+            'x': item['x'],
+            'y': item['y'],
+            'confidence': item['confidence'],
+        })
+    logger.debug("jetons : %s", tokens)
+    return tokens
+
+
+def _is_tier(token, tiers, tolerance):
+    return any(
+        token['value'] == value and abs(token['y'] - row_y) <= tolerance
+        for value, row_y in tiers
+    )
+
+
+def select_value(tokens, kind, tiers, default, tolerance):
+    """
+    Choisit la valeur réelle parmi les jetons d'un type : un jeton égal au
+    palier de sa ligne est un libellé gris ; le badge coloré est le jeton
+    restant (le plus confiant si l'OCR en lit plusieurs). Si seuls des
+    paliers sont lus, la valeur réelle est égale à l'un d'eux : `default`
+    """
+    candidates = [token for token in tokens if token['kind'] == kind]
+    if not candidates:
+        return None
+    values = [token for token in candidates if not _is_tier(token, tiers, tolerance)]
+    if not values:
+        logger.debug("%s : seuls les paliers sont lus, valeur par défaut %s", kind, default)
+        return default
+    return max(values, key=lambda token: token['confidence'])['value']
+
+
+def extract_kpis(zones, layout=None):
+    """
+    Extrait les KPIs de détections regroupées par zone ({zone: [items]})
+    """
+    layout = layout or get_layout()
+    tolerance = layout.get('tier_tolerance', 20)
+    defaults = layout.get('defaults', {})
+
+    kpi_data = {}
+    for zone in layout['zones']:
+        fields = zone.get('fields')
+        if not fields:
+            continue
+        tokens = scan_zone(zones.get(zone['name'], []))
+        for kind, field in fields.items():
+            value = select_value(tokens, kind, zone.get('tiers', {}).get(kind, []), defaults.get(kind), tolerance)
+            if value is not None:
+                kpi_data[field] = value
+    return kpi_data
+
+
+def extract_kpis_batch(zones_list, layout=None):
+    """
+    Même chose pour une liste d'images (une entrée par image)
+    """
+    layout = layout or get_layout()
+    return [extract_kpis(zones, layout) for zones in zones_list]
@@ -0,0 +1,133 @@
+# stats/http_cache.py
+
+import hashlib
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.utils.cache import get_cache_key, learn_cache_key, patch_vary_headers
+from django.views.decorators.http import condition
+
+
+_counters = {'hits': 0, 'misses': 0, 'not_modified': 0}
+_counters_lock = threading.Lock()
+
+GENERATION_KEY = 'kpi-response:generation'
+
+
+def _count(name):
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def invalider_reponses():
+    """
+    Invalide toutes les réponses KPI en cache (appelé à chaque écriture)
+    """
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+
+
+def _validators(request, models):
+    """
+    (etag, last_modified) calculés à partir de max(updated_at) et du nombre
+    de lignes de chaque modèle : une suppression change aussi l'ETag.
+    Mémorisés sur la requête, calculés une seule fois.
+    """
+    cached = getattr(request, '_kpi_validators', None)
+    if cached is not None:
+        return cached
+
+    last_modified = None
+    parts = []
+    for model in models:
+        agg = model.objects.aggregate(last=Max('updated_at'), count=Count('pk'))
+        parts.append(f"{model._meta.label}:{agg['count']}:{agg['last'].isoformat() if agg['last'] else ''}")
+        if agg['last'] and (last_modified is None or agg['last'] > last_modified):
+            last_modified = agg['last']
+
+    etag = hashlib.sha1('|'.join(parts).encode()).hexdigest()
+    request._kpi_validators = (etag, last_modified)
+    return request._kpi_validators
+
+
+def kpi_http_cache(*models):
+    """
+    Décorateur de vue : pour GET/HEAD, réponses conditionnelles (ETag /
+    Last-Modified, 304) et cache serveur de la réponse rendue, invalidé à
+    chaque écriture KPI. Sur une APIView, décorer `dispatch` (la réponse
+    DRF n'est rendable qu'après finalize_response)
+    """
+    def decorator(view):
+        def etag_func(request, *args, **kwargs):
+            return _validators(request, models)[0]
+
+        def last_modified_func(request, *args, **kwargs):
+            return _validators(request, models)[1]
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            etag, _ = _validators(request, models)
+            generation = cache.get(GENERATION_KEY, 0)
+            # Clé à la manière du cache de Django : URL + valeurs des en-têtes
+            # listés dans le Vary de la réponse (Accept, Cookie...), apprises
+            # au premier rendu ; entrées (contenu, en-têtes)
+            key_prefix = f'kpi-response:{generation}:{etag}'
+            timeout = getattr(settings, 'KPI_RESPONSE_CACHE_TTL', 300)
+
+            key = get_cache_key(request, key_prefix, 'GET', cache)
+            cached = cache.get(key) if key else None
+            if cached is not None:
+                _count('hits')
+                content, headers = cached
+                return HttpResponse(content, headers=headers)
+
+            _count('misses')
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200 or request.method != 'GET':
+                return response
+            if hasattr(response, 'render'):
+                response.render()  # Content-Type d'une réponse DRF fixé au rendu
+            # Seules les réponses JSON sont partagées : le rendu HTML de l'API
+            # navigable contient le jeton CSRF et l'utilisateur connecté
+            if response.get('Content-Type', '').startswith('application/json'):
+                # Lecture de la session (authentification DRF) : la réponse
+                # dépend du cookie, comme le Vary ajouté par SessionMiddleware
+                session = getattr(request, 'session', None)
+                if session is not None and session.accessed:
+                    patch_vary_headers(response, ('Cookie',))
+                # En-têtes gardés avec le contenu (Content-Type, Vary, Allow...) ;
+                # ETag / Last-Modified sont recalculés par condition()
+                headers = {
+                    name: value for name, value in response.items()
+                    if name.lower() not in ('etag', 'last-modified', 'content-length')
+                }
+                cache.set(learn_cache_key(request, response, timeout, key_prefix, cache), (response.content, headers), timeout)
+            return response
+
+        conditional = condition(etag_func=etag_func, last_modified_func=last_modified_func)(wrapper)
+
+        @wraps(view)
+        def counted(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            response = conditional(request, *args, **kwargs)
+            if response.status_code == 304:
+                _count('not_modified')
+            return response
+
+        return counted
+    return decorator
+
+
+def response_cache_stats():
+    with _counters_lock:
+        data = dict(_counters)
+    lookups = data['hits'] + data['misses']
+    data['hit_rate'] = data['hits'] / lookups if lookups else 0.0
+    return data
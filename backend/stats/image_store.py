@@ -0,0 +1,256 @@
+# stats/image_store.py
+
+import hashlib
+import io
+import os
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .http_cache import invalider_reponses
+from .logs import get_logger
+from .models import ImageAttachment, StoredImage
+from .ocr_cache import file_digest
+
+
+logger = get_logger(__name__)
+
+
+# === BACKENDS ===
+
+class CloudinaryBackend:
+    """
+    Envoi vers Cloudinary ; l'identifiant public est l'empreinte du contenu
+    (suivie du nom du dérivé pour les miniatures)
+    """
+
+    def __init__(self, folder='kpi'):
+        self.folder = folder
+
+    def upload(self, data, name):
+        from cloudinary import uploader
+
+        resource = uploader.upload_resource(
+            io.BytesIO(data),
+            public_id=name,
+            folder=self.folder,
+            overwrite=False,  # Même contenu déjà présent : pas de nouvel envoi
+            resource_type='image',
+        )
+        return resource.get_prep_value()
+
+    def url(self, reference):
+        from cloudinary.models import CloudinaryField
+
+        return CloudinaryField().parse_cloudinary_resource(reference).build_url(secure=True)
+
+    def read(self, reference):
+        with urllib.request.urlopen(self.url(reference), timeout=30) as response:
+            return response.read()
+
+
+class LocalBackend:
+    """
+    Remplaçant hors ligne (tests, développement) : fichiers écrits sous `root`,
+    référence au même format qu'un CloudinaryField ("image/local/<empreinte>")
+    """
+
+    def __init__(self, root=None):
+        self.root = Path(root or Path(settings.BASE_DIR) / 'media' / 'images')
+
+    def path(self, name):
+        return self.root / name[:2] / name
+
+    def upload(self, data, name):
+        path = self.path(name)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + '.tmp')
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        return f"image/local/{name}"
+
+    def url(self, reference):
+        return None  # Servi par l'application (voir stats.views.kpi_image)
+
+    def read(self, reference):
+        return self.path(reference.rsplit('/', 1)[-1]).read_bytes()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Backend de IMAGE_STORE_BACKEND, construit avec IMAGE_STORE_OPTIONS
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend_class = import_string(getattr(settings, 'IMAGE_STORE_BACKEND', 'stats.image_store.CloudinaryBackend'))
+                _backend = backend_class(**getattr(settings, 'IMAGE_STORE_OPTIONS', {}))
+    return _backend
+
+
+# === ENVOI EN ARRIÈRE-PLAN ===
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Pool de threads local au processus qui envoie les images
+    """
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_UPLOAD_WORKERS', 2),
+                thread_name_prefix='image-upload',
+            )
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def _read(image_file):
+    if isinstance(image_file, (bytes, bytearray)):
+        return bytes(image_file), hashlib.sha256(image_file).hexdigest()
+    digest = file_digest(image_file)
+    data = image_file.read()
+    image_file.seek(0)
+    return data, digest
+
+
+def store_image(image_file, instance, field):
+    """
+    Rattache une capture au champ `field` de `instance` sans attendre l'envoi :
+    - contenu déjà envoyé : la référence est écrite tout de suite
+    - sinon l'image est mise en file (une seule fois par empreinte) et le
+      champ est rempli par le worker à la fin de l'envoi
+    Retourne la StoredImage
+    """
+    data, digest = _read(image_file)
+    image, _ = StoredImage.objects.get_or_create(
+        digest=digest,
+        defaults={'image_data': data, 'size': len(data)},
+    )
+    attachment, _ = ImageAttachment.objects.update_or_create(
+        model=instance._meta.label_lower,
+        object_id=str(instance.pk),
+        field=field,
+        defaults={'image': image, 'filled_at': None},
+    )
+    transaction.on_commit(lambda: _after_attach(image.pk, attachment.pk))
+    return image
+
+
+def _after_attach(image_id, attachment_id):
+    # Relu après commit : soit le worker voit le rattachement, soit on voit
+    # l'image déjà envoyée, aucun champ ne reste vide
+    image = StoredImage.objects.only('status', 'reference', 'digest').get(pk=image_id)
+    if image.status == StoredImage.STATUS_DONE:
+        logger.debug("image %s déjà envoyée, réutilisée", image.digest[:12])
+        fill_references(image, ImageAttachment.objects.filter(pk=attachment_id))
+        return
+    if image.status == StoredImage.STATUS_FAILED:
+        StoredImage.objects.filter(pk=image_id, status=StoredImage.STATUS_FAILED).update(status=StoredImage.STATUS_PENDING, error='')
+    get_executor().submit(upload_image, image_id)
+
+
+def upload_image(image_id):
+    """
+    Envoie une image en attente puis remplit les champs qui l'attendent.
+    Le passage pending -> uploading se fait par un UPDATE conditionnel :
+    une image n'est envoyée qu'une fois même si plusieurs workers la voient
+    """
+    close_old_connections()
+    try:
+        claimed = StoredImage.objects.filter(pk=image_id, status=StoredImage.STATUS_PENDING).update(
+            status=StoredImage.STATUS_UPLOADING, claimed_at=timezone.now()
+        )
+        if not claimed:
+            return None
+
+        image = StoredImage.objects.get(pk=image_id)
+        data = bytes(image.image_data)
+        try:
+            image.reference = get_backend().upload(data, image.digest)
+        except Exception as e:
+            logger.exception("Envoi de l'image %s en échec", image.digest[:12])
+            image.status = StoredImage.STATUS_FAILED
+            image.error = str(e)
+            image.save(update_fields=['status', 'error'])
+            return image
+
+        image.status = StoredImage.STATUS_DONE
+        image.image_data = None
+        image.uploaded_at = timezone.now()
+        image.save(update_fields=['status', 'reference', 'image_data', 'uploaded_at'])
+
+        # Un rattachement validé après cette requête est rempli par _after_attach
+        fill_references(image, image.attachments.filter(filled_at__isnull=True))
+
+        # Miniatures produites tant que l'original est en mémoire ; en cas
+        # d'échec elles le seront à la première demande
+        if getattr(settings, 'IMAGE_DERIVATIVES_EAGER', True):
+            from .derivatives import generate_derivatives
+            try:
+                generate_derivatives(image, data)
+            except Exception:
+                logger.exception("Miniatures de l'image %s en échec", image.digest[:12])
+        return image
+    finally:
+        close_old_connections()
+
+
+def recover_stale_uploads(stale_after=None):
+    """
+    Remet en file les images "uploading" prises depuis plus de `stale_after`
+    secondes (IMAGE_UPLOAD_STALE_AFTER) : processus mort pendant l'envoi.
+    Le contenu est encore en base (vidé seulement après l'envoi).
+    Retourne le nombre d'images reprises
+    """
+    if stale_after is None:
+        stale_after = getattr(settings, 'IMAGE_UPLOAD_STALE_AFTER', 600)
+    limit = timezone.now() - timedelta(seconds=stale_after)
+    return StoredImage.objects.filter(status=StoredImage.STATUS_UPLOADING, claimed_at__lt=limit).update(
+        status=StoredImage.STATUS_PENDING, claimed_at=None
+    )
+
+
+def fill_references(image, attachments):
+    """
+    Écrit la référence de l'image dans les lignes rattachées (UPDATE direct :
+    pas de post_save, les deltas ne dépendent pas de l'image)
+    """
+    filled = 0
+    for attachment in attachments:
+        model = apps.get_model(attachment.model)
+        filled += model.objects.filter(pk=attachment.object_id).update(
+            **{attachment.field: image.reference, 'updated_at': timezone.now()}
+        )
+        ImageAttachment.objects.filter(pk=attachment.pk).update(filled_at=timezone.now())
+    if filled:
+        invalider_reponses()
+    return filled
+
+
+def upload_stats():
+    counts = dict(StoredImage.objects.values_list('status').annotate(Count('pk')).order_by())
+    return {
+        'backend': getattr(settings, 'IMAGE_STORE_BACKEND', 'stats.image_store.CloudinaryBackend'),
+        **{status: counts.get(status, 0) for status, _ in StoredImage.STATUS_CHOICES},
+    }
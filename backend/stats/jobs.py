@@ -0,0 +1,115 @@
+# stats/jobs.py
+
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .logs import get_logger
+from .models import OcrJob
+from .tracing import trace
+from .utils import extract_kpi_with_easyocr, finalize_kpi_data
+
+
+logger = get_logger(__name__)
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Pool de threads local au processus qui exécute les jobs OCR
+    """
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'OCR_JOB_WORKERS', 2),
+                thread_name_prefix='ocr-job',
+            )
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def submit_ocr_job(uploaded_image, date_jour, moment, note=None):
+    """
+    Enregistre l'image en base et programme son traitement, retourne le job
+    """
+    job = OcrJob.objects.create(
+        image_data=uploaded_image.read(),
+        date=date_jour,
+        moment=moment,
+        note=note,
+    )
+    get_executor().submit(process_ocr_job, job.pk)
+    return job
+
+
+def process_ocr_job(job_id):
+    """
+    Exécute un job en attente. Le passage pending -> running se fait par un
+    UPDATE conditionnel : un job n'est traité qu'une seule fois même si
+    plusieurs workers (threads ou commande process_ocr_jobs) le voient.
+    Toute erreur termine le job en échec : il ne reste jamais "running"
+    """
+    close_old_connections()
+    try:
+        claimed = OcrJob.objects.filter(pk=job_id, status=OcrJob.STATUS_PENDING).update(
+            status=OcrJob.STATUS_RUNNING, updated_at=timezone.now()
+        )
+        if not claimed:
+            return None
+        try:
+            return _run_job(job_id)
+        except Exception as e:
+            logger.exception("Job OCR %s en échec", job_id)
+            close_old_connections()
+            OcrJob.objects.filter(pk=job_id, status=OcrJob.STATUS_RUNNING).update(
+                status=OcrJob.STATUS_FAILED, error=str(e) or e.__class__.__name__,
+                image_data=None, updated_at=timezone.now(),
+            )
+            return OcrJob.objects.filter(pk=job_id).first()
+    finally:
+        close_old_connections()
+
+
+def _run_job(job_id):
+    job = OcrJob.objects.get(pk=job_id)
+    with trace('ocr_job'):
+        result = extract_kpi_with_easyocr(io.BytesIO(bytes(job.image_data)))
+
+    if not result['success']:
+        job.status = OcrJob.STATUS_FAILED
+        job.error = result['error']
+    else:
+        kpi_data, missing_fields = finalize_kpi_data(result['data'], job.date, job.moment, job.note)
+        job.status = OcrJob.STATUS_DONE
+        job.kpi_data = kpi_data
+        job.missing_fields = missing_fields
+        job.detections_count = result.get('detections_count', 0)
+
+    # L'image n'est plus utile une fois l'OCR terminé
+    job.image_data = None
+    job.save()
+    return job
+
+
+def recover_stale_jobs(stale_after=None):
+    """
+    Remet en attente les jobs "running" sans nouvelle depuis `stale_after`
+    secondes (OCR_JOB_STALE_AFTER) : processus mort en cours de traitement.
+    Retourne le nombre de jobs repris
+    """
+    if stale_after is None:
+        stale_after = getattr(settings, 'OCR_JOB_STALE_AFTER', 600)
+    limit = timezone.now() - timedelta(seconds=stale_after)
+    return OcrJob.objects.filter(status=OcrJob.STATUS_RUNNING, updated_at__lt=limit).update(
+        status=OcrJob.STATUS_PENDING, updated_at=timezone.now()
+    )
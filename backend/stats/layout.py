@@ -0,0 +1,163 @@
+# stats/layout.py
+
+import operator
+
+import numpy as np
+from django.conf import settings
+
+
+# Disposition de la capture de référence (kpi.png, 943 px de large).
+# Chaque zone est une liste de conditions (axe, opérateur, valeur) sur le
+# centre de la détection ; la première zone dont toutes les conditions
+# sont vraies l'emporte. `crop` indique si la bande doit être lue par l'OCR.
+# `fields` associe un type de jeton (Sent, RR, Messages) à un champ KPI et
+# `tiers` donne les paliers affichés en gris : (valeur, y du centre de la
+# ligne). Le badge coloré remplace la ligne du palier atteint.
+TOP_ROWS = (324, 375, 425)
+BOTTOM_ROWS = (656, 707, 757)
+
+DEFAULT_LAYOUT = {
+    'name': 'kpi-943',
+    'reference_width': 943,
+    'min_confidence': 0.3,  # Détections moins confiantes ignorées
+    'min_length': 2,  # Textes plus courts ignorés
+    'band_padding': 20,  # Marge autour des bandes découpées pour l'OCR
+    'tier_tolerance': 20,  # Écart max (px) en y entre un jeton et la ligne d'un palier
+    'defaults': {'Sent': 0, 'RR': 90, 'Messages': 50},  # Valeur quand seuls les paliers sont lus
+    'zones': [
+        {'name': 'meta', 'crop': False, 'rules': [('y', '<=', 200)]},
+        {
+            'name': 'messages',
+            'rules': [('y', '>', 300), ('y', '<', 500), ('x', '<', 480)],
+            'fields': {'Sent': 'msg_sent', 'RR': 'msg_rr'},
+            'tiers': {'Sent': list(zip((2520, 2250, 0), TOP_ROWS)), 'RR': list(zip((90, 78, 0), TOP_ROWS))},
+        },
+        {
+            'name': 'gifts',
+            'rules': [('y', '>', 300), ('y', '<', 500), ('x', '>=', 480)],
+            'fields': {'Sent': 'gift_sent', 'RR': 'gift_rr'},
+            'tiers': {'Sent': list(zip((540, 125, 0), TOP_ROWS)), 'RR': list(zip((90, 78, 0), TOP_ROWS))},
+        },
+        {
+            'name': 'photos',
+            'rules': [('y', '>=', 600), ('y', '<', 800), ('x', '<', 480)],
+            'fields': {'Sent': 'photo_sent', 'RR': 'photo_rr'},
+            'tiers': {'Sent': list(zip((540, 125, 0), BOTTOM_ROWS)), 'RR': list(zip((90, 78, 0), BOTTOM_ROWS))},
+        },
+        {
+            'name': 'speeds',
+            'rules': [('y', '>=', 600), ('y', '<', 800), ('x', '>=', 480)],
+            'fields': {'Messages': 'speed_rr'},
+            'tiers': {'Messages': list(zip((65, 50, 0), BOTTOM_ROWS))},
+        },
+    ],
+}
+
+OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+def get_layout():
+    """
+    Disposition active : OCR_LAYOUT dans les settings, sinon celle de kpi.png
+    """
+    return getattr(settings, 'OCR_LAYOUT', None) or DEFAULT_LAYOUT
+
+
+def zone_names(layout=None):
+    layout = layout or get_layout()
+    return [zone['name'] for zone in layout['zones']]
+
+
+def layout_bands(layout=None):
+    """
+    Bandes horizontales (nom, haut, bas) à lire par l'OCR, déduites des bornes
+    en y des zones ; les zones partageant la même bande sont regroupées
+    """
+    layout = layout or get_layout()
+    bands = {}
+    for zone in layout['zones']:
+        if not zone.get('crop', True):
+            continue
+        lows = [value for axis, op, value in zone['rules'] if axis == 'y' and op in ('>', '>=')]
+        highs = [value for axis, op, value in zone['rules'] if axis == 'y' and op in ('<', '<=')]
+        top = max(lows) if lows else 0
+        bottom = min(highs) if highs else None
+        bands.setdefault((top, bottom), []).append(zone['name'])
+    return [('_'.join(names), top, bottom) for (top, bottom), names in bands.items()]
+
+
+def detections_to_arrays(results):
+    """
+    Convertit des détections (bbox, text, confidence) en tableaux NumPy :
+    centres x/y, confiances et longueurs des textes nettoyés
+    Retourne (x, y, confidence, textes nettoyés)
+    """
+    count = len(results)
+    if not count:
+        empty = np.empty(0)
+        return empty, empty, empty, []
+
+    corners = np.array([(bbox[0], bbox[2]) for bbox, _, _ in results], dtype=float)  # (n, 2, 2)
+    centers = corners.mean(axis=1)
+    confidence = np.fromiter((conf for _, _, conf in results), dtype=float, count=count)
+    texts = [text.strip() for _, text, _ in results]
+    return centers[:, 0], centers[:, 1], confidence, texts
+
+
+def classify(x, y, confidence, texts, layout=None):
+    """
+    Attribue une zone à chaque détection par masques vectorisés
+    Retourne un tableau d'indices de zone (-1 : ignorée ou hors zone)
+    """
+    layout = layout or get_layout()
+    if not len(x):
+        return np.empty(0, dtype=int)
+
+    lengths = np.fromiter((len(text) for text in texts), dtype=int, count=len(texts))
+    valid = (lengths >= layout.get('min_length', 2)) & (confidence >= layout.get('min_confidence', 0.3))
+
+    axes = {'x': x, 'y': y}
+    conditions = []
+    for zone in layout['zones']:
+        mask = valid.copy()
+        for axis, op, value in zone['rules']:
+            mask &= OPERATORS[op](axes[axis], value)
+        conditions.append(mask)
+    choices = np.arange(len(conditions))
+    return np.select(conditions, choices, default=-1)
+
+
+def group_by_zone(results, layout=None):
+    """
+    Regroupe les détections d'une image par zone, au format attendu par les
+    extracteurs : {zone: [{'text', 'x', 'y', 'confidence'}, ...]}
+    """
+    return group_by_zone_batch([results], layout)[0]
+
+
+def group_by_zone_batch(results_list, layout=None):
+    """
+    Même chose pour plusieurs images, classées en une seule passe vectorisée
+    """
+    layout = layout or get_layout()
+    names = zone_names(layout)
+    flat = [detection for results in results_list for detection in results]
+    owners = np.repeat(np.arange(len(results_list)), [len(results) for results in results_list])
+
+    x, y, confidence, texts = detections_to_arrays(flat)
+    zone_index = classify(x, y, confidence, texts, layout)
+
+    grouped = [{name: [] for name in names} for _ in results_list]
+    for i in np.flatnonzero(zone_index >= 0):
+        grouped[owners[i]][names[zone_index[i]]].append({
+            'text': texts[i],
+            'x': float(x[i]),
+            'y': float(y[i]),
+            'confidence': float(confidence[i]),
+        })
+    return grouped
@@ -0,0 +1,62 @@
+# stats/logs.py
+
+import contextvars
+import logging
+from contextlib import contextmanager
+
+
+_capture = contextvars.ContextVar('stats_debug_capture', default=None)
+
+
+class CaptureAwareLogger(logging.LoggerAdapter):
+    """
+    Logger dont les messages sont formatés seulement s'ils sont émis :
+    niveau actif sur le logger, ou capture de debug ouverte pour la requête
+    en cours (voir capture_debug). Une capture n'envoie rien aux handlers
+    si le niveau n'est pas actif : les logs de production restent propres.
+    """
+
+    def isEnabledFor(self, level):
+        return _capture.get() is not None or self.logger.isEnabledFor(level)
+
+    def log(self, level, msg, *args, **kwargs):
+        capture = _capture.get()
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, msg, *args, stacklevel=kwargs.pop('stacklevel', 1) + 2, **kwargs)
+        if capture is not None:
+            capture['logs'].append({
+                'level': logging.getLevelName(level),
+                'logger': self.logger.name,
+                'message': msg % args if args else msg,
+            })
+
+
+def get_logger(name):
+    return CaptureAwareLogger(logging.getLogger(name), {})
+
+
+@contextmanager
+def capture_debug():
+    """
+    Capture tous les messages (debug compris) émis dans ce contexte
+    Retourne un dict {'logs': [...]} complété par add_debug_detail
+    """
+    capture = {'logs': []}
+    token = _capture.set(capture)
+    try:
+        yield capture
+    finally:
+        _capture.reset(token)
+
+
+def debug_capture_active():
+    return _capture.get() is not None
+
+
+def add_debug_detail(key, value):
+    """
+    Joint une donnée (ex: détections OCR brutes) à la capture en cours
+    """
+    capture = _capture.get()
+    if capture is not None:
+        capture[key] = value
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from stats.benchmark import generate_screenshot, run_benchmark, save_report
+
+
+def _list(value, cast):
+    try:
+        return [cast(item) for item in value.split(',') if item.strip()]
+    except ValueError:
+        raise CommandError(f"Liste invalide : {value}")
+
+
+class Command(BaseCommand):
+    help = "Benchmark du pipeline OCR sur kpi.png et des captures synthétiques (résultat JSON)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=5, help="Captures synthétiques par résolution")
+        parser.add_argument('--scales', default='0.75,1,1.5', help="Facteurs d'échelle, ex: 0.75,1,1.5")
+        parser.add_argument('--concurrency', default='1,2,4', help="Niveaux de concurrence, ex: 1,2,4")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--trace-memory', action='store_true', help="Mesurer le pic mémoire Python (tracemalloc)")
+        parser.add_argument('--output', help="Fichier JSON (défaut: bench-AAAAMMJJ-HHMMSS.json)")
+        parser.add_argument('--samples-dir', help="Enregistrer aussi les captures générées dans ce dossier")
+
+    def handle(self, *args, **options):
+        scales = _list(options['scales'], float)
+        concurrency = _list(options['concurrency'], int)
+
+        if options['samples_dir']:
+            from pathlib import Path
+            directory = Path(options['samples_dir'])
+            directory.mkdir(parents=True, exist_ok=True)
+            for scale in scales:
+                for index in range(options['images']):
+                    image_bytes, _ = generate_screenshot(options['seed'] + index, scale)
+                    (directory / f"kpi-{scale}-{index}.png").write_bytes(image_bytes)
+
+        report = run_benchmark(
+            images=options['images'],
+            scales=scales,
+            concurrency=concurrency,
+            seed=options['seed'],
+            trace_memory=options['trace_memory'],
+        )
+
+        output = options['output'] or f"bench-{timezone.now():%Y%m%d-%H%M%S}.json"
+        save_report(report, output)
+
+        self.stdout.write(f"Démarrage à froid : {report['cold_start_seconds']:.2f}s")
+        for scale, stages in report['warm'].items():
+            self.stdout.write(
+                f"x{scale} : {stages['total']['median']:.3f}s médiane, "
+                f"précision {stages['accuracy']['mean']:.0%}"
+            )
+        for workers, data in report['throughput'].items():
+            self.stdout.write(f"{workers} thread(s) : {data['images_per_second']:.2f} images/s")
+        self.stdout.write(self.style.SUCCESS(f"Résultats enregistrés dans {output}"))
@@ -0,0 +1,26 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from stats.bulk_io import FORMATS, IMPORTERS, export_lines
+
+
+class Command(BaseCommand):
+    help = "Exporte l'historique KpiDaily / StatsPeriod en CSV ou JSONL (mémoire constante)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="Fichier de sortie (- : sortie standard)")
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--kind', choices=list(IMPORTERS), default='kpi')
+        parser.add_argument('--date-from', type=parse_date)
+        parser.add_argument('--date-to', type=parse_date)
+
+    def handle(self, *args, **options):
+        lines = export_lines(options['format'], kind=options['kind'],
+                             date_from=options['date_from'], date_to=options['date_to'])
+        if options['path'] == '-':
+            sys.stdout.writelines(lines)
+            return
+        with open(options['path'], 'w', encoding='utf-8', newline='') as output:
+            output.writelines(lines)
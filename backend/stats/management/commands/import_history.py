@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from stats.bulk_io import CONFLICT_MODES, FORMATS, IMPORTERS, ImportFormatError, import_history
+
+
+class Command(BaseCommand):
+    help = "Importe un historique KpiDaily / StatsPeriod depuis un fichier CSV ou JSONL"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Fichier CSV (avec en-tête) ou JSONL")
+        parser.add_argument('--format', choices=FORMATS, help="Par défaut : extension du fichier")
+        parser.add_argument('--kind', choices=list(IMPORTERS), default='kpi')
+        parser.add_argument('--on-conflict', choices=CONFLICT_MODES, default='skip',
+                            help="Ligne déjà en base : l'ignorer, la mettre à jour ou la signaler")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Lignes validées et écrites par lot")
+
+    def _progress(self, report):
+        self.stdout.write(
+            f"{report['rows']} ligne(s) lue(s) : {report['created']} créée(s), {report['updated']} mise(s) à jour, "
+            f"{report['skipped']} ignorée(s), {report['invalid']} invalide(s)"
+        )
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or options['path'].rsplit('.', 1)[-1].lower()
+        try:
+            with open(options['path'], 'rb') as stream:
+                report = import_history(
+                    stream, fmt,
+                    kind=options['kind'],
+                    on_conflict=options['on_conflict'],
+                    chunk_size=options['chunk_size'],
+                    progress=self._progress,
+                )
+        except (OSError, ImportFormatError) as e:
+            if getattr(e, 'report', None):
+                self.stdout.write("Arrêt sur erreur, lignes déjà écrites conservées :")
+                self._progress(e.report)
+            raise CommandError(str(e))
+
+        for error in report['errors']:
+            self.stderr.write(f"Ligne {error['line']} : {error['error']}")
+        self.stdout.write(f"Terminé en {report['chunks']} lot(s)")
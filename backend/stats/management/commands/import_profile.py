@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from stats.ocr_stack import HEAVY_MODULES, import_profile
+
+
+class Command(BaseCommand):
+    help = "Profil d'import (python -X importtime) du démarrage, avec ou sans la pile OCR"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=15, help="Nombre de modules les plus coûteux affichés")
+        parser.add_argument('--ocr', action='store_true', help="Charger aussi la pile OCR (extraction, moteurs)")
+
+    def handle(self, *args, **options):
+        scenarios = [('démarrage (urls, admin)', ['import stats.urls', 'import stats.admin'])]
+        if options['ocr']:
+            scenarios.append(('avec OCR', ['import stats.urls', 'import stats.ocr_backends', 'import easyocr']))
+
+        for label, statements in scenarios:
+            try:
+                report = import_profile(statements, top=options['top'])
+            except RuntimeError as e:
+                raise CommandError(f"{label} : {e}")
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{label} : {report['total_ms']:.0f} ms (processus complet)"))
+            for name, cumulative, own in report['modules']:
+                self.stdout.write(f"  {cumulative:8.1f} ms  {own:7.1f} ms  {name}")
+            heavy = ', '.join(f"{name} {ms:.0f} ms" for name, ms in report['heavy'].items())
+            self.stdout.write(f"  lourds chargés : {heavy or 'aucun'} (suivis : {', '.join(HEAVY_MODULES)})")
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from stats.ocr_cache import cache_stats, evict, invalidate_ocr_cache
+
+
+class Command(BaseCommand):
+    help = "Gestion du cache des détections OCR"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clear', action='store_true', help="Vider tout le cache")
+        parser.add_argument('--purge-stale', action='store_true', help="Supprimer les entrées d'une autre configuration OCR")
+        parser.add_argument('--evict', action='store_true', help="Appliquer TTL et taille maximale")
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            self.stdout.write(f"{invalidate_ocr_cache()} entrée(s) supprimée(s)")
+        elif options['purge_stale']:
+            self.stdout.write(f"{invalidate_ocr_cache(stale_only=True)} entrée(s) obsolète(s) supprimée(s)")
+        elif options['evict']:
+            self.stdout.write(f"{evict()} entrée(s) évincée(s)")
+
+        stats = cache_stats()
+        self.stdout.write(f"{stats['entries']} entrée(s) pour {stats['signature']}")
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from stats.jobs import process_ocr_job, recover_stale_jobs
+from stats.models import OcrJob
+
+
+class Command(BaseCommand):
+    help = "Traite les jobs OCR en attente (reprise après redémarrage ou worker dédié)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Continuer à interroger la file au lieu de s'arrêter")
+        parser.add_argument('--interval', type=float, default=2.0, help="Délai (secondes) entre deux interrogations")
+        parser.add_argument('--stale-after', type=float, default=None,
+                            help="Reprendre les jobs \"running\" inactifs depuis ce délai (secondes, défaut OCR_JOB_STALE_AFTER)")
+
+    def handle(self, *args, **options):
+        while True:
+            recovered = recover_stale_jobs(options['stale_after'])
+            if recovered:
+                self.stdout.write(f"{recovered} job(s) bloqué(s) remis en attente")
+            pending = list(
+                OcrJob.objects.filter(status=OcrJob.STATUS_PENDING)
+                .order_by('created_at')
+                .values_list('pk', flat=True)
+            )
+            for job_id in pending:
+                job = process_ocr_job(job_id)
+                if job is not None:
+                    self.stdout.write(f"Job {job.pk} : {job.status}")
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from stats.utils import reconstruire_deltas
+
+
+class Command(BaseCommand):
+    help = "Reconstruit la table des deltas journaliers (DailyDelta)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="Première date (AAAA-MM-JJ), par défaut la plus ancienne")
+        parser.add_argument('--end', help="Dernière date (AAAA-MM-JJ), par défaut la plus récente")
+
+    def handle(self, *args, **options):
+        dates = {}
+        for option in ('start', 'end'):
+            value = options[option]
+            dates[option] = parse_date(value) if value else None
+            if value and dates[option] is None:
+                raise CommandError(f"Date invalide pour --{option} : {value}")
+
+        crees = reconstruire_deltas(dates['start'], dates['end'])
+        self.stdout.write(self.style.SUCCESS(f"{crees} delta(s) journalier(s) reconstruit(s)"))
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from stats.image_store import recover_stale_uploads, upload_image, upload_stats
+from stats.models import StoredImage
+
+
+class Command(BaseCommand):
+    help = "Envoie les images en attente (reprise après redémarrage ou worker dédié)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true', help="Remettre en file les envois en échec")
+        parser.add_argument('--loop', action='store_true', help="Continuer à interroger la file au lieu de s'arrêter")
+        parser.add_argument('--interval', type=float, default=5.0, help="Délai (secondes) entre deux interrogations")
+        parser.add_argument('--stale-after', type=float, default=None,
+                            help="Reprendre les envois \"uploading\" depuis ce délai (secondes, défaut IMAGE_UPLOAD_STALE_AFTER)")
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            retried = StoredImage.objects.filter(status=StoredImage.STATUS_FAILED).update(status=StoredImage.STATUS_PENDING, error='')
+            self.stdout.write(f"{retried} image(s) remise(s) en file")
+
+        while True:
+            recovered = recover_stale_uploads(options['stale_after'])
+            if recovered:
+                self.stdout.write(f"{recovered} envoi(s) bloqué(s) remis en file")
+            pending = list(
+                StoredImage.objects.filter(status=StoredImage.STATUS_PENDING)
+                .order_by('created_at')
+                .values_list('pk', flat=True)
+            )
+            for image_id in pending:
+                image = upload_image(image_id)
+                if image is not None:
+                    self.stdout.write(f"Image {image.digest[:12]} : {image.status}")
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(str(upload_stats()))
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:58
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0006_kpidaily_note'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OcrJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'En attente'), ('running', 'En cours'), ('done', 'Terminé'), ('failed', 'Échoué')], default='pending', max_length=10)),
+                ('image_data', models.BinaryField(null=True)),
+                ('date', models.DateField()),
+                ('moment', models.CharField(choices=[('debut', 'Début de capture'), ('fin', 'Fin de capture')], max_length=10)),
+                ('note', models.CharField(blank=True, max_length=255, null=True)),
+                ('kpi_data', models.JSONField(blank=True, null=True)),
+                ('missing_fields', models.JSONField(blank=True, default=list)),
+                ('detections_count', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Job OCR',
+                'verbose_name_plural': 'Jobs OCR',
+                'db_table': 'ocr_job',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='ocr_job_status_508727_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0007_ocrjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OcrCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64)),
+                ('signature', models.CharField(max_length=255)),
+                ('detections', models.JSONField()),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Cache OCR',
+                'verbose_name_plural': 'Cache OCR',
+                'db_table': 'ocr_cache_entry',
+                'indexes': [models.Index(fields=['last_used_at'], name='ocr_cache_e_last_us_e52ee2_idx'), models.Index(fields=['created_at'], name='ocr_cache_e_created_172306_idx')],
+                'unique_together': {('digest', 'signature')},
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:03
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0008_ocrcacheentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('success', models.BooleanField(default=True)),
+                ('error', models.CharField(blank=True, default='', max_length=255)),
+                ('msg_sent', models.IntegerField(null=True)),
+                ('msg_rr', models.FloatField(null=True)),
+                ('photos_sent', models.IntegerField(null=True)),
+                ('gifts_sent', models.IntegerField(null=True)),
+                ('week_total', models.FloatField(null=True)),
+                ('month_total', models.FloatField(null=True)),
+                ('delta_kpi', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('delta_stats', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Delta Journalier',
+                'verbose_name_plural': 'Deltas Journaliers',
+                'db_table': 'daily_delta',
+                'ordering': ['-date'],
+            },
+        ),
+    ]
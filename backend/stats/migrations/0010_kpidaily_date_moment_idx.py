@@ -0,0 +1,17 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0009_dailydelta'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='kpidaily',
+            index=models.Index(fields=['-date', 'moment'], name='kpi_daily_date_moment_idx'),
+        ),
+    ]
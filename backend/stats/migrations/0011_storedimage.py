@@ -0,0 +1,52 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0010_kpidaily_date_moment_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('status', models.CharField(choices=[('pending', 'En attente'), ('uploading', 'Envoi en cours'), ('done', 'Envoyée'), ('failed', 'Échec')], default='pending', max_length=10)),
+                ('image_data', models.BinaryField(null=True)),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('reference', models.CharField(blank=True, default='', max_length=255)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('uploaded_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Image stockée',
+                'verbose_name_plural': 'Images stockées',
+                'db_table': 'stored_image',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='stored_imag_status_450bdc_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ImageAttachment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.CharField(max_length=64)),
+                ('field', models.CharField(max_length=50)),
+                ('filled_at', models.DateTimeField(blank=True, null=True)),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attachments', to='stats.storedimage')),
+            ],
+            options={
+                'verbose_name': 'Image rattachée',
+                'verbose_name_plural': 'Images rattachées',
+                'db_table': 'image_attachment',
+                'unique_together': {('model', 'object_id', 'field')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0011_storedimage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storedimage',
+            name='derivatives',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
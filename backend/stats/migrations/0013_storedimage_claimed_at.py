@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0012_storedimage_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storedimage',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
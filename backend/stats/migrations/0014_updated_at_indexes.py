@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stats', '0013_storedimage_claimed_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dailydelta',
+            index=models.Index(fields=['updated_at'], name='daily_delta_updated_38cf86_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='kpidaily',
+            index=models.Index(fields=['updated_at'], name='kpi_daily_updated_9f7552_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='statsperiod',
+            index=models.Index(fields=['updated_at'], name='stats_perio_updated_95dc06_idx'),
+        ),
+    ]
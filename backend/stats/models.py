@@ -1,4 +1,9 @@
+import uuid
+
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models import ExpressionWrapper, F, Sum, Value
+from django.db.models.functions import Cast
 from django.utils import timezone
 from django.core.validators import MaxValueValidator
 from cloudinary.models import CloudinaryField
@@ -35,7 +40,44 @@ class KpiDaily(models.Model):
         verbose_name_plural = 'KPIs Journaliers'
         ordering = ['-date', 'moment'] # Ordre par date décroissante, puis moment croissant
         unique_together = [['date', 'moment']] # Une seule mesure "debut" ou "fin" par date
+        indexes = [
+            models.Index(fields=['-date', 'moment'], name='kpi_daily_date_moment_idx'), # Même ordre que la liste paginée
+            models.Index(fields=['updated_at']), # MAX(updated_at) des validateurs HTTP (stats/http_cache.py)
+        ]
         
+def total_expression():
+    """
+    Équivalent SQL de StatsPeriod.total() :
+    (responses + kpi_effect + extra_benefits) * 0.03 - penalites
+    Les opérandes sont convertis en flottant double précision pour obtenir
+    exactement le même résultat que le calcul Python (et non un numeric arrondi)
+    """
+    somme = Cast(F('responses') + F('kpi_effect') + F('extra_benefits'), models.FloatField())
+    return ExpressionWrapper(
+        somme * Value(0.03, output_field=models.FloatField()) - Cast(F('penalites'), models.FloatField()),
+        output_field=models.FloatField(),
+    )
+
+
+class StatsPeriodQuerySet(models.QuerySet):
+    def with_total(self):
+        """Annote chaque ligne avec `total_value`, calculé par la base"""
+        return self.annotate(total_value=total_expression())
+
+    def sum_total(self):
+        """Somme des totaux de la sélection"""
+        return self.aggregate(total=Sum(total_expression()))['total']
+
+    def totals_by_period_type(self):
+        """{period_type: somme des totaux}"""
+        rows = self.order_by().values('period_type').annotate(total=Sum(total_expression()))
+        return {row['period_type']: row['total'] for row in rows}
+
+    def top_total(self, n=10):
+        """Les n périodes au total le plus élevé"""
+        return self.with_total().order_by('-total_value')[:n]
+
+
 class StatsPeriod(models.Model):
     """Stocke les statistiques par semaine ou mois"""
     PERIOD_CHOICES = [
@@ -62,6 +104,9 @@ class StatsPeriod(models.Model):
     image_stats = CloudinaryField('image_stats', null=True)  # Image associée aux statistiques
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    objects = StatsPeriodQuerySet.as_manager()
+
     def __str__(self):
         return f"StatsPeriod: {self.period_type} for {self.kpi_daily.date} - {self.moment}"
     
@@ -82,4 +127,157 @@ class StatsPeriod(models.Model):
         indexes = [
             models.Index(fields=['period_type']),
             models.Index(fields=['kpi_daily', 'period_type']),
-        ]
\ No newline at end of file
+            models.Index(fields=['updated_at']),
+        ]
+
+
+class OcrJob(models.Model):
+    """Extraction OCR différée d'une capture KPI (file d'attente en base)"""
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'En attente'),
+        (STATUS_RUNNING, 'En cours'),
+        (STATUS_DONE, 'Terminé'),
+        (STATUS_FAILED, 'Échoué'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    image_data = models.BinaryField(null=True)  # Image brute, vidée après traitement
+    date = models.DateField()
+    moment = models.CharField(max_length=10, choices=KpiDaily.MOMENT_CHOICES)
+    note = models.CharField(max_length=255, blank=True, null=True)
+    kpi_data = models.JSONField(null=True, blank=True)  # Données extraites
+    missing_fields = models.JSONField(default=list, blank=True)
+    detections_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"OcrJob {self.id} - {self.status}"
+
+    class Meta:
+        db_table = 'ocr_job'
+        verbose_name = 'Job OCR'
+        verbose_name_plural = 'Jobs OCR'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+
+class OcrCacheEntry(models.Model):
+    """Détections OCR brutes mises en cache par empreinte de l'image"""
+    digest = models.CharField(max_length=64)  # SHA-256 du contenu de l'image
+    signature = models.CharField(max_length=255)  # Configuration OCR (modèle, langues)
+    detections = models.JSONField()  # Liste de [bbox, text, confidence]
+    hits = models.PositiveIntegerField(default=0)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"OcrCacheEntry {self.digest[:12]} - {self.signature}"
+
+    class Meta:
+        db_table = 'ocr_cache_entry'
+        verbose_name = 'Cache OCR'
+        verbose_name_plural = 'Cache OCR'
+        unique_together = [['digest', 'signature']]
+        indexes = [
+            models.Index(fields=['last_used_at']),
+            models.Index(fields=['created_at']),
+        ]
+
+
+
+class DailyDelta(models.Model):
+    """Delta journalier (fin - début) matérialisé, tenu à jour à chaque écriture KPI"""
+    date = models.DateField(unique=True)
+    success = models.BooleanField(default=True)
+    error = models.CharField(max_length=255, blank=True, default='')
+    msg_sent = models.IntegerField(null=True)
+    msg_rr = models.FloatField(null=True)
+    photos_sent = models.IntegerField(null=True)
+    gifts_sent = models.IntegerField(null=True)
+    week_total = models.FloatField(null=True)  # StatsPeriod.total() de la semaine (fin)
+    month_total = models.FloatField(null=True)  # StatsPeriod.total() du mois (fin)
+    delta_kpi = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+    delta_stats = models.JSONField(null=True, encoder=DjangoJSONEncoder)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"DailyDelta {self.date}"
+
+    class Meta:
+        db_table = 'daily_delta'
+        verbose_name = 'Delta Journalier'
+        verbose_name_plural = 'Deltas Journaliers'
+        ordering = ['-date']
+        indexes = [
+            models.Index(fields=['updated_at']),
+        ]
+
+
+class StoredImage(models.Model):
+    """Capture à stocker (Cloudinary ou stockage local), une seule fois par contenu"""
+    STATUS_PENDING = 'pending'
+    STATUS_UPLOADING = 'uploading'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'En attente'),
+        (STATUS_UPLOADING, 'Envoi en cours'),
+        (STATUS_DONE, 'Envoyée'),
+        (STATUS_FAILED, 'Échec'),
+    ]
+
+    digest = models.CharField(max_length=64, unique=True)  # SHA-256 du contenu de l'image
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    image_data = models.BinaryField(null=True)  # Image brute, vidée après l'envoi
+    size = models.PositiveIntegerField(default=0)
+    reference = models.CharField(max_length=255, blank=True, default='')  # Valeur écrite dans image_kpi / image_stats
+    derivatives = models.JSONField(default=dict, blank=True)  # {clé du dérivé: référence} (voir stats/derivatives.py)
+    error = models.TextField(blank=True, default='')
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)  # Passage en "uploading" (reprise des envois bloqués)
+    uploaded_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"StoredImage {self.digest[:12]} - {self.status}"
+
+    class Meta:
+        db_table = 'stored_image'
+        verbose_name = 'Image stockée'
+        verbose_name_plural = 'Images stockées'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+
+class ImageAttachment(models.Model):
+    """Champ image (image_kpi, image_stats) d'une ligne à remplir avec une StoredImage"""
+    image = models.ForeignKey(StoredImage, on_delete=models.CASCADE, related_name='attachments')
+    model = models.CharField(max_length=100)  # ex: stats.kpidaily
+    object_id = models.CharField(max_length=64)
+    field = models.CharField(max_length=50)
+    filled_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"ImageAttachment {self.model}:{self.object_id}.{self.field}"
+
+    class Meta:
+        db_table = 'image_attachment'
+        verbose_name = 'Image rattachée'
+        verbose_name_plural = 'Images rattachées'
+        unique_together = [['model', 'object_id', 'field']]
@@ -0,0 +1,419 @@
+# stats/ocr_backends.py
+
+import importlib.util
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from PIL import Image
+
+from .extraction import extract_kpis
+from .layout import classify, detections_to_arrays, get_layout, group_by_zone, zone_names
+from .logs import get_logger
+from .preprocessing import enhance_crop, get_retry_steps, offset_detections, scale_detections
+from .reader_pool import get_reader_pool
+from .tracing import set_attribute, span
+
+logger = get_logger(__name__)
+
+
+class OcrBackend:
+    """
+    Moteur OCR : lit des crops (nom, tableau BGR, origine) et retourne les
+    détections (bbox, text, confidence) dans le repère de l'image normalisée,
+    confiance entre 0 et 1, comme EasyOCR
+    """
+    name = None
+
+    def available(self):
+        return True
+
+    def readtext(self, array):
+        raise NotImplementedError
+
+    def read_crops(self, crops):
+        results = []
+        for _, array, origin in crops:
+            results.extend(offset_detections(self.readtext(array), origin))
+        return results
+
+    def read_batch(self, crops_list):
+        """
+        Lit les crops de plusieurs images, une liste de détections par image
+        """
+        return [self.read_crops(crops) for crops in crops_list]
+
+
+class EasyOcrBackend(OcrBackend):
+    name = 'easyocr'
+
+    def __init__(self):
+        self._available = None
+
+    def available(self):
+        # Paquet absent des requirements : installation Tesseract seule possible
+        if self._available is None:
+            self._available = importlib.util.find_spec('easyocr') is not None
+            if not self._available:
+                logger.warning("EasyOCR non installé, moteur ignoré")
+        return self._available
+
+    def read_crops(self, crops):
+        # Un seul emprunt de Reader pour tous les crops
+        timeout = getattr(settings, 'OCR_READER_TIMEOUT', None)
+        results = []
+        with get_reader_pool().reader(timeout=timeout) as reader:
+            for _, array, origin in crops:
+                results.extend(offset_detections(reader.readtext(array, detail=1), origin))
+        return results
+
+    def read_batch(self, crops_list):
+        # Inférence par lots : readtext_batched exige des images de même
+        # dimension, les crops sont regroupés par zone et par taille
+        groups = {}
+        for index, crops in enumerate(crops_list):
+            for name, array, origin in crops:
+                groups.setdefault((name, array.shape), []).append((index, array, origin))
+
+        timeout = getattr(settings, 'OCR_READER_TIMEOUT', None)
+        batch_size = getattr(settings, 'OCR_BATCH_SIZE', 8)
+        results = [[] for _ in crops_list]
+        with get_reader_pool().reader(timeout=timeout) as reader:
+            for items in groups.values():
+                batch_results = reader.readtext_batched(
+                    [array for _, array, _ in items],
+                    detail=1,
+                    batch_size=batch_size,
+                )
+                for (index, _, origin), crop_results in zip(items, batch_results):
+                    results[index].extend(offset_detections(crop_results, origin))
+        return results
+
+
+class TesseractBackend(OcrBackend):
+    """
+    Tesseract via pytesseract : beaucoup plus rapide qu'EasyOCR sur CPU pour
+    ce texte imprimé sur fond uni. Une détection par mot : un libellé et son
+    nombre sont réassemblés par l'ordre de lecture (stats/extraction.py)
+    """
+    name = 'tesseract'
+
+    def __init__(self, lang='eng', config='--psm 11'):
+        self.lang = lang
+        self.config = config
+        self._available = None
+
+    def available(self):
+        if self._available is None:
+            try:
+                import pytesseract
+                pytesseract.get_tesseract_version()
+                self._available = True
+            except Exception as e:
+                logger.warning("Tesseract indisponible, moteur ignoré : %s", e)
+                self._available = False
+        return self._available
+
+    def readtext(self, array):
+        import pytesseract
+
+        # Tableau BGR (format EasyOCR) -> image PIL RGB
+        image = Image.fromarray(np.ascontiguousarray(array[:, :, ::-1]))
+        data = pytesseract.image_to_data(
+            image, lang=self.lang, config=self.config, output_type=pytesseract.Output.DICT
+        )
+        results = []
+        for text, conf, left, top, width, height in zip(
+            data['text'], data['conf'], data['left'], data['top'], data['width'], data['height']
+        ):
+            conf = float(conf)
+            if conf < 0 or not text.strip():
+                continue
+            bbox = [[left, top], [left + width, top], [left + width, top + height], [left, top + height]]
+            results.append((bbox, text, conf / 100))
+        return results
+
+
+BACKENDS = {
+    'easyocr': EasyOcrBackend,
+    'tesseract': TesseractBackend,
+}
+
+
+# === LATENCE PAR MOTEUR ===
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def _record(name, crops, seconds, fallback_zones=0):
+    with _metrics_lock:
+        data = _metrics.setdefault(name, {
+            'calls': 0, 'crops': 0, 'fallback_zones': 0,
+            'seconds_total': 0.0, 'seconds_max': 0.0,
+        })
+        data['calls'] += 1
+        data['crops'] += crops
+        data['fallback_zones'] += fallback_zones
+        data['seconds_total'] += seconds
+        data['seconds_max'] = max(data['seconds_max'], seconds)
+
+
+def backend_stats():
+    """
+    Latence par moteur : appels, crops lus, zones relues en repli, durées
+    """
+    with _metrics_lock:
+        stats = {name: dict(data) for name, data in _metrics.items()}
+    for data in stats.values():
+        data['seconds_avg'] = data['seconds_total'] / data['calls'] if data['calls'] else 0.0
+    return stats
+
+
+_retry_metrics = {'attempts': 0, 'steps': 0, 'recovered_zones': 0, 'unrecovered_zones': 0, 'budget_exhausted': 0}
+
+
+def retry_stats():
+    """
+    Relectures des zones manquées : images concernées, étapes lancées,
+    zones récupérées ou non, budget de temps épuisé
+    """
+    with _metrics_lock:
+        return dict(_retry_metrics)
+
+
+def _count_retry(**values):
+    with _metrics_lock:
+        for name, value in values.items():
+            _retry_metrics[name] += value
+
+
+def _timed_read(backend, crops, fallback_zones=0):
+    start = time.perf_counter()
+    with span(f'ocr_{backend.name}'):
+        results = backend.read_crops(crops)
+    _record(backend.name, len(crops), time.perf_counter() - start, fallback_zones)
+    return results
+
+
+# === POLITIQUE : MOTEUR RAPIDE PUIS REPLI PAR ZONE ===
+
+_backends = None
+_backends_lock = threading.Lock()
+
+
+def get_backends():
+    """
+    Moteurs disponibles dans l'ordre de OCR_BACKENDS (options dans
+    OCR_BACKEND_OPTIONS) ; EasyOCR sert de dernier recours s'il n'y en a aucun
+    """
+    global _backends
+    if _backends is None:
+        with _backends_lock:
+            if _backends is None:
+                options = getattr(settings, 'OCR_BACKEND_OPTIONS', {})
+                backends = []
+                for name in getattr(settings, 'OCR_BACKENDS', ['easyocr']):
+                    backend = BACKENDS[name](**options.get(name, {}))
+                    if backend.available():
+                        backends.append(backend)
+                _backends = backends or [EasyOcrBackend()]
+    return _backends
+
+
+def backend_signature():
+    return ','.join(backend.name for backend in get_backends())
+
+
+def _zone_box(zone):
+    """
+    Rectangle (x0, y0, x1, y1) d'une zone, déduit de ses règles (None : non borné)
+    """
+    box = {'x': [None, None], 'y': [None, None]}
+    for axis, op, value in zone['rules']:
+        bound = 0 if op in ('>', '>=') else 1
+        current = box[axis][bound]
+        box[axis][bound] = value if current is None else (max if bound == 0 else min)(current, value)
+    return box['x'][0], box['y'][0], box['x'][1], box['y'][1]
+
+
+def zone_crops(crops, zones, layout=None):
+    """
+    Découpe, dans les crops déjà préparés, le rectangle de chaque zone à relire
+    Retourne des crops (nom de zone, tableau, origine) au même format
+    """
+    layout = layout or get_layout()
+    padding = layout.get('band_padding', 20)
+    result = []
+    for zone in layout['zones']:
+        if zone['name'] not in zones:
+            continue
+        x0, y0, x1, y1 = _zone_box(zone)
+        for _, array, (ox, oy) in crops:
+            height, width = array.shape[:2]
+            left = max(0, (x0 or 0) - padding - ox)
+            top = max(0, (y0 or 0) - padding - oy)
+            right = width if x1 is None else min(width, x1 + padding - ox)
+            bottom = height if y1 is None else min(height, y1 + padding - oy)
+            if right > left and bottom > top:
+                sub = np.ascontiguousarray(array[top:bottom, left:right])
+                result.append((zone['name'], sub, (ox + left, oy + top)))
+    return result
+
+
+def _zone_scores(results, layout):
+    """
+    Par zone à extraire : (nombre de champs lus, confiance moyenne)
+    """
+    zones = group_by_zone(results, layout)
+    kpi_data = extract_kpis(zones, layout)
+    scores = {}
+    for zone in layout['zones']:
+        if not zone.get('fields'):
+            continue
+        items = zones.get(zone['name'], [])
+        found = sum(1 for field in zone['fields'].values() if field in kpi_data)
+        confidence = sum(item['confidence'] for item in items) / len(items) if items else 0.0
+        scores[zone['name']] = (found, confidence)
+    return scores
+
+
+def weak_zones(results, layout=None, min_confidence=None):
+    """
+    Zones dont un champ manque ou dont la confiance moyenne est trop basse
+    """
+    layout = layout or get_layout()
+    if min_confidence is None:
+        min_confidence = getattr(settings, 'OCR_FALLBACK_MIN_CONFIDENCE', 0.6)
+    expected = {zone['name']: len(zone['fields']) for zone in layout['zones'] if zone.get('fields')}
+    return [
+        name for name, (found, confidence) in _zone_scores(results, layout).items()
+        if found < expected[name] or confidence < min_confidence
+    ]
+
+
+def _zone_of(results, layout):
+    x, y, confidence, texts = detections_to_arrays(results)
+    names = zone_names(layout)
+    return [names[index] if index >= 0 else None for index in classify(x, y, confidence, texts, layout)]
+
+
+def merge_zones(results, fresh, zones, layout=None):
+    """
+    Remplace, zone par zone, les détections de `results` par celles de
+    `fresh` quand ces dernières donnent plus de champs (ou autant, plus
+    confiants). Retourne (détections fusionnées, zones remplacées)
+    """
+    layout = layout or get_layout()
+    old_scores = _zone_scores(results, layout)
+    new_scores = _zone_scores(fresh, layout)
+    replaced = {name for name in zones if new_scores.get(name, (0, 0.0)) > old_scores.get(name, (0, 0.0))}
+    if not replaced:
+        return results, []
+
+    merged = [det for det, zone in zip(results, _zone_of(results, layout)) if zone not in replaced]
+    merged.extend(det for det, zone in zip(fresh, _zone_of(fresh, layout)) if zone in replaced)
+    return merged, sorted(replaced)
+
+
+def read_zones(crops, backends=None, layout=None, results=None):
+    """
+    Lit les crops avec le premier moteur (le plus rapide), puis relit avec
+    les suivants uniquement les zones manquantes ou peu confiantes.
+    `results` : détections déjà lues avec le premier moteur (read_zones_batch)
+    """
+    backends = backends or get_backends()
+    layout = layout or get_layout()
+
+    if results is None:
+        results = _timed_read(backends[0], crops)
+    used = [backends[0].name]
+    for backend in backends[1:]:
+        if not backend.available():
+            continue
+        weak = weak_zones(results, layout)
+        if not weak:
+            break
+        logger.debug("zones relues avec %s : %s", backend.name, weak)
+        try:
+            fresh = _timed_read(backend, zone_crops(crops, weak, layout), len(weak))
+        except Exception:
+            # Repli en échec : le résultat du moteur précédent reste valable
+            logger.exception("Relecture avec %s en échec, zones %s gardées", backend.name, weak)
+            break
+        results, replaced = merge_zones(results, fresh, weak, layout)
+        if replaced:
+            used.append(backend.name)
+    set_attribute('ocr_backends', ','.join(used))
+    return results
+
+
+def read_zones_batch(crops_list, backends=None, layout=None):
+    """
+    read_zones pour plusieurs images : le premier moteur lit tout le lot
+    (par lots pour EasyOCR), puis chaque image suit la même politique de repli.
+    Retourne une liste de détections par image
+    """
+    backends = backends or get_backends()
+    layout = layout or get_layout()
+
+    first = backends[0]
+    start = time.perf_counter()
+    with span(f'ocr_{first.name}'):
+        batch = first.read_batch(crops_list)
+    _record(first.name, sum(len(crops) for crops in crops_list), time.perf_counter() - start)
+    return [read_zones(crops, backends, layout, results) for crops, results in zip(crops_list, batch)]
+
+
+def retry_missing_zones(crops, results, backend=None, layout=None, budget=None):
+    """
+    Relit uniquement les zones dont un champ manque, avec des prétraitements
+    de plus en plus poussés (get_retry_steps), tant que le budget de temps
+    (OCR_RETRY_BUDGET, secondes) n'est pas épuisé. Chaque relecture n'est
+    gardée que si elle améliore la zone (merge_zones)
+    Retourne (détections fusionnées, zones récupérées)
+    """
+    if not getattr(settings, 'OCR_RETRY_ENABLED', True):
+        return results, []
+    layout = layout or get_layout()
+    backend = backend or get_backends()[-1]  # Le moteur le plus précis disponible
+    if not backend.available():
+        return results, []
+    if budget is None:
+        budget = getattr(settings, 'OCR_RETRY_BUDGET', 4.0)
+
+    missing = weak_zones(results, layout, min_confidence=0)
+    if not missing:
+        return results, []
+
+    start = time.perf_counter()
+    recovered = []
+    steps = 0
+    with span('ocr_retry'):
+        for step in get_retry_steps():
+            if time.perf_counter() - start >= budget:
+                _count_retry(budget_exhausted=1)
+                break
+            steps += 1
+            enhanced = []
+            scale = step.get('scale', 1)
+            for name, array, (x0, y0) in zone_crops(crops, missing, layout):
+                # Origine exprimée à l'échelle agrandie : une seule remise à l'échelle ensuite
+                enhanced.append((name, enhance_crop(array, step)[0], (x0 * scale, y0 * scale)))
+            try:
+                fresh = scale_detections(_timed_read(backend, enhanced, len(missing)), scale)
+            except Exception:
+                logger.exception("Relecture avec %s en échec", backend.name)
+                break
+            results, replaced = merge_zones(results, fresh, missing, layout)
+            recovered.extend(replaced)
+            missing = weak_zones(results, layout, min_confidence=0)
+            if not missing:
+                break
+
+    recovered = sorted(set(recovered) - set(missing))
+    _count_retry(attempts=1, steps=steps, recovered_zones=len(recovered), unrecovered_zones=len(missing))
+    logger.debug("relecture : %s étape(s), zones récupérées %s, manquantes %s", steps, recovered, missing)
+    set_attribute('retried_zones', ','.join(recovered))
+    return results, recovered
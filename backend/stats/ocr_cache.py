@@ -0,0 +1,151 @@
+# stats/ocr_cache.py
+
+import hashlib
+import threading
+from datetime import timedelta
+from importlib import metadata
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from . import ocr_stack
+from .models import OcrCacheEntry
+
+
+_counters = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+_counters_lock = threading.Lock()
+
+
+def _count(name, value=1):
+    with _counters_lock:
+        _counters[name] += value
+
+
+def file_digest(image_file, chunk_size=64 * 1024):
+    """
+    Empreinte SHA-256 calculée par morceaux, sans charger le fichier en mémoire
+    """
+    digest = hashlib.sha256()
+    image_file.seek(0)
+    if hasattr(image_file, 'chunks'):
+        chunks = image_file.chunks(chunk_size)
+    else:
+        chunks = iter(lambda: image_file.read(chunk_size), b'')
+    for chunk in chunks:
+        digest.update(chunk)
+    image_file.seek(0)
+    return digest.hexdigest()
+
+
+def model_signature():
+    """
+    Identifie la configuration OCR : une entrée produite avec d'autres langues,
+    une autre version d'EasyOCR, d'autres moteurs, une autre disposition (ROI)
+    ou un autre OCR_CACHE_VERSION est ignorée
+    """
+    try:
+        easyocr_version = metadata.version('easyocr')
+    except metadata.PackageNotFoundError:
+        easyocr_version = 'unknown'
+    languages = ','.join(getattr(settings, 'OCR_LANGUAGES', ['en']))
+    version = getattr(settings, 'OCR_CACHE_VERSION', 1)
+    layout = ocr_stack.get_layout()
+    roi = f"{layout['name']}:{layout['reference_width']}" if getattr(settings, 'OCR_ROI_ENABLED', True) else 0
+    return f"easyocr={easyocr_version}|lang={languages}|backends={ocr_stack.backend_signature()}|roi={roi}|v={version}"
+
+
+def _is_enabled():
+    return getattr(settings, 'OCR_CACHE_ENABLED', True)
+
+
+def serialize_detections(results):
+    """
+    Détections en types Python natifs (les bbox EasyOCR contiennent des types numpy)
+    """
+    return [
+        [[[float(x), float(y)] for x, y in bbox], text, float(confidence)]
+        for bbox, text, confidence in results
+    ]
+
+
+def get_cached_detections(digest):
+    """
+    Retourne les détections brutes (bbox, text, confidence) en cache, ou None
+    """
+    if not _is_enabled():
+        return None
+
+    ttl = getattr(settings, 'OCR_CACHE_TTL', 7 * 24 * 3600)
+    entry = (
+        OcrCacheEntry.objects
+        .filter(digest=digest, signature=model_signature(), created_at__gte=timezone.now() - timedelta(seconds=ttl))
+        .only('pk', 'detections')
+        .first()
+    )
+    if entry is None:
+        _count('misses')
+        return None
+
+    OcrCacheEntry.objects.filter(pk=entry.pk).update(last_used_at=timezone.now(), hits=F('hits') + 1)
+    _count('hits')
+    return [(bbox, text, confidence) for bbox, text, confidence in entry.detections]
+
+
+def store_detections(digest, results):
+    """
+    Enregistre les détections d'une image puis applique la limite de taille (LRU)
+    """
+    if not _is_enabled():
+        return
+
+    OcrCacheEntry.objects.update_or_create(
+        digest=digest,
+        signature=model_signature(),
+        defaults={'detections': serialize_detections(results), 'created_at': timezone.now(), 'last_used_at': timezone.now()},
+    )
+    _count('stores')
+    evict()
+
+
+def evict():
+    """
+    Supprime les entrées expirées puis les moins récemment utilisées au-delà
+    de OCR_CACHE_MAX_ENTRIES. Retourne le nombre d'entrées supprimées
+    """
+    ttl = getattr(settings, 'OCR_CACHE_TTL', 7 * 24 * 3600)
+    max_entries = getattr(settings, 'OCR_CACHE_MAX_ENTRIES', 1000)
+
+    deleted, _ = OcrCacheEntry.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=ttl)).delete()
+
+    overflow = OcrCacheEntry.objects.order_by('-last_used_at').values_list('pk', flat=True)[max_entries:]
+    overflow_ids = list(overflow)
+    if overflow_ids:
+        extra, _ = OcrCacheEntry.objects.filter(pk__in=overflow_ids).delete()
+        deleted += extra
+
+    if deleted:
+        _count('evictions', deleted)
+    return deleted
+
+
+def invalidate_ocr_cache(stale_only=False):
+    """
+    Vide le cache. Avec stale_only, ne supprime que les entrées produites
+    avec une autre configuration OCR (modèle, langues, version)
+    """
+    entries = OcrCacheEntry.objects.all()
+    if stale_only:
+        entries = entries.exclude(signature=model_signature())
+    deleted, _ = entries.delete()
+    return deleted
+
+
+def cache_stats():
+    with _counters_lock:
+        data = dict(_counters)
+    lookups = data['hits'] + data['misses']
+    data['hit_rate'] = data['hits'] / lookups if lookups else 0.0
+    data['entries'] = OcrCacheEntry.objects.count()
+    data['signature'] = model_signature()
+    return data
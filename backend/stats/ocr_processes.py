@@ -0,0 +1,253 @@
+# stats/ocr_processes.py
+
+import asyncio
+import gc
+import io
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+
+class OcrPoolSaturated(Exception):
+    """Toutes les places (workers + file d'attente) sont prises : réessayer plus tard"""
+
+
+class OcrPoolUnavailable(Exception):
+    """Pool de processus cassé ou OCR trop long"""
+
+
+# Reader construit dans le parent avant le fork : ses poids sont partagés
+# (copy-on-write) par tous les workers au lieu d'être rechargés par chacun
+_preloaded_reader = None
+
+
+def _init_worker(torch_threads, cpu_slots, next_slot):
+    from django.apps import apps
+    if not apps.ready:
+        # Processus lancé par "spawn" : Django doit être initialisé avant tout import de modèle
+        import django
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'statMulti.settings')
+        django.setup()
+
+    # Threads intra-op de torch limités par worker : sans cela chaque
+    # processus prend tous les cœurs et ils se gênent
+    os.environ['OMP_NUM_THREADS'] = str(torch_threads)
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+
+    # Affinité : chaque worker reçoit sa propre tranche de cœurs
+    if cpu_slots and hasattr(os, 'sched_setaffinity'):
+        with next_slot.get_lock():
+            slot = next_slot.value
+            next_slot.value += 1
+        os.sched_setaffinity(0, cpu_slots[slot % len(cpu_slots)])
+
+    # Un worker traite une image à la fois : un seul Reader par processus,
+    # OCR_READER_POOL_SIZE vaut pour les processus serveur
+    from .reader_pool import get_reader_pool
+    if _preloaded_reader is not None:
+        get_reader_pool().adopt([_preloaded_reader])
+    else:
+        get_reader_pool().resize(1)
+
+
+def _run_ocr(image_bytes):
+    # Exécuté dans un processus du pool : pool de Readers et connexions propres au processus
+    from .utils import extract_kpi_with_easyocr
+    return extract_kpi_with_easyocr(io.BytesIO(image_bytes))
+
+
+def _ping():
+    return os.getpid()
+
+
+def _cpu_slots(workers, threads):
+    # Tranches de `threads` cœurs parmi ceux autorisés pour le processus
+    if not hasattr(os, 'sched_getaffinity'):
+        return []
+    cpus = sorted(os.sched_getaffinity(0))
+    if len(cpus) < workers * threads:
+        return []
+    return [set(cpus[i * threads:(i + 1) * threads]) for i in range(workers)]
+
+
+def process_memory(pid):
+    """
+    Mémoire d'un processus (Linux, /proc) en Ko : rss, pss (part des pages
+    partagées imputée au processus), shared et private. None si indisponible
+    """
+    fields = {'Rss': 'rss', 'Pss': 'pss', 'Shared_Clean': 'shared', 'Shared_Dirty': 'shared',
+              'Private_Clean': 'private', 'Private_Dirty': 'private'}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as smaps:
+            lines = smaps.readlines()
+    except OSError:
+        return None
+    memory = {'rss': 0, 'pss': 0, 'shared': 0, 'private': 0}
+    for line in lines:
+        name, _, value = line.partition(':')
+        if name in fields:
+            memory[fields[name]] += int(value.split()[0])
+    return memory
+
+
+class OcrProcessPool:
+    """
+    Pool borné de processus pour l'OCR (travail CPU) appelé depuis les vues
+    async : la boucle d'événements n'est jamais bloquée. Au-delà de
+    `workers + queue_size` OCR en cours, run lève OcrPoolSaturated.
+
+    Avec `preload` (start_method "fork"), le modèle EasyOCR est chargé une
+    fois dans le parent puis tous les workers sont forkés en même temps :
+    les poids sont partagés en copy-on-write au lieu d'être dupliqués.
+    """
+
+    def __init__(self, workers=2, queue_size=4, start_method='spawn', preload=False,
+                 torch_threads=None, cpu_affinity=False):
+        self.workers = max(1, int(workers))
+        self.queue_size = max(0, int(queue_size))
+        self.start_method = start_method
+        self.preload = preload and start_method == 'fork'
+        self.torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // self.workers)
+        self.cpu_affinity = cpu_affinity
+        self._lock = threading.Lock()
+        self._executor = None
+        self._in_flight = 0
+        self.metrics = {'submitted': 0, 'rejected': 0, 'failed': 0, 'preload_seconds': None}
+
+    def _preload(self):
+        global _preloaded_reader
+        if _preloaded_reader is None:
+            from .reader_pool import ReaderPool
+            start = time.perf_counter()
+            # Construction seule, sans inférence : aucun thread OpenMP actif au fork
+            _preloaded_reader = ReaderPool(
+                languages=getattr(settings, 'OCR_LANGUAGES', ['en']),
+                gpu=getattr(settings, 'OCR_GPU', False),
+            )._build_reader()
+            self.metrics['preload_seconds'] = time.perf_counter() - start
+        # Objets existants exclus du GC : ses passages n'écrivent plus dans
+        # leurs pages, qui restent partagées avec les workers
+        gc.freeze()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                if self.preload:
+                    self._preload()
+                context = multiprocessing.get_context(self.start_method)
+                slots = _cpu_slots(self.workers, self.torch_threads) if self.cpu_affinity else []
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(self.torch_threads, slots, context.Value('i', 0)),
+                )
+            return self._executor
+
+    def start(self):
+        """
+        Crée les workers tout de suite (au démarrage du serveur plutôt qu'au
+        premier upload). Avec "fork", tous sont forkés dès la première tâche
+        """
+        self._get_executor().submit(_ping).result()
+        return self.worker_pids()
+
+    def worker_pids(self):
+        with self._lock:
+            executor = self._executor
+        if executor is None:
+            return []
+        # Pas d'API publique pour lister les processus d'un ProcessPoolExecutor
+        return sorted(getattr(executor, '_processes', None) or {})
+
+    def _reserve(self):
+        with self._lock:
+            if self._in_flight >= self.workers + self.queue_size:
+                self.metrics['rejected'] += 1
+                raise OcrPoolSaturated(f"{self._in_flight} OCR en cours, capacité {self.workers + self.queue_size}")
+            self._in_flight += 1
+            self.metrics['submitted'] += 1
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    async def run(self, image_bytes, timeout=None):
+        """
+        Lance l'OCR dans un processus et attend le résultat sans bloquer la boucle.
+        La place est libérée à la fin réelle du calcul, même après un timeout
+        """
+        self._reserve()
+        try:
+            future = self._get_executor().submit(_run_ocr, image_bytes)
+        except BrokenProcessPool as e:
+            self._release()
+            self._discard()
+            raise OcrPoolUnavailable(f"Pool OCR indisponible : {e}")
+        future.add_done_callback(lambda _: self._release())
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except BrokenProcessPool as e:
+            self._discard()
+            raise OcrPoolUnavailable(f"Pool OCR indisponible : {e}")
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.metrics['failed'] += 1
+            raise OcrPoolUnavailable(f"OCR non terminé après {timeout}s")
+
+    def _discard(self):
+        # Un processus mort casse tout l'exécuteur : le prochain appel en recrée un
+        with self._lock:
+            self.metrics['failed'] += 1
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            data = {
+                **self.metrics,
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'in_flight': self._in_flight,
+                'queue_depth': max(0, self._in_flight - self.workers),  # OCR en attente d'un worker
+                'start_method': self.start_method,
+                'preload': self.preload,
+                'torch_threads': self.torch_threads,
+            }
+        data['parent'] = {'pid': os.getpid(), 'memory_kb': process_memory(os.getpid())}
+        data['processes'] = [{'pid': pid, 'memory_kb': process_memory(pid)} for pid in self.worker_pids()]
+        return data
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_ocr_process_pool():
+    """
+    Retourne le pool du processus, créé à partir des settings OCR_PROCESS_*
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = OcrProcessPool(
+                    workers=getattr(settings, 'OCR_PROCESS_WORKERS', 2),
+                    queue_size=getattr(settings, 'OCR_PROCESS_QUEUE_SIZE', 4),
+                    start_method=getattr(settings, 'OCR_PROCESS_START_METHOD', 'spawn'),
+                    preload=getattr(settings, 'OCR_PROCESS_PRELOAD', False),
+                    torch_threads=getattr(settings, 'OCR_PROCESS_TORCH_THREADS', None),
+                    cpu_affinity=getattr(settings, 'OCR_PROCESS_CPU_AFFINITY', False),
+                )
+    return _pool
@@ -0,0 +1,113 @@
+# stats/ocr_stack.py
+#
+# Façade de la pile OCR / image : numpy, Pillow, EasyOCR (torch), pytesseract
+# et les modules stats qui en dépendent ne sont importés qu'au premier accès
+# à un de leurs noms (ocr_stack.prepare_image, ocr_stack.Image...). Les
+# processus sans OCR (migrations, admin, API en lecture) ne les chargent pas.
+
+import importlib
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+
+class InvalidUpload(ValueError):
+    """Fichier envoyé illisible comme image"""
+
+
+class ImageTooLarge(InvalidUpload):
+    """Fichier ou nombre de pixels au-delà des limites configurées"""
+
+
+# Nom exposé -> (module, attribut) ; attribut None : le module lui-même
+LAZY_NAMES = {
+    'np': ('numpy', None),
+    'Image': ('PIL.Image', None),
+    'check_upload_limits': ('stats.preprocessing', 'check_upload_limits'),
+    'prepare_image': ('stats.preprocessing', 'prepare_image'),
+    'offset_detections': ('stats.preprocessing', 'offset_detections'),
+    'get_layout': ('stats.layout', 'get_layout'),
+    'group_by_zone': ('stats.layout', 'group_by_zone'),
+    'group_by_zone_batch': ('stats.layout', 'group_by_zone_batch'),
+    'extract_kpis': ('stats.extraction', 'extract_kpis'),
+    'extract_kpis_batch': ('stats.extraction', 'extract_kpis_batch'),
+    'read_zones': ('stats.ocr_backends', 'read_zones'),
+    'read_zones_batch': ('stats.ocr_backends', 'read_zones_batch'),
+    'retry_missing_zones': ('stats.ocr_backends', 'retry_missing_zones'),
+    'backend_signature': ('stats.ocr_backends', 'backend_signature'),
+    'backend_stats': ('stats.ocr_backends', 'backend_stats'),
+    'retry_stats': ('stats.ocr_backends', 'retry_stats'),
+}
+
+# Dépendances lourdes suivies par stack_status et import_profile
+HEAVY_MODULES = ['numpy', 'PIL.Image', 'cv2', 'torch', 'easyocr', 'pytesseract']
+
+_load_seconds = {}
+_lock = threading.Lock()
+
+
+def __getattr__(name):
+    if name not in LAZY_NAMES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module_name, attribute = LAZY_NAMES[name]
+    with _lock:
+        already = module_name in sys.modules
+        start = time.perf_counter()
+        module = importlib.import_module(module_name)
+        if not already:
+            _load_seconds[module_name] = time.perf_counter() - start
+    value = module if attribute is None else getattr(module, attribute)
+    # Mis en cache dans le module : __getattr__ n'est plus appelé pour ce nom
+    globals()[name] = value
+    return value
+
+
+def stack_status():
+    """
+    Dépendances lourdes chargées dans ce processus et durée des chargements
+    déclenchés par la façade (secondes)
+    """
+    with _lock:
+        load_seconds = dict(_load_seconds)
+    return {
+        'loaded': [name for name in HEAVY_MODULES if name in sys.modules],
+        'load_seconds': load_seconds,
+    }
+
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def import_profile(statements, top=20, settings_module=None):
+    """
+    Profil d'import (python -X importtime) d'un nouveau processus qui
+    initialise Django puis exécute `statements` (ex: "import stats.urls").
+    Retourne {'total_ms', 'modules': [(module, cumulé ms, propre ms)], 'heavy': {module: cumulé ms}}
+    """
+    # django.setup() seul : pas de warm-up OCR (réservé à wsgi.py / asgi.py)
+    code = "import django; django.setup()\n" + '\n'.join(statements)
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings_module} if settings_module else None
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, env=env, check=False,
+    )
+    total_ms = (time.perf_counter() - start) * 1000
+    if completed.returncode:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else 'échec')
+
+    modules = {}
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            own, cumulative, _, name = match.groups()
+            modules[name] = (int(cumulative) / 1000, int(own) / 1000)
+    ranked = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)
+    return {
+        'total_ms': total_ms,
+        'modules': [(name, cumulative, own) for name, (cumulative, own) in ranked[:top]],
+        'heavy': {name: modules[name][0] for name in HEAVY_MODULES if name in modules},
+    }
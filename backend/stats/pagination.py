@@ -0,0 +1,9 @@
+from rest_framework.pagination import CursorPagination
+
+
+class KpiDailyCursorPagination(CursorPagination):
+    """Pagination par curseur, dans l'ordre du modèle : date décroissante puis moment"""
+    ordering = ('-date', 'moment')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
@@ -0,0 +1,182 @@
+# stats/preprocessing.py
+
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from PIL import Image, ImageEnhance, ImageFilter, ImageOps
+
+from .layout import get_layout, layout_bands
+from .ocr_stack import ImageTooLarge, InvalidUpload
+from .tracing import set_attribute
+
+
+# Prétraitements de plus en plus poussés pour relire une zone manquée :
+# contraste, puis netteté, puis agrandissement (voir enhance_crop)
+RETRY_STEPS = [
+    {'contrast': 2.0},
+    {'contrast': 2.0, 'sharpen': True},
+    {'contrast': 2.5, 'sharpen': True, 'scale': 2},
+]
+
+
+def _check_pixels(img):
+    max_pixels = getattr(settings, 'OCR_MAX_PIXELS', 25_000_000)
+    if img.width * img.height > max_pixels:
+        raise ImageTooLarge(f"Image trop grande ({img.width}x{img.height}), maximum {max_pixels} pixels")
+
+
+@contextmanager
+def open_upload(image_file):
+    """
+    Image.open avec les erreurs de Pillow traduites : bombe de décompression
+    (en-tête annonçant trop de pixels) -> ImageTooLarge, fichier illisible
+    ou tronqué -> InvalidUpload
+    """
+    try:
+        with Image.open(image_file) as img:
+            yield img
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(f"Image trop grande : {e}")
+    except (OSError, SyntaxError):
+        raise InvalidUpload("Le fichier envoyé n'est pas une image valide")
+
+
+def check_upload_limits(image_file):
+    """
+    Vérifie taille du fichier et nombre de pixels sans décoder l'image
+    (en-tête, puis structure du fichier par verify()). Retourne (largeur, hauteur)
+    """
+    max_bytes = getattr(settings, 'OCR_MAX_UPLOAD_BYTES', 10 * 1024 * 1024)
+    size = getattr(image_file, 'size', None)
+    if size is not None and size > max_bytes:
+        raise ImageTooLarge(f"Fichier trop volumineux ({size} octets), maximum {max_bytes}")
+
+    image_file.seek(0)
+    try:
+        with open_upload(image_file) as img:
+            _check_pixels(img)
+            dimensions = img.size
+            img.verify()  # Fichier tronqué ou corrompu : refusé avant l'OCR
+    finally:
+        image_file.seek(0)
+    return dimensions
+
+
+def normalize_image(image):
+    """
+    Ramène l'image à la largeur de référence de la disposition (RGB, orientation EXIF appliquée)
+    Retourne (image, facteur d'échelle appliqué)
+    """
+    image = ImageOps.exif_transpose(image).convert('RGB')
+    width = get_layout()['reference_width']
+    scale = width / image.width
+    if scale != 1:
+        height = max(1, round(image.height * scale))
+        image = image.resize((width, height), Image.Resampling.LANCZOS)
+    return image, scale
+
+
+def to_ocr_array(image):
+    """
+    Convertit une image PIL RGB en tableau BGR (format ndarray d'EasyOCR)
+    """
+    return np.ascontiguousarray(np.asarray(image)[:, :, ::-1])
+
+
+def crop_zones(image):
+    """
+    Découpe les bandes utiles d'une image normalisée (voir layout_bands)
+    Retourne une liste de (nom, tableau BGR, (x0, y0)) ; (x0, y0) est l'origine
+    du crop dans l'image normalisée
+    """
+    layout = get_layout()
+    padding = layout.get('band_padding', 20)
+    crops = []
+    for name, top, bottom in layout_bands(layout):
+        y0 = max(0, top - padding)
+        y1 = image.height if bottom is None else min(image.height, bottom + padding)
+        if y1 <= y0:
+            continue
+        crop = image.crop((0, y0, image.width, y1))
+        crops.append((name, to_ocr_array(crop), (0, y0)))
+    return crops
+
+
+def offset_detections(detections, origin):
+    """
+    Replace les bbox d'un crop dans le repère de l'image normalisée
+    """
+    x0, y0 = origin
+    return [
+        ([[x + x0, y + y0] for x, y in bbox], text, confidence)
+        for bbox, text, confidence in detections
+    ]
+
+
+def prepare_image(image_file):
+    """
+    Décode, normalise et découpe une image en zones prêtes pour l'OCR
+    L'image est lue directement depuis le fichier (upload temporaire ou
+    mémoire de Django) et décodée une seule fois.
+    Avec OCR_ROI_ENABLED = False, l'image entière est retournée telle quelle
+    """
+    image_file.seek(0)
+    with open_upload(image_file) as img:
+        _check_pixels(img)
+        set_attribute('image_width', img.width)
+        set_attribute('image_height', img.height)
+        if not getattr(settings, 'OCR_ROI_ENABLED', True):
+            return [('full', to_ocr_array(img.convert('RGB')), (0, 0))]
+        # JPEG : décoder directement à une résolution proche de la cible
+        width = get_layout()['reference_width']
+        img.draft('RGB', (width, max(1, round(img.height * width / img.width))))
+        image, _ = normalize_image(img)
+    return crop_zones(image)
+
+
+def get_retry_steps():
+    """
+    Étapes de relecture : OCR_RETRY_STEPS dans les settings, sinon RETRY_STEPS
+    """
+    return getattr(settings, 'OCR_RETRY_STEPS', None) or RETRY_STEPS
+
+
+def enhance_crop(array, step):
+    """
+    Applique une étape de prétraitement à un crop BGR : niveaux de gris,
+    contraste (ImageEnhance), netteté (ImageFilter), agrandissement
+    Retourne (tableau BGR, facteur d'agrandissement)
+    """
+    image = ImageOps.grayscale(Image.fromarray(np.ascontiguousarray(array[:, :, ::-1])))
+    if step.get('contrast'):
+        image = ImageOps.autocontrast(image)
+        image = ImageEnhance.Contrast(image).enhance(step['contrast'])
+    if step.get('sharpen'):
+        image = image.filter(ImageFilter.UnsharpMask(radius=2, percent=150, threshold=3))
+    scale = step.get('scale', 1)
+    if scale != 1:
+        image = image.resize((image.width * scale, image.height * scale), Image.Resampling.LANCZOS)
+    return to_ocr_array(image.convert('RGB')), scale
+
+
+def scale_detections(detections, scale):
+    """
+    Ramène les bbox lues sur un crop agrandi à l'échelle du crop d'origine
+    """
+    if scale == 1:
+        return detections
+    return [
+        ([[x / scale, y / scale] for x, y in bbox], text, confidence)
+        for bbox, text, confidence in detections
+    ]
+
+
+def readtext_zones(reader, crops):
+    """
+    Lance l'OCR sur chaque zone et fusionne les détections dans le repère normalisé
+    """
+    results = []
+    for _, array, origin in crops:
+        results.extend(offset_detections(reader.readtext(array, detail=1), origin))
+    return results
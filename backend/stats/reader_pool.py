@@ -0,0 +1,177 @@
+# stats/reader_pool.py
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from queue import Empty, Queue
+
+from django.conf import settings
+
+from .tracing import span
+
+
+class ReaderPoolTimeout(Exception):
+    """Aucun Reader libre dans le délai imparti"""
+
+
+class ReaderPool:
+    """
+    Pool de taille fixe de `easyocr.Reader` partagé par tout le processus.
+
+    Les modèles (détection + reconnaissance) sont chargés une seule fois au
+    warm-up, puis chaque appel emprunte un Reader et le rend à la fin.
+    Après un fork (gunicorn, multiprocessing) le processus enfant repart
+    d'un pool vide : les verrous et la file hérités du parent ne sont pas
+    fiables, les Readers sont donc reconstruits au premier emprunt.
+    """
+
+    def __init__(self, size=1, languages=('en',), gpu=False):
+        self.size = max(1, int(size))
+        self.languages = list(languages)
+        self.gpu = gpu
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._readers = Queue(maxsize=self.size)
+        self._built = 0
+        self.metrics = {
+            'warmup_seconds': None,
+            'readers_built': 0,
+            'acquisitions': 0,
+            'timeouts': 0,
+            'in_use': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+        }
+
+    def _build_reader(self):
+        import easyocr
+        return easyocr.Reader(self.languages, gpu=self.gpu)
+
+    def _check_process(self):
+        if os.getpid() != self._pid:
+            self._reset()
+
+    def warm_up(self):
+        """
+        Construit tous les Readers manquants, retourne la durée en secondes.
+        Chaque place est réservée sous le verrou puis le Reader est construit
+        hors verrou : stats() et les emprunts ne sont pas bloqués pendant le
+        chargement des modèles, et la durée mesurée n'inclut aucune attente
+        """
+        self._check_process()
+        while True:
+            with self._lock:
+                if self._built >= self.size:
+                    break
+                self._built += 1
+            start = time.perf_counter()
+            try:
+                reader = self._build_reader()
+            except Exception:
+                with self._lock:
+                    self._built -= 1
+                raise
+            built_in = time.perf_counter() - start
+            self._readers.put(reader)
+            with self._lock:
+                self.metrics['readers_built'] += 1
+                # Durée du premier remplissage : somme des constructions
+                if self.metrics['readers_built'] <= self.size:
+                    self.metrics['warmup_seconds'] = (self.metrics['warmup_seconds'] or 0.0) + built_in
+        with self._lock:
+            return self.metrics['warmup_seconds']
+
+    def resize(self, size):
+        """
+        Change la taille du pool ; les Readers déjà construits sont abandonnés
+        (à appeler avant tout emprunt, ex: à l'initialisation d'un processus)
+        """
+        self.size = max(1, int(size))
+        self._reset()
+
+    def adopt(self, readers):
+        """
+        Remplace le pool par des Readers déjà construits (ex: hérités du
+        processus parent après un fork) : aucun modèle n'est rechargé
+        """
+        self.size = len(readers)
+        self._reset()
+        for reader in readers:
+            self._readers.put(reader)
+        self._built = self.size
+
+    @contextmanager
+    def reader(self, timeout=None):
+        """
+        Emprunte un Reader : `with pool.reader() as reader: reader.readtext(...)`
+        """
+        self._check_process()
+        if self._built < self.size:
+            with span('reader_build'):
+                self.warm_up()
+
+        start = time.perf_counter()
+        try:
+            with span('reader_wait'):
+                reader = self._readers.get(timeout=timeout)
+        except Empty:
+            with self._lock:
+                self.metrics['timeouts'] += 1
+            raise ReaderPoolTimeout(f"Aucun Reader OCR libre après {timeout}s")
+        waited = time.perf_counter() - start
+
+        with self._lock:
+            self.metrics['acquisitions'] += 1
+            self.metrics['in_use'] += 1
+            self.metrics['wait_seconds_total'] += waited
+            self.metrics['wait_seconds_max'] = max(self.metrics['wait_seconds_max'], waited)
+        try:
+            yield reader
+        finally:
+            with self._lock:
+                self.metrics['in_use'] -= 1
+            self._readers.put(reader)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self.metrics)
+        acquisitions = data['acquisitions']
+        data['wait_seconds_avg'] = data['wait_seconds_total'] / acquisitions if acquisitions else 0.0
+        data['size'] = self.size
+        data['pid'] = self._pid
+        return data
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_reader_pool():
+    """
+    Retourne le pool du processus, créé à partir des settings OCR_*
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ReaderPool(
+                    size=getattr(settings, 'OCR_READER_POOL_SIZE', 1),
+                    languages=getattr(settings, 'OCR_LANGUAGES', ['en']),
+                    gpu=getattr(settings, 'OCR_GPU', False),
+                )
+    return _pool
+
+
+def _after_fork_in_child():
+    global _pool_lock
+    _pool_lock = threading.Lock()
+    if _pool is not None:
+        _pool._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
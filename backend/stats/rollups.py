@@ -0,0 +1,143 @@
+# stats/rollups.py
+
+from django.db.models import Avg, Count, F, Max, Min, Sum, Window
+from django.db.models.functions import RowNumber, TruncMonth, TruncWeek
+
+from .models import DailyDelta, KpiDaily, StatsPeriod, total_expression
+
+
+BUCKETS = {'week': TruncWeek, 'month': TruncMonth}
+
+AGGREGATES = {'sum': Sum, 'avg': Avg, 'min': Min, 'max': Max, 'count': Count}
+
+# Les compteurs KpiDaily (msg_sent...) et StatsPeriod (responses, total...)
+# sont des relevés cumulés : les additionner n'a pas de sens. Champs agrégeables :
+# - DELTA_FIELDS : valeurs journalières (fin - début) de DailyDelta, tous agrégats
+# - RATE_FIELDS : taux relevés sur KpiDaily, sans somme
+# - STATS_FIELDS : valeur du dernier relevé "fin" du bucket (agrégat `last`)
+DELTA_FIELDS = ['msg_sent', 'photos_sent', 'gifts_sent']
+RATE_FIELDS = ['msg_rr', 'photos_rr', 'gifts_rr', 'speed_rr']
+STATS_FIELDS = ['responses', 'kpi_effect', 'extra_benefits', 'penalites', 'total']
+
+DEFAULT_METRICS = ['msg_sent_sum', 'photos_sent_sum', 'gifts_sent_sum', 'msg_rr_avg', 'speed_rr_avg', 'total_last']
+
+
+class RollupError(ValueError):
+    """Paramètres de rollup invalides (bucket, métrique)"""
+
+
+def parse_metrics(names):
+    """
+    "msg_sent_sum" -> ('delta', 'msg_sent', 'sum') ; "msg_rr_avg" -> ('kpi', 'msg_rr', 'avg') ;
+    "total_last" -> ('stats', 'total', 'last')
+    """
+    metrics = []
+    for name in names:
+        field, _, aggregate = name.rpartition('_')
+        if field in DELTA_FIELDS and aggregate in AGGREGATES:
+            metrics.append(('delta', field, aggregate))
+        elif field in RATE_FIELDS and aggregate in AGGREGATES and aggregate != 'sum':
+            metrics.append(('kpi', field, aggregate))
+        elif field in STATS_FIELDS and aggregate == 'last':
+            metrics.append(('stats', field, aggregate))
+        elif field in DELTA_FIELDS + RATE_FIELDS + STATS_FIELDS:
+            raise RollupError(
+                f"Agrégat invalide dans {name} : {', '.join(AGGREGATES)} pour {', '.join(DELTA_FIELDS)} ; "
+                f"avg, min, max, count pour {', '.join(RATE_FIELDS)} ; last pour {', '.join(STATS_FIELDS)}"
+            )
+        else:
+            raise RollupError(f"Champ inconnu dans {name} (attendu : {', '.join(DELTA_FIELDS + RATE_FIELDS + STATS_FIELDS)})")
+    return metrics
+
+
+def _annotations(metrics, source):
+    return {
+        f'{field}_{aggregate}': AGGREGATES[aggregate](field)
+        for metric_source, field, aggregate in metrics
+        if metric_source == source
+    }
+
+
+def _merge(buckets, rows):
+    for row in rows:
+        buckets.setdefault(row['bucket'], {}).update(row)
+
+
+def rollup(date_debut, date_fin, bucket='week', metrics=None, moment=None, period_type=None):
+    """
+    Agrège par semaine ou par mois, calculé par la base (une requête par
+    source concernée, filtre sur la date indexée) :
+    - compteurs : deltas journaliers de DailyDelta (jours complets seulement)
+    - taux : relevés KpiDaily, filtrés par `moment` si donné
+    - StatsPeriod : dernier relevé `moment` (par défaut "fin") du bucket, de
+      type `period_type` (par défaut celui du bucket)
+    Retourne [{'bucket': date, 'days': n, 'rows': n, 'stats_date': date, '<champ>_<agrégat>': valeur, ...}]
+    """
+    if bucket not in BUCKETS:
+        raise RollupError(f"Bucket inconnu : {bucket} (attendu : {', '.join(BUCKETS)})")
+    metrics = parse_metrics(metrics or DEFAULT_METRICS)
+    trunc = BUCKETS[bucket]
+
+    buckets = {}
+
+    delta_annotations = _annotations(metrics, 'delta')
+    if delta_annotations:
+        _merge(buckets, (
+            DailyDelta.objects.filter(date__range=(date_debut, date_fin), success=True)
+            .annotate(bucket=trunc('date')).order_by()
+            .values('bucket').annotate(days=Count('pk'), **delta_annotations)
+        ))
+
+    kpi_annotations = _annotations(metrics, 'kpi')
+    if kpi_annotations:
+        kpis = KpiDaily.objects.filter(date__range=(date_debut, date_fin))
+        if moment:
+            kpis = kpis.filter(moment=moment)
+        _merge(buckets, (
+            kpis.annotate(bucket=trunc('date')).order_by()
+            .values('bucket').annotate(rows=Count('pk'), **kpi_annotations)
+        ))
+
+    stats_fields = [field for source, field, _ in metrics if source == 'stats']
+    if stats_fields:
+        # Dernier relevé de chaque bucket choisi par la base : ROW_NUMBER()
+        # par bucket, du plus récent au plus ancien, seule la ligne 1 est lue
+        last = (
+            StatsPeriod.objects.filter(
+                kpi_daily__date__range=(date_debut, date_fin),
+                moment=moment or 'fin',
+                period_type=period_type or bucket,
+            )
+            .annotate(
+                bucket=trunc('kpi_daily__date'),
+                total_value=total_expression(),
+                rank=Window(
+                    RowNumber(),
+                    partition_by=[trunc('kpi_daily__date')],
+                    order_by=[F('kpi_daily__date').desc(), F('pk').desc()],
+                ),
+            )
+            .filter(rank=1)
+            .order_by()
+            .values('bucket', 'kpi_daily__date', 'total_value', *[f for f in stats_fields if f != 'total'])
+        )
+        _merge(buckets, (
+            {
+                'bucket': row['bucket'],
+                'stats_date': row['kpi_daily__date'],
+                **{f'{field}_last': row['total_value' if field == 'total' else field] for field in stats_fields},
+            }
+            for row in last
+        ))
+
+    names = [f'{field}_{aggregate}' for _, field, aggregate in metrics]
+    return [
+        {
+            'bucket': bucket_date,
+            'days': values.get('days', 0),
+            'rows': values.get('rows', 0),
+            'stats_date': values.get('stats_date'),
+            **{name: values.get(name) for name in names},
+        }
+        for bucket_date, values in sorted(buckets.items())
+    ]
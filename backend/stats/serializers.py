@@ -1,7 +1,63 @@
+from django.urls import reverse
 from rest_framework import serializers
-from .models import StatsPeriod, KpiDaily
+from .derivatives import get_derivative_specs
+from .models import ImageAttachment, StatsPeriod, KpiDaily, StoredImage
+
+
+def stored_image_ids(kpis):
+    """
+    object_id des KpiDaily de `kpis` dont la capture passe par le stockage
+    dédupliqué (les seules à avoir des miniatures). Queryset, donc aussi
+    consommable en async
+    """
+    return ImageAttachment.objects.filter(
+        model=KpiDaily._meta.label_lower,
+        object_id__in=[str(kpi.pk) for kpi in kpis if kpi.image_kpi],
+        field='image_kpi',
+        image__status=StoredImage.STATUS_DONE,
+    ).values_list('object_id', flat=True)
+
 
 class KpiDailySerializer(serializers.ModelSerializer):
+    """
+    Accepte `fields=[...]` pour ne sérialiser qu'une partie des champs
+    `image_kpi_derivatives` : URLs des miniatures (produites à la première demande),
+    null pour une capture sans miniature possible
+    """
+    image_kpi_derivatives = serializers.SerializerMethodField()
+
+    # Colonne à charger pour un champ calculé (voir KPIDailyView.get)
+    source_fields = {'image_kpi_derivatives': 'image_kpi'}
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def _stored_image_ids(self):
+        # KpiDaily dont la capture passe par le stockage dédupliqué : une
+        # requête pour toute la page, mémorisée dans le contexte partagé
+        ids = self.context.get('_stored_image_ids')
+        if ids is None:
+            instances = self.parent.instance if isinstance(self.parent, serializers.ListSerializer) else [self.instance]
+            ids = set(stored_image_ids(instances))
+            self.context['_stored_image_ids'] = ids
+        return ids
+
+    def get_image_kpi_derivatives(self, obj):
+        # Image envoyée avant le stockage dédupliqué : pas de miniature (null),
+        # l'original reste dans image_kpi
+        if not obj.image_kpi or str(obj.pk) not in self._stored_image_ids():
+            return None
+        request = self.context.get('request')
+        urls = {}
+        for name in get_derivative_specs():
+            url = reverse('kpi-image', args=[obj.pk, name])
+            urls[name] = request.build_absolute_uri(url) if request else url
+        return urls
+
     class Meta:
         model = KpiDaily
         fields = '__all__'
@@ -9,4 +65,4 @@ class KpiDailySerializer(serializers.ModelSerializer):
 class StatsPeriodSerializer(serializers.ModelSerializer):
     class Meta:
         model = StatsPeriod
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
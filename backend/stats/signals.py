@@ -0,0 +1,57 @@
+# stats/signals.py
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .http_cache import invalider_reponses
+from .models import KpiDaily, StatsPeriod
+from .utils import rafraichir_deltas
+
+
+def _programmer_rafraichissement(*dates):
+    # Recalcul après commit : la transaction en cours peut encore écrire
+    # l'autre moment (début/fin) ou les StatsPeriod de la même date.
+    # Une date passée en chaîne (create(date='2025-12-09')) est convertie
+    champ_date = KpiDaily._meta.get_field('date')
+    dates = {champ_date.to_python(date_jour) for date_jour in dates if date_jour is not None}
+    if dates:
+        transaction.on_commit(lambda: rafraichir_deltas(dates))
+    transaction.on_commit(invalider_reponses)
+
+
+def _date_stats(stats):
+    if StatsPeriod.kpi_daily.is_cached(stats):
+        return stats.kpi_daily.date
+    return KpiDaily.objects.filter(pk=stats.kpi_daily_id).values_list('date', flat=True).first()
+
+
+@receiver(pre_save, sender=KpiDaily)
+def kpi_daily_avant_modification(sender, instance, raw=False, **kwargs):
+    # Date enregistrée avant modification : si elle change, l'ancien jour
+    # perd une ligne et son delta doit aussi être recalculé
+    instance._date_precedente = None
+    if instance.pk and not raw:
+        instance._date_precedente = KpiDaily.objects.filter(pk=instance.pk).values_list('date', flat=True).first()
+
+
+@receiver(post_save, sender=KpiDaily)
+@receiver(post_delete, sender=KpiDaily)
+def kpi_daily_modifie(sender, instance, **kwargs):
+    _programmer_rafraichissement(instance.date, getattr(instance, '_date_precedente', None))
+
+
+@receiver(pre_save, sender=StatsPeriod)
+def stats_period_avant_modification(sender, instance, raw=False, **kwargs):
+    # Même chose si la StatsPeriod est rattachée à un autre KpiDaily
+    instance._date_precedente = None
+    if instance.pk and not raw:
+        instance._date_precedente = (
+            StatsPeriod.objects.filter(pk=instance.pk).values_list('kpi_daily__date', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=StatsPeriod)
+@receiver(post_delete, sender=StatsPeriod)
+def stats_period_modifie(sender, instance, **kwargs):
+    _programmer_rafraichissement(_date_stats(instance), getattr(instance, '_date_precedente', None))
@@ -1,3 +1,941 @@
-from django.test import TestCase
+import io
+import json
+import logging
+import random
+import struct
+import tempfile
+import time
+import zlib
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from . import ocr_backends, tracing
+from .bulk_io import import_history
+from .extraction import extract_kpis, extract_kpis_batch
+from .http_cache import response_cache_stats
+from .image_store import recover_stale_uploads
+from .jobs import process_ocr_job, recover_stale_jobs
+from .layout import DEFAULT_LAYOUT, OPERATORS, group_by_zone, group_by_zone_batch
+from .logs import capture_debug
+from .models import DailyDelta, ImageAttachment, KpiDaily, OcrCacheEntry, OcrJob, StatsPeriod, StoredImage
+from .ocr_backends import (
+    EasyOcrBackend, OcrBackend, TesseractBackend, read_zones, retry_missing_zones, retry_stats,
+)
+from .ocr_cache import get_cached_detections, invalidate_ocr_cache, store_detections
+from .ocr_processes import OcrProcessPool
+from .rollups import RollupError, rollup
+from .tracing import HistogramRegistry, HistogramSink, set_attribute, span, trace
+from .utils import calculer_delta_journalier, calculer_deltas, extract_kpi_with_easyocr, lire_deltas
+
+
+KPI_VALUES = {
+    'msg_sent': 100, 'msg_rr': 80, 'photo_sent': 10, 'photo_rr': 90,
+    'gift_sent': 5, 'gift_rr': 90, 'speed_rr': 60,
+}
+
+
+def make_kpi(date_jour, moment, **values):
+    fields = {'msg_rr': 80, 'photos_rr': 90, 'gifts_rr': 90, 'speed_rr': 60, **values}
+    return KpiDaily.objects.create(date=date_jour, moment=moment, **fields)
+
+
+def png_upload(name='kpi.png'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 40), 'white').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+def ocr_ok(images):
+    return [{'success': True, 'data': dict(KPI_VALUES), 'detections_count': 7} for _ in images]
+
+
+@mock.patch('stats.views.store_image')
+@mock.patch('stats.views.extract_kpi_batch_with_easyocr', side_effect=ocr_ok)
+class KpiDailyBatchTests(TestCase):
+
+    def post(self, dates, moments):
+        return self.client.post('/api/kpi-daily/batch', {
+            'image_kpi': [png_upload(f'{i}.png') for i in range(len(dates))],
+            'date': dates,
+            'moment': moments,
+        })
+
+    def test_dates_non_normalisees_detectees_comme_doublons(self, *mocks):
+        response = self.post(['2026-01-07', '2026-1-7'], ['fin', 'fin'])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertFalse(response.json()['results'][1]['success'])
+        self.assertEqual(KpiDaily.objects.count(), 1)
+
+    def test_doublon_deja_en_base(self, *mocks):
+        make_kpi(date(2026, 1, 7), 'fin')
+        response = self.post(['2026-1-7', '2026-1-8'], ['fin', 'fin'])
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual([item['success'] for item in response.json()['results']], [False, True])
+
+    def test_insertion_concurrente_n_annule_pas_le_lot(self, *mocks):
+        real_filter = KpiDaily.objects.filter
+        calls = []
+
+        def filter_then_insert(*args, **kwargs):
+            queryset = real_filter(*args, **kwargs)
+            if not calls:
+                # Ligne créée par une autre requête juste après la vérification des doublons
+                calls.append(list(queryset.values_list('date', 'moment')))
+                make_kpi(date(2026, 1, 9), 'fin')
+                return mock.Mock(values_list=lambda *fields: calls[0])
+            return queryset
+
+        with mock.patch.object(KpiDaily.objects, 'filter', side_effect=filter_then_insert):
+            response = self.post(['2026-01-09', '2026-01-10'], ['fin', 'fin'])
+        self.assertEqual(response.json()['created'], 1)
+        self.assertEqual([item['success'] for item in response.json()['results']], [False, True])
+        self.assertTrue(KpiDaily.objects.filter(date=date(2026, 1, 10)).exists())
+
+
+def make_stats(kpi, period_type, responses=0, moment=None, **values):
+    return StatsPeriod.objects.create(
+        kpi_daily=kpi, moment=moment or kpi.moment, period_type=period_type, responses=responses, **values
+    )
+
+
+def make_day(date_jour, sent=(100, 150), responses=(40, 70), month_responses=500):
+    """KpiDaily début et fin d'une journée avec leurs StatsPeriod week/month"""
+    debut = make_kpi(date_jour, 'debut', msg_sent=sent[0])
+    fin = make_kpi(date_jour, 'fin', msg_sent=sent[1])
+    make_stats(debut, 'week', responses[0])
+    make_stats(debut, 'month', month_responses - 10)
+    make_stats(fin, 'week', responses[1])
+    make_stats(fin, 'month', month_responses)
+    return debut, fin
+
+
+class TotalSqlTests(TestCase):
+
+    def test_with_total_identique_a_total(self):
+        rng = random.Random(9)
+        for day in range(1, 21):
+            kpi = make_kpi(date(2025, 11, day), 'fin')
+            for period_type in ('week', 'month'):
+                make_stats(
+                    kpi, period_type, rng.randint(0, 100000),
+                    kpi_effect=rng.randint(-5000, 5000),
+                    extra_benefits=rng.randint(-5000, 5000),
+                    penalites=rng.randint(0, 500),
+                )
+        rows = list(StatsPeriod.objects.with_total())
+        self.assertEqual(len(rows), 40)
+        for stat in rows:
+            self.assertEqual(stat.total_value, stat.total(), stat.pk)
+        self.assertAlmostEqual(StatsPeriod.objects.sum_total(), sum(stat.total() for stat in rows))
+
+
+class RafraichissementDeltasTests(TestCase):
+
+    def test_delta_materialise_apres_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_day(date(2025, 12, 2))
+        delta = DailyDelta.objects.get(date=date(2025, 12, 2))
+        self.assertTrue(delta.success)
+        self.assertEqual(delta.msg_sent, 50)
+
+    def test_date_modifiee_rafraichit_l_ancien_jour(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            _, fin = make_day(date(2025, 12, 2))
+        with self.captureOnCommitCallbacks(execute=True):
+            fin.date = date(2025, 12, 5)
+            fin.save()
+        self.assertFalse(DailyDelta.objects.get(date=date(2025, 12, 2)).success)
+        self.assertFalse(DailyDelta.objects.get(date=date(2025, 12, 5)).success)
+
+    def test_date_en_chaine(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_kpi('2025-12-09', 'debut')
+        self.assertFalse(DailyDelta.objects.get(date=date(2025, 12, 9)).success)
+
+    def test_suppression_retire_la_ligne(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            debut, fin = make_day(date(2025, 12, 3))
+        with self.captureOnCommitCallbacks(execute=True):
+            debut.delete()
+            fin.delete()
+        self.assertFalse(DailyDelta.objects.filter(date=date(2025, 12, 3)).exists())
+
+
+class CalculDeltasTests(TestCase):
+
+    def test_delta_journalier(self):
+        make_day(date(2025, 12, 2), sent=(100, 150), responses=(40, 70), month_responses=500)
+        resultat = calculer_delta_journalier(date(2025, 12, 2))
+        self.assertTrue(resultat['success'])
+        self.assertEqual(resultat['delta_kpi']['msg_sent'], 50)
+        self.assertEqual(resultat['delta_kpi']['msg_rr'], 60.0)
+        self.assertEqual(resultat['delta_stats']['week']['responses'], 30)
+        self.assertEqual(resultat['delta_stats']['month']['responses'], 500)
+
+    def test_periode_avec_jours_manquants(self):
+        make_day(date(2025, 12, 1))
+        make_kpi(date(2025, 12, 2), 'debut')
+        resultats = calculer_deltas(date(2025, 12, 1), date(2025, 12, 3))
+        self.assertEqual([r['success'] for r in resultats], [True, False, False])
+        self.assertEqual([r['date'] for r in resultats], [date(2025, 12, d) for d in (1, 2, 3)])
+
+    def test_stats_manquantes_et_zero_message(self):
+        debut = make_kpi(date(2025, 12, 4), 'debut', msg_sent=10)
+        fin = make_kpi(date(2025, 12, 4), 'fin', msg_sent=10)
+        self.assertIn('Statistiques manquantes', calculer_delta_journalier(date(2025, 12, 4))['error'])
+        make_stats(debut, 'week', 5)
+        make_stats(fin, 'week', 5)
+        make_stats(fin, 'month', 5)
+        self.assertIsNone(calculer_delta_journalier(date(2025, 12, 4))['delta_kpi']['msg_rr'])
+
+    def test_stats_du_meme_moment_choisies(self):
+        debut, fin = make_day(date(2025, 12, 5), responses=(40, 70))
+        # Ligne "fin" rattachée au KpiDaily de début, créée avant celle de son moment
+        StatsPeriod.objects.filter(kpi_daily=debut, period_type='week').delete()
+        make_stats(debut, 'week', 999, moment='fin')
+        make_stats(debut, 'week', 40)
+        resultat = calculer_delta_journalier(date(2025, 12, 5))
+        self.assertEqual(resultat['delta_stats']['week']['responses'], 30)
+
+
+class RollupTests(TestCase):
+
+    def setUp(self):
+        # Relevés cumulés : 100 -> 150 le lundi, 150 -> 220 le mardi (120 messages envoyés)
+        with self.captureOnCommitCallbacks(execute=True):
+            make_day(date(2026, 1, 5), sent=(100, 150), responses=(40, 70), month_responses=500)
+            make_day(date(2026, 1, 6), sent=(150, 220), responses=(70, 100), month_responses=530)
+
+    def test_sommes_calculees_sur_les_deltas(self):
+        rows = rollup(date(2026, 1, 1), date(2026, 1, 31), 'week', ['msg_sent_sum', 'msg_sent_avg'])
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['msg_sent_sum'], 120)
+        self.assertEqual(rows[0]['msg_sent_avg'], 60)
+        self.assertEqual(rows[0]['days'], 2)
+
+    def test_total_du_dernier_releve_fin(self):
+        rows = rollup(date(2026, 1, 1), date(2026, 1, 31), 'week', ['total_last', 'responses_last'])
+        fin = StatsPeriod.objects.get(kpi_daily__date=date(2026, 1, 6), moment='fin', period_type='week')
+        self.assertEqual(rows[0]['responses_last'], 100)
+        self.assertAlmostEqual(rows[0]['total_last'], fin.total())
+        self.assertEqual(rows[0]['stats_date'], date(2026, 1, 6))
+
+    def test_dernier_releve_par_bucket_en_une_requete(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_day(date(2026, 1, 12), sent=(220, 260), responses=(0, 25), month_responses=560)
+        with self.assertNumQueries(1):
+            rows = rollup(date(2026, 1, 1), date(2026, 1, 31), 'week', ['responses_last'])
+        self.assertEqual(
+            [(row['bucket'], row['stats_date'], row['responses_last']) for row in rows],
+            [(date(2026, 1, 5), date(2026, 1, 6), 100), (date(2026, 1, 12), date(2026, 1, 12), 25)],
+        )
+        rows = rollup(date(2026, 1, 1), date(2026, 1, 31), 'month', ['responses_last'])
+        self.assertEqual(rows[0]['responses_last'], 560)
+
+    def test_somme_de_releves_refusee(self):
+        for metric in ('msg_rr_sum', 'total_sum', 'inconnu_avg'):
+            with self.assertRaises(RollupError):
+                rollup(date(2026, 1, 1), date(2026, 1, 31), 'week', [metric])
+
+    def test_endpoint(self):
+        response = self.client.get('/api/rollups?start=2026-01-01&end=2026-01-31&bucket=month')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data'][0]['msg_sent_sum'], 120)
+
+
+class OcrJobTests(TestCase):
+
+    def make_job(self, **fields):
+        return OcrJob.objects.create(image_data=b'png', date=date(2026, 1, 5), moment='fin', **fields)
+
+    def test_erreur_hors_ocr_marque_le_job_en_echec(self):
+        job = self.make_job()
+        with mock.patch('stats.jobs.finalize_kpi_data', side_effect=RuntimeError('base indisponible')), \
+                mock.patch('stats.jobs.extract_kpi_with_easyocr', return_value={'success': True, 'data': {}}):
+            process_ocr_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, OcrJob.STATUS_FAILED)
+        self.assertEqual(job.error, 'base indisponible')
+        self.assertIsNone(job.image_data)
+
+    def test_job_bloque_repris(self):
+        stale = self.make_job(status=OcrJob.STATUS_RUNNING)
+        recent = self.make_job(status=OcrJob.STATUS_RUNNING)
+        OcrJob.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(recover_stale_jobs(600), 1)
+        stale.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertEqual(stale.status, OcrJob.STATUS_PENDING)
+        self.assertEqual(recent.status, OcrJob.STATUS_RUNNING)
+
+
+class UploadImageTests(TestCase):
+
+    def test_envoi_bloque_repris(self):
+        stale = StoredImage.objects.create(digest='a' * 64, image_data=b'png', status=StoredImage.STATUS_UPLOADING,
+                                           claimed_at=timezone.now() - timedelta(hours=1))
+        recent = StoredImage.objects.create(digest='b' * 64, image_data=b'png', status=StoredImage.STATUS_UPLOADING,
+                                            claimed_at=timezone.now())
+        self.assertEqual(recover_stale_uploads(600), 1)
+        stale.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertEqual(stale.status, StoredImage.STATUS_PENDING)
+        self.assertEqual(recent.status, StoredImage.STATUS_UPLOADING)
+
+
+class MiniaturesTests(TestCase):
+
+    def setUp(self):
+        self.legacy = make_kpi(date(2026, 1, 5), 'debut', image_kpi='kpi/ancienne')
+        self.stored = make_kpi(date(2026, 1, 5), 'fin', image_kpi='kpi/dedupliquee')
+        image = StoredImage.objects.create(digest='c' * 64, status=StoredImage.STATUS_DONE, reference='kpi/dedupliquee')
+        ImageAttachment.objects.create(image=image, model='stats.kpidaily', object_id=str(self.stored.pk), field='image_kpi')
+
+    def derivatives(self, url):
+        response = self.client.get(url, {'fields': 'moment,image_kpi_derivatives'})
+        self.assertEqual(response.status_code, 200)
+        return {row['moment']: row['image_kpi_derivatives'] for row in response.json()['results']}
+
+    def test_image_ancienne_sans_miniature(self):
+        for url in ('/api/kpi-daily', '/api/async/kpi-daily'):
+            derivatives = self.derivatives(url)
+            self.assertIsNone(derivatives['debut'])
+            self.assertTrue(derivatives['fin']['thumb'].endswith(f'/kpi-daily/{self.stored.pk}/image/thumb'))
+
+
+class ListeKpiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        for day in range(1, 4):
+            for moment in ('debut', 'fin'):
+                make_kpi(date(2026, 1, day), moment, msg_sent=day * 10)
+
+    def rows(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [(row['date'], row['moment']) for row in response.json()['results']]
+
+    def test_curseur_stable_malgre_insertion(self):
+        response = self.client.get('/api/kpi-daily', {'page_size': 2})
+        seen = self.rows(response)
+        # Ligne plus récente ajoutée entre deux pages : ni doublon ni saut
+        make_kpi(date(2026, 1, 9), 'debut')
+        while response.json()['next']:
+            response = self.client.get(response.json()['next'])
+            seen += self.rows(response)
+        expected = [(str(date(2026, 1, day)), moment) for day in (3, 2, 1) for moment in ('debut', 'fin')]
+        self.assertEqual(seen, expected)
+
+    def test_filtres_combines(self):
+        cases = [
+            ({'date_from': '2026-01-02'}, 4),
+            ({'date_from': '2026-01-02', 'date_to': '2026-01-02'}, 2),
+            ({'date_to': '2026-01-02', 'moment': 'fin'}, 2),
+            ({'date_from': '2026-01-03', 'moment': 'debut'}, 1),
+            ({'date_from': '2026-01-04'}, 0),
+        ]
+        for params, count in cases:
+            with self.subTest(**params):
+                rows = self.rows(self.client.get('/api/kpi-daily', params))
+                self.assertEqual(len(rows), count)
+                if 'moment' in params:
+                    self.assertEqual({moment for _, moment in rows}, {params['moment']})
+        response = self.client.get('/api/kpi-daily', {'date_from': '02/01/2026'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_selection_de_champs(self):
+        response = self.client.get('/api/kpi-daily', {'fields': 'date,msg_sent'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()['results'][0]), {'date', 'msg_sent'})
+
+        response = self.client.get('/api/kpi-daily', {'fields': 'date,mot_de_passe'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'Champs inconnus : mot_de_passe')
+
+
+class AsyncVuesTests(TestCase):
+
+    def setUp(self):
+        self.pool = OcrProcessPool(workers=1, queue_size=1)
+        self.executor = mock.Mock()
+        self.pool._get_executor = lambda: self.executor
+        patcher = mock.patch('stats.async_views.get_ocr_process_pool', return_value=self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self):
+        return self.client.post('/api/async/kpi-daily', {'image_kpi': png_upload()})
+
+    @override_settings(OCR_PROCESS_RETRY_AFTER=7)
+    def test_pool_sature(self):
+        # Worker et file d'attente occupés
+        self.pool._reserve()
+        self.pool._reserve()
+        response = self.upload()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '7')
+        self.assertEqual(self.pool.stats()['rejected'], 1)
+        self.executor.submit.assert_not_called()
+
+    def test_pool_casse(self):
+        self.executor.submit.side_effect = BrokenProcessPool('worker mort')
+        response = self.upload()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.pool.stats()['in_flight'], 0)
+
+    @override_settings(OCR_PROCESS_TIMEOUT=0.01)
+    def test_ocr_trop_long(self):
+        future = Future()
+        future.set_running_or_notify_cancel()  # Déjà dans un worker : plus annulable
+        self.executor.submit.return_value = future
+        response = self.upload()
+        self.assertEqual(response.status_code, 503)
+        # Place libérée à la fin réelle du calcul seulement
+        self.assertEqual(self.pool.stats()['in_flight'], 1)
+        future.set_result({'success': False, 'error': 'abandonné'})
+        self.assertEqual(self.pool.stats()['in_flight'], 0)
+
+    def test_liste_paginee(self):
+        for day in range(1, 4):
+            for moment in ('debut', 'fin'):
+                make_kpi(date(2026, 1, day), moment)
+        response = self.client.get('/api/async/kpi-daily', {'page_size': 4, 'fields': 'date,moment'})
+        pages = [response.json()['results']]
+        pages.append(self.client.get(response.json()['next']).json())
+        self.assertIsNone(pages[1]['next'])
+        rows = [(row['date'], row['moment']) for row in pages[0] + pages[1]['results']]
+        expected = [(str(date(2026, 1, day)), moment) for day in (3, 2, 1) for moment in ('debut', 'fin')]
+        self.assertEqual(rows, expected)
+        self.assertEqual(set(pages[0][0]), {'date', 'moment'})
+
+        response = self.client.get('/api/async/kpi-daily', {'cursor': 'pas-un-curseur'})
+        self.assertEqual(response.status_code, 400)
+
+
+class HttpCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.hits = response_cache_stats()['hits']
+
+    def test_en_tetes_restitues_depuis_le_cache(self):
+        make_kpi(date(2026, 1, 5), 'fin')
+        first = self.client.get('/api/kpi-daily')
+        hits = response_cache_stats()['hits']
+        second = self.client.get('/api/kpi-daily')
+        self.assertEqual(response_cache_stats()['hits'], hits + 1)
+        self.assertEqual(second.content, first.content)
+        for header in ('Content-Type', 'Allow'):
+            self.assertEqual(second.get(header), first.get(header), header)
+        self.assertIn('Accept', second.get('Vary', ''))
+        self.assertIn('ETag', second)
+
+    def test_cle_selon_vary(self):
+        make_kpi(date(2026, 1, 5), 'fin')
+        self.client.get('/api/kpi-daily')
+        hits = response_cache_stats()['hits']
+        # Autre cookie de session : pas la réponse mise en cache pour le premier client
+        self.client.cookies['sessionid'] = 'autre-session'
+        self.client.get('/api/kpi-daily')
+        self.assertEqual(response_cache_stats()['hits'], hits)
+
+    def test_rendu_html_jamais_mis_en_cache(self):
+        for _ in range(2):
+            response = self.client.get('/api/kpi-daily', HTTP_ACCEPT='text/html')
+            self.assertTrue(response['Content-Type'].startswith('text/html'))
+        self.assertEqual(response_cache_stats()['hits'], self.hits)
+
+
+def reference_group_by_zone(results, layout):
+    """Classement naïf, détection par détection (première zone dont toutes les règles sont vraies)"""
+    grouped = {zone['name']: [] for zone in layout['zones']}
+    for bbox, text, confidence in results:
+        text = text.strip()
+        if len(text) < layout['min_length'] or confidence < layout['min_confidence']:
+            continue
+        x = (bbox[0][0] + bbox[2][0]) / 2
+        y = (bbox[0][1] + bbox[2][1]) / 2
+        for zone in layout['zones']:
+            if all(OPERATORS[op]({'x': x, 'y': y}[axis], value) for axis, op, value in zone['rules']):
+                grouped[zone['name']].append({'text': text, 'x': x, 'y': y, 'confidence': confidence})
+                break
+    return grouped
+
+
+def random_detections(rng, count):
+    detections = []
+    for _ in range(count):
+        # Centres sur les bornes des zones inclus (y=300, x=480...)
+        x = rng.choice([rng.uniform(0, 943), 480, 479.5])
+        y = rng.choice([rng.uniform(0, 900), 200, 300, 500, 600, 800])
+        half_w, half_h = rng.uniform(1, 60), rng.uniform(1, 15)
+        bbox = [[x - half_w, y - half_h], [x + half_w, y - half_h], [x + half_w, y + half_h], [x - half_w, y + half_h]]
+        text = rng.choice(['2520 Sent', '78% RR', 'x', ' 5 ', '65% Messages answered within 1 minute'])
+        detections.append((bbox, text, rng.choice([rng.random(), 0.3, 0.29])))
+    return detections
+
+
+class ClassificationTests(TestCase):
+
+    def test_classement_vectorise_identique_a_la_reference(self):
+        rng = random.Random(15)
+        images = [random_detections(rng, rng.randint(0, 60)) for _ in range(30)]
+        grouped = group_by_zone_batch(images, DEFAULT_LAYOUT)
+        self.assertEqual(len(grouped), len(images))
+        for detections, zones in zip(images, grouped):
+            self.assertEqual(zones, reference_group_by_zone(detections, DEFAULT_LAYOUT))
+            self.assertEqual(group_by_zone(detections, DEFAULT_LAYOUT), zones)
+
+
+def item(text, x, y, confidence=0.9):
+    return {'text': text, 'x': x, 'y': y, 'confidence': confidence}
+
+
+class ExtractionTests(TestCase):
+
+    def test_badge_distingue_des_paliers(self):
+        zones = {
+            'messages': [
+                item('2520 Sent', 120, 324), item('90% RR', 330, 324),
+                # Badge lu en deux détections sur la même ligne : nombre puis libellé
+                item('Sent', 160, 376), item('385', 90, 375), item('77.1% RR', 330, 375),
+                item('0 Sent', 120, 425), item('0% RR', 330, 425),
+            ],
+            'speeds': [item('65% Messages answered within 1 minute', 700, 656), item('59.5% Messages', 700, 707)],
+        }
+        kpi_data = extract_kpis(zones, DEFAULT_LAYOUT)
+        self.assertEqual(kpi_data['msg_sent'], 385)
+        self.assertEqual(kpi_data['msg_rr'], 77.1)
+        self.assertEqual(kpi_data['speed_rr'], 59.5)
+        self.assertNotIn('gift_sent', kpi_data)
+
+    def test_pourcentage_mal_lu_et_paliers_seuls(self):
+        zones = {
+            'gifts': [item('7796RR', 800, 375), item('540 Sent', 600, 324), item('125 Sent', 600, 375)],
+        }
+        kpi_data = extract_kpis(zones, DEFAULT_LAYOUT)
+        self.assertEqual(kpi_data['gift_rr'], 77.0)
+        # Seuls les paliers gris sont lus : valeur par défaut de la disposition
+        self.assertEqual(kpi_data['gift_sent'], DEFAULT_LAYOUT['defaults']['Sent'])
+
+    def test_badge_le_plus_confiant(self):
+        zones = {'photos': [item('412 Sent', 120, 707, 0.5), item('421 Sent', 120, 707, 0.95)]}
+        self.assertEqual(extract_kpis(zones, DEFAULT_LAYOUT)['photo_sent'], 421)
+        self.assertEqual(extract_kpis_batch([zones, {}], DEFAULT_LAYOUT), [extract_kpis(zones, DEFAULT_LAYOUT), {}])
+
+
+IMPORT_CSV = (
+    "date,moment,msg_sent,msg_rr,photos_sent,photos_rr,gifts_sent,gifts_rr,speed_rr\n"
+    "2026-02-02,fin,300,81,3,90,1,90,60\n"
+    "2026-02-03,fin,400,82,4,90,2,90,61\n"
+)
+
+
+class ImportConflictTests(TestCase):
+
+    def setUp(self):
+        make_kpi(date(2026, 2, 2), 'fin', msg_sent=100)
+
+    def run_import(self, on_conflict):
+        return import_history(io.BytesIO(IMPORT_CSV.encode()), 'csv', on_conflict=on_conflict)
+
+    def msg_sent(self, day):
+        return KpiDaily.objects.get(date=date(2026, 2, day), moment='fin').msg_sent
+
+    def test_skip(self):
+        report = self.run_import('skip')
+        self.assertEqual((report['created'], report['skipped'], report['updated']), (1, 1, 0))
+        self.assertEqual(self.msg_sent(2), 100)
+        self.assertEqual(self.msg_sent(3), 400)
+
+    def test_update(self):
+        report = self.run_import('update')
+        self.assertEqual((report['created'], report['skipped'], report['updated']), (1, 0, 1))
+        self.assertEqual(self.msg_sent(2), 300)
+        self.assertEqual(KpiDaily.objects.count(), 2)
+
+    def test_error(self):
+        report = self.run_import('error')
+        self.assertEqual((report['created'], report['invalid']), (1, 1))
+        self.assertEqual(report['errors'][0]['line'], 2)
+        self.assertEqual(self.msg_sent(2), 100)
+
+    def test_endpoint(self):
+        upload = SimpleUploadedFile('history.csv', IMPORT_CSV.encode(), content_type='text/csv')
+        response = self.client.post('/api/kpi-daily/import', {'file': upload, 'on_conflict': 'update'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['updated'], 1)
+        upload = SimpleUploadedFile('history.csv', IMPORT_CSV.encode(), content_type='text/csv')
+        response = self.client.post('/api/kpi-daily/import', {'file': upload, 'on_conflict': 'replace'})
+        self.assertEqual(response.status_code, 400)
+
+
+def png_header_only(width, height):
+    """PNG minimal dont l'en-tête annonce width x height pixels (données vides)"""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    ihdr = struct.pack('>IIBBBBB', width, height, 1, 0, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', ihdr) + chunk(b'IDAT', zlib.compress(b'')) + chunk(b'IEND', b'')
+
+
+class UploadLimitTests(TestCase):
+
+    def post(self, content, name='kpi.png', url='/api/kpi-daily'):
+        upload = SimpleUploadedFile(name, content, content_type='image/png')
+        return self.client.post(url, {'image_kpi': upload, 'date': '2026-01-05', 'moment': 'fin'})
+
+    def test_bombe_de_decompression(self):
+        bomb = png_header_only(15000, 15000)
+        self.assertEqual(self.post(bomb).status_code, 413)
+        self.assertEqual(self.post(bomb, url='/api/async/kpi-daily').status_code, 413)
+
+    def test_fichier_illisible(self):
+        self.assertEqual(self.post(b'pas une image').status_code, 400)
+        self.assertEqual(self.post(png_upload().read()[:60]).status_code, 400)
+        self.assertEqual(self.post(b'pas une image', url='/api/async/kpi-daily').status_code, 400)
+
+    def test_limites_configurees(self):
+        with self.settings(OCR_MAX_UPLOAD_BYTES=10):
+            self.assertEqual(self.post(png_upload().read()).status_code, 413)
+        with self.settings(OCR_MAX_PIXELS=100):
+            self.assertEqual(self.post(png_upload().read()).status_code, 413)
+
+    @mock.patch('stats.views.store_image')
+    @mock.patch('stats.views.extract_kpi_batch_with_easyocr', side_effect=ocr_ok)
+    def test_lot_avec_bombe(self, *mocks):
+        response = self.client.post('/api/kpi-daily/batch', {
+            'image_kpi': [
+                SimpleUploadedFile('bomb.png', png_header_only(15000, 15000), content_type='image/png'),
+                png_upload(),
+            ],
+            'date': ['2026-01-05', '2026-01-06'],
+            'moment': ['fin', 'fin'],
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([item['success'] for item in response.json()['results']], [False, True])
+
+
+class ImportInterrompuTests(TestCase):
+
+    def test_deltas_rafraichis_malgre_une_ligne_illisible(self):
+        lines = [
+            json.dumps({'date': '2026-03-02', 'moment': moment, 'msg_sent': sent,
+                        'msg_rr': 80, 'photos_rr': 90, 'gifts_rr': 90, 'speed_rr': 60})
+            for moment, sent in (('debut', 100), ('fin', 150))
+        ]
+        content = '\n'.join(lines + ['{pas du json']).encode()
+        upload = SimpleUploadedFile('history.jsonl', content, content_type='application/jsonl')
+        with self.settings(IMPORT_CHUNK_SIZE=1):
+            response = self.client.post('/api/kpi-daily/import', {'file': upload})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['created'], 2)
+        self.assertIn('Ligne 3', response.json()['error'])
+        # Journée sans StatsPeriod : ligne rafraîchie, marquée incomplète
+        self.assertTrue(DailyDelta.objects.filter(date=date(2026, 3, 2)).exists())
+
+    def post_csv(self, content):
+        upload = SimpleUploadedFile('history.csv', content, content_type='text/csv')
+        return self.client.post('/api/kpi-daily/import', {'file': upload})
+
+    def test_fichier_non_utf8(self):
+        response = self.post_csv(IMPORT_CSV.replace('fin', 'fïn').encode('latin-1'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('UTF-8', response.json()['error'])
+
+    def test_csv_invalide(self):
+        response = self.post_csv(IMPORT_CSV.encode() + b'2026-02-04,"' + b'x' * 200_000 + b'"\n')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('CSV invalide', response.json()['error'])
+
+    def test_commande_sans_traceback(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv') as file:
+            file.write(b'\xff\xfe\x00d\x00a')
+            file.flush()
+            with self.assertRaises(CommandError):
+                call_command('import_history', file.name, stdout=io.StringIO())
+
+
+class LectureDeltasTests(TestCase):
+
+    def test_jours_anterieurs_a_la_table_completes(self):
+        # Données présentes avant la création de DailyDelta : aucune ligne matérialisée
+        make_day(date(2025, 10, 6), sent=(100, 130))
+        self.assertFalse(DailyDelta.objects.exists())
+        resultats = lire_deltas(date(2025, 10, 5), date(2025, 10, 6))
+        self.assertEqual([r['success'] for r in resultats], [False, True])
+        self.assertEqual(resultats[1]['delta_kpi']['msg_sent'], 30)
+        self.assertTrue(DailyDelta.objects.filter(date=date(2025, 10, 6)).exists())
+        response = self.client.get('/api/async/deltas?start=2025-10-06&end=2025-10-06')
+        self.assertTrue(response.json()['data'][0]['success'])
+
+    def test_aucune_requete_de_plus_si_tout_est_materialise(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_day(date(2025, 10, 7))
+        with self.assertNumQueries(1):
+            lire_deltas(date(2025, 10, 7), date(2025, 10, 7))
+
+
+def detection(text, x, y, confidence=0.9, half_width=40, half_height=10):
+    """Détection EasyOCR centrée sur (x, y)"""
+    bbox = [[x - half_width, y - half_height], [x + half_width, y - half_height],
+            [x + half_width, y + half_height], [x - half_width, y + half_height]]
+    return (bbox, text, confidence)
+
+
+SCREEN = [
+    detection('385 Sent', 120, 375), detection('77.1% RR', 330, 375),
+    detection('200 Sent', 600, 375), detection('60% RR', 800, 375),
+    detection('300 Sent', 120, 707), detection('70% RR', 330, 707),
+    detection('59.5% Messages', 700, 707),
+]
+
+
+def full_screen_crops():
+    return [('full', np.zeros((900, 943, 3), dtype=np.uint8), (0, 0))]
+
+
+class FakeBackend(OcrBackend):
+    """Moteur qui « lit » dans chaque crop les détections données (repère de l'image)"""
+
+    def __init__(self, name, detections, available=True, error=None):
+        self.name = name
+        self.detections = detections
+        self._available = available
+        self.error = error
+        self.calls = []
+
+    def available(self):
+        return self._available
+
+    def read_crops(self, crops):
+        self.calls.append([crop_name for crop_name, _, _ in crops])
+        if self.error:
+            raise self.error
+        found = []
+        for _, array, (x0, y0) in crops:
+            height, width = array.shape[:2]
+            for bbox, text, confidence in self.detections:
+                x, y = (bbox[0][0] + bbox[2][0]) / 2, (bbox[0][1] + bbox[2][1]) / 2
+                if x0 <= x < x0 + width and y0 <= y < y0 + height:
+                    found.append((bbox, text, confidence))
+        return found
+
+
+class ZoomBackend(FakeBackend):
+    """Moteur qui lit des crops agrandis `scale` fois (bbox dans le repère agrandi), en `delay` secondes"""
+
+    def __init__(self, name, detections, scale=1, delay=0):
+        super().__init__(name, detections)
+        self.scale = scale
+        self.delay = delay
+
+    def read_crops(self, crops):
+        time.sleep(self.delay)
+        scale = self.scale
+        found = super().read_crops([
+            (name, array[::scale, ::scale], (x0 // scale, y0 // scale)) for name, array, (x0, y0) in crops
+        ])
+        return [([[x * scale, y * scale] for x, y in bbox], text, confidence) for bbox, text, confidence in found]
+
+
+@override_settings(OCR_RETRY_ENABLED=False)
+class BackendFallbackTests(TestCase):
+
+    def setUp(self):
+        self.fast = FakeBackend('fast', SCREEN[:-1])  # Zone "speeds" manquée
+        # Le moteur de repli lit tout, y compris une autre valeur pour "messages"
+        self.precise = FakeBackend('precise', [detection('999 Sent', 120, 375)] + SCREEN[1:])
+
+    def extract(self, results):
+        return extract_kpis(group_by_zone(results, DEFAULT_LAYOUT), DEFAULT_LAYOUT)
+
+    def test_zone_faible_relue_puis_fusionnee(self):
+        results = read_zones(full_screen_crops(), [self.fast, self.precise], DEFAULT_LAYOUT)
+        self.assertEqual(self.precise.calls, [['speeds']])
+        kpi_data = self.extract(results)
+        self.assertEqual(kpi_data['speed_rr'], 59.5)
+        self.assertEqual(kpi_data['msg_sent'], 385)  # Zone complète : gardée du premier moteur
+
+    def test_moteur_de_repli_indisponible_ou_en_echec(self):
+        self.precise._available = False
+        results = read_zones(full_screen_crops(), [self.fast, self.precise], DEFAULT_LAYOUT)
+        self.assertEqual(self.precise.calls, [])
+        self.assertNotIn('speed_rr', self.extract(results))
+
+        self.precise._available = True
+        self.precise.error = RuntimeError('modèle introuvable')
+        results = read_zones(full_screen_crops(), [self.fast, self.precise], DEFAULT_LAYOUT)
+        self.assertEqual(self.extract(results)['msg_sent'], 385)
+
+    def test_easyocr_non_installe_ignore(self):
+        with mock.patch('importlib.util.find_spec', return_value=None):
+            self.assertFalse(EasyOcrBackend().available())
+            with mock.patch.object(ocr_backends, '_backends', None), \
+                    mock.patch.object(TesseractBackend, 'available', return_value=True), \
+                    override_settings(OCR_BACKENDS=['tesseract', 'easyocr']):
+                self.assertEqual([backend.name for backend in ocr_backends.get_backends()], ['tesseract'])
+        self.assertEqual(retry_missing_zones(full_screen_crops(), [], backend=FakeBackend('off', [], available=False)), ([], []))
+
+
+@override_settings(OCR_CACHE_ENABLED=True, OCR_CACHE_MAX_ENTRIES=2, OCR_CACHE_TTL=3600)
+class OcrCacheTests(TestCase):
+
+    def store(self, digest, when=None):
+        store_detections(digest, SCREEN)
+        if when is not None:
+            OcrCacheEntry.objects.filter(digest=digest).update(created_at=when, last_used_at=when)
+
+    def test_image_deja_lue_sans_ocr(self):
+        with mock.patch('stats.ocr_stack.prepare_image', return_value=full_screen_crops()), \
+                mock.patch('stats.ocr_stack.read_zones', return_value=list(SCREEN)) as read, \
+                mock.patch('stats.ocr_stack.retry_missing_zones', side_effect=lambda crops, results: (results, [])):
+            first = extract_kpi_with_easyocr(png_upload())
+            second = extract_kpi_with_easyocr(png_upload())
+        self.assertEqual(read.call_count, 1)
+        self.assertTrue(first['success'])
+        self.assertEqual(second['data'], first['data'])
+
+    def test_changement_de_configuration(self):
+        self.store('a' * 64)
+        self.assertIsNotNone(get_cached_detections('a' * 64))
+        for changed in ({'OCR_CACHE_VERSION': 2}, {'OCR_LANGUAGES': ['fr']}):
+            with override_settings(**changed):
+                self.assertIsNone(get_cached_detections('a' * 64))
+        with override_settings(OCR_CACHE_VERSION=2):
+            self.assertEqual(invalidate_ocr_cache(stale_only=True), 1)
+        self.assertFalse(OcrCacheEntry.objects.exists())
+
+    def test_eviction_lru(self):
+        now = timezone.now()
+        self.store('a' * 64, now - timedelta(minutes=2))
+        self.store('b' * 64, now - timedelta(minutes=1))
+        get_cached_detections('a' * 64)  # "a" redevient la plus récemment utilisée
+        self.store('c' * 64)
+        self.assertEqual(set(OcrCacheEntry.objects.values_list('digest', flat=True)), {'a' * 64, 'c' * 64})
+
+    def test_entree_expiree(self):
+        self.store('a' * 64, timezone.now() - timedelta(seconds=3601))
+        self.assertIsNone(get_cached_detections('a' * 64))
+        self.store('b' * 64)  # L'enregistrement purge les entrées expirées
+        self.assertEqual(list(OcrCacheEntry.objects.values_list('digest', flat=True)), ['b' * 64])
+
+
+class RelectureTests(TestCase):
+
+    @override_settings(OCR_RETRY_STEPS=[{'contrast': 2.5, 'sharpen': True, 'scale': 2}])
+    def test_zone_agrandie_remise_a_l_echelle(self):
+        backend = ZoomBackend('precise', [SCREEN[-1]], scale=2)
+        results, recovered = retry_missing_zones(full_screen_crops(), SCREEN[:-1], backend=backend, layout=DEFAULT_LAYOUT)
+        self.assertEqual(backend.calls, [['speeds']])
+        self.assertEqual(recovered, ['speeds'])
+        # Détection relue sur le crop agrandi, rendue dans le repère de l'image
+        self.assertIn(SCREEN[-1][0], [bbox for bbox, text, _ in results if text == '59.5% Messages'])
+        self.assertEqual(extract_kpis(group_by_zone(results, DEFAULT_LAYOUT), DEFAULT_LAYOUT)['speed_rr'], 59.5)
+
+    def test_budget_epuise(self):
+        backend = ZoomBackend('lent', [], delay=0.05)
+        before = retry_stats()['budget_exhausted']
+        results, recovered = retry_missing_zones(full_screen_crops(), SCREEN[:-1], backend=backend,
+                                                 layout=DEFAULT_LAYOUT, budget=0.02)
+        self.assertEqual(len(backend.calls), 1)  # Plus d'étape après le dépassement
+        self.assertEqual((results, recovered), (SCREEN[:-1], []))
+        self.assertEqual(retry_stats()['budget_exhausted'], before + 1)
+
+
+class RecordingSink:
+    def __init__(self):
+        self.traces = []
+
+    def emit(self, current):
+        self.traces.append(current.as_dict())
+
+
+class TracingTests(TestCase):
+
+    def test_spans_transmis_aux_sinks(self):
+        sink = RecordingSink()
+        failing = mock.Mock(**{'emit.side_effect': RuntimeError('sink en panne')})
+        with span('hors_trace'):
+            set_attribute('ignore', True)
+        with mock.patch.object(tracing, '_sinks', [failing, sink]), self.assertLogs('stats.tracing', 'ERROR'):
+            with trace('test.trace'):
+                with span('decode'):
+                    pass
+                with span('ocr'):
+                    set_attribute('detections', 7)
+        self.assertEqual(len(sink.traces), 1)  # Reçue malgré le sink en erreur
+        emitted = sink.traces[0]
+        self.assertEqual(emitted['trace'], 'test.trace')
+        self.assertEqual([item['name'] for item in emitted['spans']], ['decode', 'ocr'])
+        self.assertEqual(emitted['attributes'], {'detections': 7})
+        self.assertGreaterEqual(emitted['duration'], sum(item['duration'] for item in emitted['spans']))
+
+    def test_format_prometheus(self):
+        registry = HistogramRegistry()
+        for value in (0.003, 0.2, 120):
+            registry.observe('statmulti_stage_seconds', {'trace': 't', 'stage': 'ocr'}, value, buckets=(0.01, 1))
+        registry.observe('statmulti_trace_seconds', {}, 0.5, buckets=(1,))
+        self.assertEqual(registry.render_prometheus(), '\n'.join([
+            '# TYPE statmulti_stage_seconds histogram',
+            'statmulti_stage_seconds_bucket{stage="ocr",trace="t",le="0.01"} 1',
+            'statmulti_stage_seconds_bucket{stage="ocr",trace="t",le="1"} 2',
+            'statmulti_stage_seconds_bucket{stage="ocr",trace="t",le="+Inf"} 3',
+            'statmulti_stage_seconds_sum{stage="ocr",trace="t"} 120.203',
+            'statmulti_stage_seconds_count{stage="ocr",trace="t"} 3',
+            '# TYPE statmulti_trace_seconds histogram',
+            'statmulti_trace_seconds_bucket{le="1"} 1',
+            'statmulti_trace_seconds_bucket{le="+Inf"} 1',
+            'statmulti_trace_seconds_sum{} 0.5',
+            'statmulti_trace_seconds_count{} 1',
+        ]) + '\n')
+
+    def test_endpoint_metrics(self):
+        registry = HistogramRegistry()
+        with mock.patch.object(tracing, '_sinks', [HistogramSink()]), mock.patch.object(tracing, 'registry', registry), \
+                mock.patch('stats.views.registry', registry):
+            with trace('test.trace'):
+                with span('ocr'):
+                    pass
+            response = self.client.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('statmulti_stage_seconds_bucket{stage="ocr",trace="test.trace",le="+Inf"} 1', body)
+        self.assertIn('statmulti_trace_seconds_count{trace="test.trace"} 1', body)
+
+
+class CaptureDebugTests(TestCase):
+
+    def test_capture_des_logs_ocr(self):
+        utils_logger = logging.getLogger('stats.utils')
+        level = utils_logger.level
+        utils_logger.setLevel(logging.INFO)
+        self.addCleanup(utils_logger.setLevel, level)
+
+        with mock.patch('stats.ocr_stack.prepare_image', return_value=full_screen_crops()), \
+                mock.patch('stats.ocr_stack.read_zones', return_value=list(SCREEN)), \
+                mock.patch('stats.ocr_stack.retry_missing_zones', side_effect=lambda crops, results: (results, [])), \
+                mock.patch.object(utils_logger, 'handle') as handle:
+            with capture_debug() as capture:
+                result = extract_kpi_with_easyocr(png_upload())
+            extract_kpi_with_easyocr(png_upload())  # Hors capture : rien n'est collecté
+
+        self.assertIn(
+            {'level': 'DEBUG', 'logger': 'stats.utils', 'message': f"donnée extraite : {result['data']}"},
+            capture['logs'],
+        )
+        self.assertEqual(len(capture['detections']), len(SCREEN))
+        # DEBUG inactif sur le logger : les handlers ne reçoivent rien
+        handle.assert_not_called()
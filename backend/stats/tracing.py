@@ -0,0 +1,176 @@
+# stats/tracing.py
+
+import bisect
+import contextvars
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger('stats.tracing')
+
+_current = contextvars.ContextVar('stats_trace', default=None)
+
+
+class Trace:
+    """Une requête (ou un job) : suite de spans chronométrés + attributs"""
+
+    def __init__(self, name):
+        self.name = name
+        self.spans = []
+        self.attributes = {}
+        self.start = time.perf_counter()
+        self.duration = None
+
+    def as_dict(self):
+        return {
+            'trace': self.name,
+            'duration': self.duration,
+            'spans': [{'name': name, 'duration': duration} for name, duration in self.spans],
+            'attributes': self.attributes,
+        }
+
+
+@contextmanager
+def trace(name):
+    """
+    Ouvre une trace ; les spans créés dans ce contexte y sont rattachés.
+    A la sortie, la trace est transmise aux sinks de OCR_TRACE_SINKS
+    """
+    current = Trace(name)
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        current.duration = time.perf_counter() - current.start
+        _current.reset(token)
+        for sink in get_sinks():
+            try:
+                sink.emit(current)
+            except Exception:
+                logger.exception("Sink de trace en erreur : %r", sink)
+
+
+@contextmanager
+def span(name):
+    """
+    Chronomètre une étape de la trace en cours (sans effet hors trace)
+    """
+    current = _current.get()
+    if current is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.spans.append((name, time.perf_counter() - start))
+
+
+def set_attribute(key, value):
+    """
+    Attache une information à la trace en cours (dimensions, détections...)
+    """
+    current = _current.get()
+    if current is not None:
+        current.attributes[key] = value
+
+
+# === SINKS ===
+
+class LogSink:
+    """Une ligne JSON par trace sur le logger stats.tracing"""
+
+    def emit(self, current):
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("%s", json.dumps(current.as_dict(), default=str))
+
+
+class HistogramRegistry:
+    """Histogrammes en mémoire (par processus), exportables au format Prometheus"""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, metric, labels, value, buckets=BUCKETS):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    'buckets': buckets,
+                    'counts': [0] * len(buckets),
+                    'sum': 0.0,
+                    'count': 0,
+                }
+            index = bisect.bisect_left(histogram['buckets'], value)
+            if index < len(buckets):
+                histogram['counts'][index] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                key: {**histogram, 'counts': list(histogram['counts'])}
+                for key, histogram in self._histograms.items()
+            }
+
+    def render_prometheus(self):
+        lines = []
+        declared = set()
+        for (metric, labels), histogram in sorted(self.snapshot().items()):
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} histogram")
+                declared.add(metric)
+            label_text = ','.join(f'{name}="{value}"' for name, value in labels)
+            prefix = f"{label_text}," if label_text else ''
+            cumulative = 0
+            for bound, count in zip(histogram['buckets'], histogram['counts']):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{prefix}le="+Inf"}} {histogram["count"]}')
+            lines.append(f"{metric}_sum{{{label_text}}} {histogram['sum']}")
+            lines.append(f"{metric}_count{{{label_text}}} {histogram['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = HistogramRegistry()
+
+DETECTION_BUCKETS = (5, 10, 20, 40, 80, 160, 320)
+
+
+class HistogramSink:
+    """Alimente le registre en mémoire (durées par étape, nombre de détections)"""
+
+    def emit(self, current):
+        registry.observe('statmulti_trace_seconds', {'trace': current.name}, current.duration)
+        for name, duration in current.spans:
+            registry.observe('statmulti_stage_seconds', {'trace': current.name, 'stage': name}, duration)
+        detections = current.attributes.get('detections')
+        if detections is not None:
+            registry.observe('statmulti_ocr_detections', {'trace': current.name}, detections, DETECTION_BUCKETS)
+
+
+_sinks = None
+_sinks_lock = threading.Lock()
+
+
+def get_sinks():
+    global _sinks
+    if _sinks is None:
+        with _sinks_lock:
+            if _sinks is None:
+                _sinks = [
+                    import_string(path)()
+                    for path in getattr(settings, 'OCR_TRACE_SINKS', ['stats.tracing.HistogramSink'])
+                ]
+    return _sinks
@@ -1,6 +1,18 @@
 from django.urls import path, include
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path("kpi-daily", views.KPIDailyView.as_view(), name="kpi-daily"),
+    path("kpi-daily/batch", views.KPIDailyBatchView.as_view(), name="kpi-daily-batch"),
+    path("kpi-daily/import", views.KpiImportView.as_view(), name="kpi-daily-import"),
+    path("kpi-daily/export", views.kpi_export, name="kpi-daily-export"),
+    path("kpi-daily/jobs/<uuid:job_id>", views.OcrJobView.as_view(), name="ocr-job-detail"),
+    path("kpi-daily/<int:pk>/image/<str:name>", views.kpi_image, name="kpi-image"),
+    path("deltas", views.deltas, name="deltas"),
+    path("rollups", views.rollups, name="rollups"),
+    # Vues async (ASGI) : lectures non bloquantes, OCR dans un pool de processus
+    path("async/kpi-daily", async_views.kpi_daily, name="async-kpi-daily"),
+    path("async/deltas", async_views.deltas, name="async-deltas"),
+    path("ocr/metrics", views.ocr_metrics, name="ocr-metrics"),
+    path("metrics", views.metrics, name="metrics"),
 ]
@@ -1,97 +1,413 @@
 # stats/utils.py
 
-from csv import reader
-from .models import KpiDaily, StatsPeriod
-from datetime import date
-import easyocr
-from PIL import Image, ImageEnhance, ImageFilter, ImageOps
+from .models import KpiDaily, StatsPeriod, DailyDelta
+from .ocr_cache import file_digest, get_cached_detections, serialize_detections, store_detections
+from . import ocr_stack
+from .tracing import set_attribute, span
+from .logs import add_debug_detail, debug_capture_active, get_logger
+from asgiref.sync import sync_to_async
+from datetime import date, timedelta
+from django.db.models import Prefetch
+import logging
 import os
 import re
 
+logger = get_logger(__name__)
+
 def calculer_delta_journalier(date_jour):
     """
     Calcule la différence entre fin et début pour une date donnée
     """
-    try:
-        # Récupérer début et fin
-        debut = KpiDaily.objects.get(date=date_jour, moment='debut')
-        fin = KpiDaily.objects.get(date=date_jour, moment='fin')
-        
-        # Calculer les deltas stats (week et month)
-        stat_debut_week = StatsPeriod.objects.get(kpi_daily=debut, period_type='week')
-        stat_fin_week = StatsPeriod.objects.get(kpi_daily=fin, period_type='week')
-        
-        stat_debut_month = StatsPeriod.objects.get(kpi_daily=debut, period_type='month')
-        stat_fin_month = StatsPeriod.objects.get(kpi_daily=fin, period_type='month')
-        
-        msg_env = fin.msg_sent - debut.msg_sent
-        msg_recu = stat_fin_week.responses - stat_debut_week.responses
-        
-        # Calculer les deltas KPI
-        delta_kpi = {
-            'date': date_jour,
-            'msg_sent': msg_env,
-            'msg_rr': (msg_recu*100)/msg_env,
-            'photos_sent': fin.photos_sent - debut.photos_sent,
-            'gifts_sent': fin.gifts_sent - debut.gifts_sent,
-        }
-        
-        delta_stats = {
-            'week': {
-                'responses': msg_recu,
-                'kpi_effect': stat_fin_week.kpi_effect,
-                'extra_benefit': stat_fin_week.extra_benefits,
-                'penalite': stat_fin_week.penalites,
-                'total': stat_fin_week.total(),
+    return calculer_deltas(date_jour, date_jour)[0]
+
+
+def calculer_deltas(date_debut, date_fin):
+    """
+    Calcule les deltas journaliers de date_debut à date_fin (incluses)
+    Deux requêtes au total : les KpiDaily de la période puis leurs StatsPeriod
+    Retourne une liste d'un résultat par jour, y compris les jours sans données
+    """
+    kpis = (
+        KpiDaily.objects
+        .filter(date__range=(date_debut, date_fin), moment__in=['debut', 'fin'])
+        .prefetch_related(Prefetch(
+            'stats_periods',
+            queryset=StatsPeriod.objects.filter(period_type__in=['week', 'month']).order_by('pk'),
+        ))
+    )
+    
+    # (date, moment) -> KpiDaily
+    par_jour = {(kpi.date, kpi.moment): kpi for kpi in kpis}
+    
+    resultats = []
+    date_jour = date_debut
+    while date_jour <= date_fin:
+        resultats.append(_calculer_delta(
+            date_jour,
+            par_jour.get((date_jour, 'debut')),
+            par_jour.get((date_jour, 'fin')),
+        ))
+        date_jour += timedelta(days=1)
+    return resultats
+
+
+def _delta_vers_modele(resultat):
+    delta = DailyDelta(date=resultat['date'], success=resultat['success'], error=resultat.get('error', ''))
+    if resultat['success']:
+        delta_kpi = resultat['delta_kpi']
+        delta_stats = resultat['delta_stats']
+        delta.msg_sent = delta_kpi['msg_sent']
+        delta.msg_rr = delta_kpi['msg_rr']
+        delta.photos_sent = delta_kpi['photos_sent']
+        delta.gifts_sent = delta_kpi['gifts_sent']
+        delta.week_total = delta_stats['week']['total']
+        delta.month_total = delta_stats['month']['total']
+        delta.delta_kpi = delta_kpi
+        delta.delta_stats = delta_stats
+    return delta
+
+
+def rafraichir_deltas(dates):
+    """
+    Recalcule et enregistre les DailyDelta des dates données
+    Une date sans aucun KpiDaily n'a pas de ligne
+    """
+    dates = set(dates)
+    if not dates:
+        return
+    
+    avec_kpi = set(KpiDaily.objects.filter(date__in=dates).values_list('date', flat=True))
+    DailyDelta.objects.filter(date__in=dates - avec_kpi).delete()
+    
+    for resultat in calculer_deltas(min(dates), max(dates)):
+        if resultat['date'] not in avec_kpi:
+            continue
+        delta = _delta_vers_modele(resultat)
+        DailyDelta.objects.update_or_create(
+            date=delta.date,
+            defaults={
+                field.name: getattr(delta, field.name)
+                for field in DailyDelta._meta.concrete_fields
+                if field.name not in ('id', 'date', 'updated_at')
             },
-            'month': {
-                'responses': stat_fin_month.responses,
-                'kpi_effect': stat_fin_month.kpi_effect,
-                'extra_benefit': stat_fin_month.extra_benefits,
-                'penalite': stat_fin_month.penalites,
-                'total': stat_fin_month.total(),
-            }
-        }
-        
+        )
+
+
+def reconstruire_deltas(date_debut=None, date_fin=None, taille_lot=90):
+    """
+    Reconstruit entièrement la table DailyDelta (ou une période), par lots de jours
+    Retourne le nombre de lignes créées
+    """
+    kpis = KpiDaily.objects.all()
+    if date_debut:
+        kpis = kpis.filter(date__gte=date_debut)
+    if date_fin:
+        kpis = kpis.filter(date__lte=date_fin)
+    dates = set(kpis.values_list('date', flat=True))
+    
+    anciens = DailyDelta.objects.all()
+    if date_debut:
+        anciens = anciens.filter(date__gte=date_debut)
+    if date_fin:
+        anciens = anciens.filter(date__lte=date_fin)
+    anciens.delete()
+    
+    if not dates:
+        return 0
+    
+    crees = 0
+    debut_lot = min(dates)
+    dernier_jour = max(dates)
+    while debut_lot <= dernier_jour:
+        fin_lot = min(debut_lot + timedelta(days=taille_lot - 1), dernier_jour)
+        lignes = [
+            _delta_vers_modele(resultat)
+            for resultat in calculer_deltas(debut_lot, fin_lot)
+            if resultat['date'] in dates
+        ]
+        crees += len(DailyDelta.objects.bulk_create(lignes))
+        debut_lot = fin_lot + timedelta(days=1)
+    return crees
+
+
+def lire_deltas(date_debut, date_fin):
+    """
+    Lit les deltas matérialisés (une seule requête), au même format que calculer_deltas
+    """
+    lignes = DailyDelta.objects.filter(date__range=(date_debut, date_fin))
+    lignes = {delta.date: delta for delta in lignes}
+    lignes.update(_completer_deltas(lignes, date_debut, date_fin))
+    return _formater_deltas(lignes, date_debut, date_fin)
+
+
+async def alire_deltas(date_debut, date_fin):
+    """
+    Version async de lire_deltas (vues ASGI)
+    """
+    lignes = DailyDelta.objects.filter(date__range=(date_debut, date_fin))
+    lignes = {delta.date: delta async for delta in lignes.aiterator()}
+    lignes.update(await sync_to_async(_completer_deltas)(lignes, date_debut, date_fin))
+    return _formater_deltas(lignes, date_debut, date_fin)
+
+
+def _completer_deltas(lignes, date_debut, date_fin):
+    """
+    Jours ayant des KpiDaily mais pas encore de DailyDelta (données antérieures
+    à la table, rafraîchissement perdu) : calculés et enregistrés à la lecture.
+    Une requête de plus seulement s'il manque des jours
+    Retourne {date: DailyDelta} des jours complétés
+    """
+    manquants = {date_debut + timedelta(days=n) for n in range((date_fin - date_debut).days + 1)} - set(lignes)
+    if not manquants:
+        return {}
+    avec_kpi = set(KpiDaily.objects.filter(date__in=manquants).values_list('date', flat=True).distinct())
+    if not avec_kpi:
+        return {}
+    rafraichir_deltas(avec_kpi)
+    return {delta.date: delta for delta in DailyDelta.objects.filter(date__in=avec_kpi)}
+
+
+def _formater_deltas(lignes, date_debut, date_fin):
+    resultats = []
+    date_jour = date_debut
+    while date_jour <= date_fin:
+        delta = lignes.get(date_jour)
+        if delta is None or not delta.success:
+            resultats.append({
+                'success': False,
+                'date': date_jour,
+                'error': delta.error if delta else f"Données manquantes pour le {date_jour}"
+            })
+        else:
+            resultats.append({
+                'success': True,
+                'date': date_jour,
+                'delta_kpi': delta.delta_kpi,
+                'delta_stats': delta.delta_stats
+            })
+        date_jour += timedelta(days=1)
+    return resultats
+
+
+def _stat_par_periode(kpi):
+    """
+    StatsPeriod préchargées d'un KpiDaily, par période. Un KpiDaily peut avoir
+    une ligne par moment (unique_together) : celle de son propre moment
+    l'emporte, une ligne d'un autre moment ne sert que si elle est seule
+    """
+    stats = {}
+    for stat in kpi.stats_periods.all():
+        if stat.moment == kpi.moment or stat.period_type not in stats:
+            stats[stat.period_type] = stat
+    return stats
+
+
+def _calculer_delta(date_jour, debut, fin):
+    """
+    Delta d'une journée à partir des KpiDaily début/fin (stats_periods préchargées)
+    """
+    if debut is None or fin is None:
         return {
-            'success': True,
-            'delta_kpi': delta_kpi,
-            'delta_stats': delta_stats
+            'success': False,
+            'date': date_jour,
+            'error': f"Données manquantes pour le {date_jour}"
         }
-        
-    except KpiDaily.DoesNotExist:
+    
+    stats_debut = _stat_par_periode(debut)
+    stats_fin = _stat_par_periode(fin)
+    if 'week' not in stats_debut or 'week' not in stats_fin or 'month' not in stats_fin:
         return {
             'success': False,
-            'error': f"Données manquantes pour le {date_jour}"
+            'date': date_jour,
+            'error': f"Statistiques manquantes pour le {date_jour}"
+        }
+    
+    # Calculer les deltas stats (week et month)
+    stat_debut_week = stats_debut['week']
+    stat_fin_week = stats_fin['week']
+    stat_fin_month = stats_fin['month']
+    
+    msg_env = fin.msg_sent - debut.msg_sent
+    msg_recu = stat_fin_week.responses - stat_debut_week.responses
+    
+    # Calculer les deltas KPI
+    delta_kpi = {
+        'date': date_jour,
+        'msg_sent': msg_env,
+        'msg_rr': (msg_recu*100)/msg_env if msg_env else None,
+        'photos_sent': fin.photos_sent - debut.photos_sent,
+        'gifts_sent': fin.gifts_sent - debut.gifts_sent,
+    }
+    
+    delta_stats = {
+        'week': {
+            'responses': msg_recu,
+            'kpi_effect': stat_fin_week.kpi_effect,
+            'extra_benefit': stat_fin_week.extra_benefits,
+            'penalite': stat_fin_week.penalites,
+            'total': stat_fin_week.total(),
+        },
+        'month': {
+            'responses': stat_fin_month.responses,
+            'kpi_effect': stat_fin_month.kpi_effect,
+            'extra_benefit': stat_fin_month.extra_benefits,
+            'penalite': stat_fin_month.penalites,
+            'total': stat_fin_month.total(),
         }
+    }
+    
+    return {
+        'success': True,
+        'date': date_jour,
+        'delta_kpi': delta_kpi,
+        'delta_stats': delta_stats
+    }
+
+REQUIRED_KPI_FIELDS = ['msg_sent', 'msg_rr', 'photo_sent', 'photo_rr',
+                       'gift_sent', 'gift_rr', 'speed_rr']
+
+
+def finalize_kpi_data(kpi_data, date_jour, moment, note=None):
+    """
+    Ajoute date, moment et note aux KPIs extraits et liste les champs manquants
+    Retourne (kpi_data, missing_fields)
+    """
+    kpi_data['date'] = str(date_jour)
+    kpi_data['moment'] = moment
+    if note:
+        kpi_data['note'] = note
+
+    missing_fields = [f for f in REQUIRED_KPI_FIELDS if f not in kpi_data or kpi_data[f] is None]
+    return kpi_data, missing_fields
+
 
 def extract_kpi_with_easyocr(image_file):
     """
-    Extrait les KPIs avec EasyOCR en utilisant les positions géographiques
+    Extrait les KPIs en utilisant les positions géographiques (moteurs OCR :
+    stats/ocr_backends.py, EasyOCR par défaut)
     """
     try:
-        images = image_file.read()
-        reader = easyocr.Reader(['en'], gpu=False)
-        results = reader.readtext(images, detail=1)
+        # Même image déjà traitée : réutiliser les détections brutes
+        with span('hash'):
+            digest = file_digest(image_file)
+        with span('cache_lookup'):
+            results = get_cached_detections(digest)
+        set_attribute('cache_hit', results is not None)
+        retried_zones = []
+        if results is None:
+            # Normaliser puis ne lire que les zones utiles de l'écran
+            with span('decode'):
+                crops = ocr_stack.prepare_image(image_file)
+            # Moteur rapide d'abord, EasyOCR pour les zones manquantes (OCR_BACKENDS)
+            with span('readtext'):
+                results = ocr_stack.read_zones(crops)
+            # Champs manquants : relire seulement les zones concernées, prétraitées
+            results, retried_zones = ocr_stack.retry_missing_zones(crops, results)
+            with span('cache_store'):
+                store_detections(digest, results)
+        set_attribute('detections', len(results))
+        if debug_capture_active():
+            add_debug_detail('detections', serialize_detections(results))
         
         # Analyser par zones géographiques
-        kpi_data = parse_by_geographic_zones(results)
-        #print(f'donnée extraire: {kpi_data}')
+        with span('parse'):
+            kpi_data = parse_by_geographic_zones(results)
+        logger.debug("donnée extraite : %s", kpi_data)
         
         return {
             'success': True,
             'data': kpi_data,
-            'detections_count': len(results)
+            'detections_count': len(results),
+            'retried_zones': retried_zones
         }
         
     except Exception as e:
-        print(f'erreur : {str(e)}')
+        logger.exception("Erreur pendant l'extraction OCR")
         return {
             'success': False,
             'error': str(e)
         }
 
 
+# Correspondance clés extraites -> champs du modèle KpiDaily
+KPI_MODEL_FIELDS = {
+    'msg_sent': 'msg_sent',
+    'msg_rr': 'msg_rr',
+    'photo_sent': 'photos_sent',
+    'photo_rr': 'photos_rr',
+    'gift_sent': 'gifts_sent',
+    'gift_rr': 'gifts_rr',
+    'speed_rr': 'speed_rr',
+}
+
+
+def kpi_data_to_model(kpi_data):
+    """
+    Construit une instance KpiDaily (non sauvegardée) à partir des KPIs extraits
+    """
+    fields = {model_field: kpi_data[key] for key, model_field in KPI_MODEL_FIELDS.items()}
+    return KpiDaily(
+        date=kpi_data['date'],
+        moment=kpi_data['moment'],
+        note=kpi_data.get('note'),
+        **fields
+    )
+
+
+def extract_kpi_batch_with_easyocr(image_files):
+    """
+    Extrait les KPIs de plusieurs images avec la même politique de moteurs
+    que extract_kpi_with_easyocr (OCR_BACKENDS, relecture des zones
+    manquantes) ; le premier moteur lit tout le lot, par lots pour EasyOCR.
+    Retourne une liste de résultats au même format que extract_kpi_with_easyocr
+    """
+    results = [None] * len(image_files)
+    detections = {}
+
+    # Découper chaque image en zones (images déjà traitées : cache)
+    crops_by_index = {}
+    digests = {}
+    for index, image_file in enumerate(image_files):
+        try:
+            digest = file_digest(image_file)
+            cached = get_cached_detections(digest)
+            if cached is not None:
+                detections[index] = cached
+                continue
+            crops_by_index[index] = ocr_stack.prepare_image(image_file)
+        except Exception as e:
+            results[index] = {'success': False, 'error': str(e)}
+            continue
+        digests[index] = digest
+
+    retried = {}
+    try:
+        indexes = list(crops_by_index)
+        read = ocr_stack.read_zones_batch([crops_by_index[index] for index in indexes])
+        for index, image_results in zip(indexes, read):
+            # Champs manquants : relire seulement les zones concernées, prétraitées
+            detections[index], retried[index] = ocr_stack.retry_missing_zones(crops_by_index[index], image_results)
+            store_detections(digests[index], detections[index])
+
+        # Classement de toutes les détections du lot en une passe
+        indexes = list(detections)
+        parsed = parse_by_geographic_zones_batch([detections[index] for index in indexes])
+        for index, kpi_data in zip(indexes, parsed):
+            results[index] = {
+                'success': True,
+                'data': kpi_data,
+                'detections_count': len(detections[index]),
+                'retried_zones': retried.get(index, []),
+            }
+    except Exception as e:
+        logger.exception("Erreur pendant l'extraction OCR par lot")
+        for index, result in enumerate(results):
+            if result is None:
+                results[index] = {'success': False, 'error': str(e)}
+
+    return results
+
+
 def parse_by_geographic_zones(results):
     """
     Parse les KPIs en divisant l'écran en 4 zones :
@@ -99,266 +415,27 @@ def parse_by_geographic_zones(results):
     - Zone 2 (haut-droite) : Gifts
     - Zone 3 (bas-gauche) : Photos
     - Zone 4 (bas-droite) : Response Speed
+    Les bornes des zones viennent de la disposition active (stats/layout.py)
     """
-    
-    # Séparer les détections par position
-    zones = {
-        'messages': [],      # x < 480, y < 500
-        'gifts': [],         # x >= 480, y < 500
-        'photos': [],        # x < 480, y >= 500
-        'speeds': [],         # x >= 480, y >= 500
-        'meta': []           # Total KPI, KPI Effect (très bas)
-    }
-    
-    for (bbox, text, confidence) in results:
-        # Position du centre du texte
-        x_center = (bbox[0][0] + bbox[2][0]) / 2
-        y_center = (bbox[0][1] + bbox[2][1]) / 2
-        
-        #print(f" x_centre : {x_center}, y_centre: {y_center}, texte : {text}")
-        
-        text_clean = text.strip()
-        #print(f'text cleaned : {text_clean} avec confidence {confidence} x_centre : {x_center}, y_centre: {y_center}')
-        
-        # Ignorer texte trop court ou trop peu confiant
-        if len(text_clean) < 2 or confidence < 0.3:
-            print(f'text court : {text_clean}, len: {len(text_clean)}, and confidence : {confidence}')
-            continue
-        
-        if text_clean =="This week":
-            print(text_clean)
-        
-        # === DÉTECTER LA ZONE ===
-        
-        # Métadonnées (très bas dans l'image, y > 800)
-        if y_center <= 200:
-            zones['meta'].append({
-                'text': text_clean,
-                'x': x_center,
-                'y': y_center,
-                'confidence': confidence
-            })
-        # Messages (haut-gauche)
-        elif y_center < 500 and  y_center > 300 and x_center < 480:
-            zones['messages'].append({
-                'text': text_clean,
-                'x': x_center,
-                'y': y_center,
-                'confidence': confidence
-            })
-        # Gifts (haut-droite)
-        elif y_center < 500 and y_center > 300 and x_center >= 480:
-            zones['gifts'].append({
-                'text': text_clean,
-                'x': x_center,
-                'y': y_center,
-                'confidence': confidence
-            })
-        # Photos (bas-gauche)
-        elif y_center >= 600 and y_center < 800 and x_center < 480:
-            zones['photos'].append({
-                'text': text_clean,
-                'x': x_center,
-                'y': y_center,
-                'confidence': confidence
-            })
-        # Response Speed (bas-droite)
-        elif y_center >= 600 and y_center < 800 and x_center >= 480:
-            zones['speeds'].append({
-                'text': text_clean,
-                'x': x_center,
-                'y': y_center,
-                'confidence': confidence
-            })
-    
-    print("********* message")
-    for message in zones['messages']:
-        print(f'les zones : {message["text"]}')
-        
-    print("********* gift")
-    for gift in zones['gifts']:
-        print(f'texte : {gift['text']}')
-        
-    print("********* photo")
-    for photo in zones['photos']:
-        print(f'texte : {photo['text']}')
-        
-    print("********* speed")
-    for speed in zones['speeds']:
-        print(f'texte : {speed['text']}')
-        
-    print("********* metadata")
-    for meta in zones['meta']:
-        print(f'texte : {meta['text']}')
-    
-    # Parser chaque zone
-    kpi_data = {}
-    
-    # Messages
-    msg_data = extract_sent_and_rr(zones['messages'])
-    if msg_data:
-        kpi_data['msg_sent'] = msg_data.get('sent')
-        kpi_data['msg_rr'] = msg_data.get('rr')
-    
-    # Gifts
-    gift_data = extract_sent_and_rr_for_gift_and_photos(zones['gifts'])
-    if gift_data:
-        kpi_data['gift_sent'] = gift_data.get('sent')
-        kpi_data['gift_rr'] = gift_data.get('rr')
-    
-    # Photos
-    photo_data = extract_sent_and_rr_for_gift_and_photos(zones['photos'])
-    if photo_data:
-        kpi_data['photo_sent'] = photo_data.get('sent')
-        kpi_data['photo_rr'] = photo_data.get('rr')
-    
-    # Response Speed
-    speed = extract_speed(zones['speeds'])
-    if speed:
-        kpi_data['speed_rr'] = speed
-    
-    # Meta
-    #meta = extract_meta(zones['meta'])
-    #kpi_data.update(meta)
-    
-    #print(f'Zones détectées: {zones}')
-    return kpi_data
+    return parse_zones(ocr_stack.group_by_zone(results))
 
 
-def extract_sent_and_rr(zone_items):
+def parse_by_geographic_zones_batch(results_list):
     """
-    Extrait "X Sent" et "Y% RR" d'une zone
-    Cherche les patterns peu importe l'ordre
+    Même chose pour plusieurs images : classement des détections en une passe
     """
-    result = {}
-    
-    # Combiner tous les textes de la zone
-    all_text = ' '.join([item['text'] for item in zone_items])
-    print(f'all text joined : {all_text}')
-    
-    # === CHERCHER "SENT" ===
-    # Patterns de référence :
-    # - "2520 Sent"
-    # - "2250 Sent"
-    # - "0 Sent"
-    matches = re.findall(r'(\d+)\s*Sent', all_text, re.IGNORECASE)
-    if matches:
-        # Prendre le PREMIER nombre trouvé avec "Sent"
-        # (les badges sont généralement les premiers)
-        for match in matches:
-            if match != '2520' and match !="2250" and match !="0":
-                print(f' matches : {match}')
-                result['sent'] = int(match)
-            else:
-                result['sent'] = 0
-    
-    # === CHERCHER "RR" (Response Rate) ===
-    # Patterns possibles :
-    # - "90% RR"
-    # - "78%RR" (sans espace)
-    # - "0% RR"
-    matches = re.findall(r'([\d.]+)\s*RR', all_text, re.IGNORECASE)
-    print(matches)
-    rr_cleaned = []
-    if matches:
-        # Prendre le PREMIER pourcentage avec RR
-        for match in matches:
-            rr_cleaned.append(match[:-2])
-        
-        for rr in rr_cleaned:
-            if rr != '90' and rr !="78" and rr !="0":
-                print(f'rr matches : {rr}')
-                result['rr'] = float(rr)
-            else:
-                print("RR pris par defaut 90, développement de l'algo en cours")
-                result['rr'] = 90
-    
-    return result
+    return ocr_stack.extract_kpis_batch(ocr_stack.group_by_zone_batch(results_list))
 
 
-def extract_sent_and_rr_for_gift_and_photos(zone_items):
+def parse_zones(zones):
     """
-    Extrait "X Sent" et "Y% RR" d'une zone
-    Cherche les patterns peu importe l'ordre
+    Extrait les KPIs de détections déjà regroupées par zone
+    (moteur d'extraction : stats/extraction.py)
     """
-    result = {}
-    
-    # Combiner tous les textes de la zone
-    all_text = ' '.join([item['text'] for item in zone_items])
-    print(f'all text joined : {all_text}')
-    
-    # === CHERCHER "SENT" ===
-    # Patterns de référence :
-    # - "540 Sent"
-    # - "125 Sent"
-    # - "0 Sent"
-    matches = re.findall(r'(\d+)\s*Sent', all_text, re.IGNORECASE)
-    if matches:
-        # Prendre le PREMIER nombre trouvé avec "Sent"
-        # (les badges sont généralement les premiers)
-        for match in matches:
-            if match != '540' and match !="125" and match !="0":
-                print(f' sent gift : {match}')
-                result['sent'] = int(match)
-            else:
-                result['sent'] = 0
-                print("valeur prise par defaut 0")
-    
-    # === CHERCHER "RR" (Response Rate) ===
-    # Patterns possibles :
-    # - "90% RR"
-    # - "78%RR" (sans espace)
-    # - "0% RR"
-    matches = re.findall(r'([\d.]+)\s*RR', all_text, re.IGNORECASE)
-    rr_cleaned = []
-    if matches:
-        for match in matches:
-            
-            rr_cleaned.append(match[:-2])
-            print(f'rr cleaned for gift and photos {len(match)}, {match}, {rr_cleaned}')
-        
-        for rr in rr_cleaned:
-            if rr != '90' and rr !="78" and rr !="0" and rr !="":
-                print(f'rr matches : {rr}')
-                result['rr'] = float(rr) #Provoque un erreur : could not convert string to float: ''
-            #Si on supprime else, RR de photo fonctionne, sinon il prend la valeur de else
-            else:
-                print("les valeurs doivent être inclus dans le cas particulier 90, 78, 0")
-                result['rr'] = 90
-            
-    return result
-
-def extract_speed(zone_items):
-    """
-    Extrait le pourcentage de Response Speed
-    Pattern : "XX.X% Messages answered within 1 minute"
-    """
-    all_text = ' '.join([item['text'] for item in zone_items])
-    print(f"all text for speed extrated: {all_text}")
-    # Chercher pourcentage avant "Messages answered" ou "answered"
-    match = re.findall(r'([\d.]+)\s*Messages', all_text, re.IGNORECASE)
-    result = []
-    result_temp = []
-    final_result = ""
-    if match:
-        for mtch in match:
-            if len(mtch) > 3:
-                print(f"all speed detected: {mtch}")
-                result.append(mtch)
-      
-        print(result)
-        result_temp = [nb[:-2] if nb.endswith("96") else nb for nb in result]
-        print(result_temp)
-        
-        for res in result_temp:
-            print(res)
-            if res !="65" and res != "50" and res != "0":
-                final_result = float(res)
-            else:
-                print("valeur prise par defaut")
-                final_result = "50"
-        print(f"final result for speed: {final_result}")
-    return final_result
+    if logger.isEnabledFor(logging.DEBUG):
+        for zone, items in zones.items():
+            logger.debug("zone %s : %s", zone, [item['text'] for item in items])
+    return ocr_stack.extract_kpis(zones)
 
 
 def extract_meta(zone_items):
@@ -368,7 +445,7 @@ def extract_meta(zone_items):
     meta = {}
     all_text = ' '.join([item['text'] for item in zone_items])
     
-    print(f"all text for meta : {all_text}")
+    logger.debug("all text for meta : %s", all_text)
     # Total KPI: -2.5
     match = re.findall(r'([\d.]+)\s*KPI', all_text, re.IGNORECASE)
     if match:
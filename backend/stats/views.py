@@ -1,22 +1,154 @@
-from django.http import JsonResponse
-from stats.utils import calculer_delta_journalier, extract_kpi_with_easyocr
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.utils.dateparse import parse_date
+from stats.utils import (
+    extract_kpi_with_easyocr, extract_kpi_batch_with_easyocr,
+    finalize_kpi_data, kpi_data_to_model, lire_deltas, rafraichir_deltas,
+)
+from stats.reader_pool import get_reader_pool
+from stats.ocr_processes import get_ocr_process_pool
+from stats.ocr_cache import cache_stats
+from stats.jobs import submit_ocr_job
+from stats.image_store import get_backend, store_image, upload_stats
+from stats.derivatives import CONTENT_TYPES, get_derivative, get_derivative_specs
+from stats.bulk_io import ImportFormatError, export_lines, import_history
+from stats.rollups import RollupError, rollup
+from stats import ocr_stack
+from stats.ocr_stack import ImageTooLarge, InvalidUpload
 from datetime import date
+from functools import wraps
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from .serializers import KpiDailySerializer, StatsPeriodSerializer
-from .models import KpiDaily, StatsPeriod
+from .pagination import KpiDailyCursorPagination
+from .logs import capture_debug
+from .tracing import registry, set_attribute, span, trace
+from .http_cache import invalider_reponses, kpi_http_cache, response_cache_stats
+from .models import KpiDaily, StatsPeriod, OcrJob, DailyDelta, ImageAttachment, StoredImage
 from rest_framework import status
 
-class KPIDailyView(APIView):
+EXPORT_CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson'}
+
+def filtrer_kpi_daily(params, kpi):
+    """
+    Filtres `date_from`, `date_to`, `moment` et sélection de champs `fields`
+    (seules les colonnes demandées sont lues). Retourne (queryset, fields, erreur)
+    """
+    for param, lookup in (('date_from', 'date__gte'), ('date_to', 'date__lte')):
+        value = params.get(param)
+        if value:
+            parsed = parse_date(value)
+            if parsed is None:
+                return kpi, None, f'{param} invalide (format attendu AAAA-MM-JJ)'
+            kpi = kpi.filter(**{lookup: parsed})
+    
+    moment = params.get('moment')
+    if moment:
+        kpi = kpi.filter(moment=moment)
+    
+    fields = None
+    if params.get('fields'):
+        fields = [f.strip() for f in params['fields'].split(',') if f.strip()]
+        unknown = set(fields) - set(KpiDailySerializer().fields)
+        if unknown:
+            return kpi, None, f'Champs inconnus : {", ".join(sorted(unknown))}'
+        # date et moment restent chargés : le curseur en dépend
+        columns = {KpiDailySerializer.source_fields.get(field, field) for field in fields}
+        kpi = kpi.only(*(columns | {'date', 'moment'}))
+    return kpi, fields, None
+
+
+def lire_periode(request, setting, default_max):
+    """
+    Période ?start=AAAA-MM-JJ&end=AAAA-MM-JJ (end par défaut : start), limitée
+    à `setting` jours. Retourne (date_debut, date_fin, réponse d'erreur ou None)
+    """
+    date_debut = parse_date(request.GET.get('start', ''))
+    date_fin = parse_date(request.GET.get('end', '')) or date_debut
+    
+    if date_debut is None or date_fin < date_debut:
+        return None, None, JsonResponse({
+            'status': 'error',
+            'message': 'Paramètres start/end invalides (format AAAA-MM-JJ)'
+        }, status=400)
+    
+    max_jours = getattr(settings, setting, default_max)
+    if (date_fin - date_debut).days >= max_jours:
+        return None, None, JsonResponse({
+            'status': 'error',
+            'message': f'Période trop longue, maximum {max_jours} jours'
+        }, status=400)
+    return date_debut, date_fin, None
+
+
+def debug_capture_post(post):
+    """
+    Avec ?debug=1 (si OCR_DEBUG_CAPTURE est actif), joint à la réponse tous
+    les logs de la requête, debug compris, et les détections OCR brutes
+    """
+    @wraps(post)
+    def wrapper(self, request, *args, **kwargs):
+        requested = str(request.query_params.get('debug', '')).lower() in ('1', 'true', 'yes')
+        if not (requested and getattr(settings, 'OCR_DEBUG_CAPTURE', False)):
+            return post(self, request, *args, **kwargs)
+        with capture_debug() as capture:
+            response = post(self, request, *args, **kwargs)
+        if isinstance(response.data, dict):
+            response.data['debug'] = capture
+        return response
+    return wrapper
+
+
+class TracedPostMixin:
+    """
+    Trace les POST (durée par étape, voir stats.tracing), rendu de la réponse inclus
+    """
+    trace_name = None
+    
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'POST':
+            return super().dispatch(request, *args, **kwargs)
+        with trace(self.trace_name) as current:
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                with span('serialize'):
+                    response.render()
+            current.attributes['status'] = response.status_code
+        return response
+
+
+@method_decorator(kpi_http_cache(KpiDaily), name='dispatch')
+class KPIDailyView(TracedPostMixin, APIView):
+    """
+    GET : liste paginée (curseur), filtres `date_from`, `date_to`, `moment`
+    et sélection de champs `fields=date,moment,msg_sent,...`
+    """
+    pagination_class = KpiDailyCursorPagination
+    trace_name = 'kpi_daily.post'
+    
     def get(self, request, format=None):
-        kpi = KpiDaily.objects.all()
-        serializer = KpiDailySerializer(kpi, many=True)
-        return Response(serializer.data)
+        kpi, fields, error = filtrer_kpi_daily(request.query_params, KpiDaily.objects.all())
+        if error:
+            return Response({
+                'success': False,
+                'error': error
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(kpi, request, view=self)
+        serializer = KpiDailySerializer(page, many=True, fields=fields, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
 
     """
     Extraction 100% automatique - Gère les badges à position variable
     """
+    @debug_capture_post
     def post(self, request, format=None):
         # 1. Vérifier l'image
         uploaded_image = request.FILES.get('image_kpi')
@@ -27,12 +159,46 @@ class KPIDailyView(APIView):
                 'error': 'Aucune image téléchargée'
             }, status=status.HTTP_400_BAD_REQUEST)
         
+        try:
+            with span('upload_check'):
+                ocr_stack.check_upload_limits(uploaded_image)
+        except ImageTooLarge as e:
+            return Response({
+                'success': False,
+                'error': str(e)
+            }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except InvalidUpload as e:
+            return Response({
+                'success': False,
+                'error': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        date_jour = request.data.get('date', str(date.today())) # cherche "date" (reçu par l'api rest), si ça n'existe pas il utilise date.today ( par defaut )
+        moment = request.data.get('moment', 'debut')
+        note = request.data.get('note')
+        
+        # Mode asynchrone : l'image est mise en file, le client suit le job
+        if str(request.query_params.get('async', request.data.get('async', ''))).lower() in ('1', 'true', 'yes'):
+            try:
+                job = submit_ocr_job(uploaded_image, date_jour, moment, note)
+            except ValidationError as e:
+                return Response({
+                    'success': False,
+                    'error': e.messages
+                }, status=status.HTTP_400_BAD_REQUEST)
+            return Response({
+                'success': True,
+                'job_id': str(job.id),
+                'status': job.status,
+                'status_url': reverse('ocr-job-detail', args=[job.id])
+            }, status=status.HTTP_202_ACCEPTED)
+        
         # 2. Extraire avec EasyOCR
         """ 
         Response = {success, data, detections_count}
         """
-        result = extract_kpi_with_easyocr(uploaded_image)
-        print(result['data'])
+        with span('ocr'):
+            result = extract_kpi_with_easyocr(uploaded_image)
         #return Response({"data": result['data']})
         
         if not result['success']:
@@ -41,30 +207,18 @@ class KPIDailyView(APIView):
                 'error': result['error']
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
-        kpi_data = result['data']
-        
         # 3. Ajouter date, moment, note
-        kpi_data['date'] = request.data.get('date', str(date.today())) # cherche "date" (reçu par l'api rest), si ça n'existe pas il utilise date.today ( par defaut )
-        kpi_data['moment'] = request.data.get('moment', 'debut')
-        
-        print(f"{kpi_data['date']},{kpi_data['moment']}")
-        
-        note = request.data.get('note')
-        if note:
-            kpi_data['note'] = note
-        
         # 4. Vérifier complétude
-        required_fields = ['msg_sent', 'msg_rr', 'photo_sent', 'photo_rr', 
-                          'gift_sent', 'gift_rr', 'speed_rr']
-        missing_fields = [f for f in required_fields if f not in kpi_data or kpi_data[f] is None]
+        kpi_data, missing_fields = finalize_kpi_data(result['data'], date_jour, moment, note)
         
-        if missing_fields:                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                  
+        if missing_fields:
             return Response({
                 'success': False,
                 'error': 'Données incomplètes',
                 'extracted_data': kpi_data,
                 'missing_fields': missing_fields,
                 'detections': result.get('detections_count', 0),
+                'retried_zones': result.get('retried_zones', []),
                 'suggestion': 'Vérifiez la qualité/résolution de l\'image'
             }, status=status.HTTP_400_BAD_REQUEST)
         
@@ -91,9 +245,254 @@ class KPIDailyView(APIView):
             'validation_errors': serializer.errors
         }, status=status.HTTP_400_BAD_REQUEST) """
 
+
+class KPIDailyBatchView(TracedPostMixin, APIView):
+    """
+    Import en masse : plusieurs `image_kpi`, chacune avec sa `date` et son `moment`
+    (champs répétés dans le même ordre que les fichiers)
+    """
+    trace_name = 'kpi_daily.batch'
+    
+    def post(self, request, format=None):
+        images = request.FILES.getlist('image_kpi')
+        dates = request.data.getlist('date')
+        moments = request.data.getlist('moment') or ['debut'] * len(images)
+        notes = request.data.getlist('note') or [None] * len(images)
+        
+        if not images:
+            return Response({
+                'success': False,
+                'error': 'Aucune image téléchargée'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        max_files = getattr(settings, 'OCR_BATCH_MAX_FILES', 50)
+        if len(images) > max_files:
+            return Response({
+                'success': False,
+                'error': f'Trop d\'images ({len(images)}), maximum {max_files} par lot'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not (len(dates) == len(moments) == len(notes) == len(images)):
+            return Response({
+                'success': False,
+                'error': 'Chaque image doit avoir sa date et son moment'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Dates normalisées : "2026-1-7" et "2026-01-07" désignent le même jour
+        dates = [parse_date(d) for d in dates]
+        if any(d is None for d in dates):
+            return Response({
+                'success': False,
+                'error': 'Date invalide (format attendu AAAA-MM-JJ)'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Fichiers hors limites écartés avant tout décodage
+        rejected = {}
+        for index, image in enumerate(images):
+            try:
+                ocr_stack.check_upload_limits(image)
+            except InvalidUpload as e:
+                rejected[index] = {'success': False, 'error': str(e)}
+        
+        accepted = [image for index, image in enumerate(images) if index not in rejected]
+        set_attribute('images', len(images))
+        with span('ocr'):
+            extracted = iter(extract_kpi_batch_with_easyocr(accepted))
+        results = [rejected[index] if index in rejected else next(extracted) for index in range(len(images))]
+        
+        # Couples (date, moment) déjà en base : une seule requête
+        existing = set(KpiDaily.objects.filter(date__in=set(dates)).values_list('date', 'moment'))
+        
+        items = []
+        to_create = []
+        images_to_store = []
+        items_to_create = []
+        for image, result, date_jour, moment, note in zip(images, results, dates, moments, notes):
+            item = {'image': image.name, 'date': str(date_jour), 'moment': moment}
+            items.append(item)
+            
+            if not result['success']:
+                item.update({'success': False, 'error': result['error']})
+                continue
+            
+            kpi_data, missing_fields = finalize_kpi_data(result['data'], date_jour, moment, note)
+            item['detections'] = result.get('detections_count', 0)
+            item['data'] = kpi_data
+            
+            if missing_fields:
+                item.update({'success': False, 'error': 'Données incomplètes', 'missing_fields': missing_fields})
+            elif (date_jour, moment) in existing:
+                item.update({'success': False, 'error': 'KPI déjà enregistré pour cette date et ce moment'})
+            else:
+                kpi = kpi_data_to_model(kpi_data)
+                try:
+                    kpi.full_clean(exclude=['image_kpi'], validate_unique=False)
+                except ValidationError as e:
+                    item.update({'success': False, 'error': 'Validation échouée', 'validation_errors': e.message_dict})
+                    continue
+                existing.add((date_jour, moment))
+                to_create.append(kpi)
+                images_to_store.append(image)
+                items_to_create.append(item)
+                item['success'] = True
+        
+        with span('bulk_create'):
+            try:
+                with transaction.atomic():
+                    created = KpiDaily.objects.bulk_create(to_create)
+            except IntegrityError:
+                # Ligne insérée entre-temps par une autre requête : création une
+                # par une, seuls les doublons échouent
+                created = []
+                stored = []
+                for kpi, image, item in zip(to_create, images_to_store, items_to_create):
+                    try:
+                        with transaction.atomic():
+                            kpi.save()
+                    except IntegrityError:
+                        item.update({'success': False, 'error': 'KPI déjà enregistré pour cette date et ce moment'})
+                        continue
+                    created.append(kpi)
+                    stored.append(image)
+                images_to_store = stored
+        # bulk_create n'envoie pas de signal : mettre à jour les deltas ici
+        rafraichir_deltas(kpi.date for kpi in created)
+        if created:
+            invalider_reponses()
+        
+        # Captures envoyées en arrière-plan, image_kpi rempli à la fin de l'envoi
+        with span('image_store'):
+            for kpi, image in zip(created, images_to_store):
+                store_image(image, kpi, 'image_kpi')
+        
+        return Response({
+            'success': True,
+            'created': len(created),
+            'failed': len(items) - len(created),
+            'results': items
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+
+class KpiImportView(APIView):
+    """
+    Import d'historique : `file` (CSV avec en-tête ou JSONL), `format` (déduit
+    de l'extension sinon), `kind` (kpi ou stats), `on_conflict` (skip, update, error)
+    """
+    def post(self, request, format=None):
+        uploaded = request.FILES.get('file')
+        if not uploaded:
+            return Response({
+                'success': False,
+                'error': 'Aucun fichier téléchargé'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        max_bytes = getattr(settings, 'IMPORT_MAX_UPLOAD_BYTES', 100 * 1024 * 1024)
+        if uploaded.size > max_bytes:
+            return Response({
+                'success': False,
+                'error': f'Fichier trop volumineux ({uploaded.size} octets), maximum {max_bytes}'
+            }, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        
+        fmt = request.data.get('format') or uploaded.name.rsplit('.', 1)[-1].lower()
+        try:
+            with span('import'):
+                report = import_history(
+                    uploaded.file, fmt,
+                    kind=request.data.get('kind', 'kpi'),
+                    on_conflict=request.data.get('on_conflict', 'skip'),
+                    chunk_size=getattr(settings, 'IMPORT_CHUNK_SIZE', 1000),
+                )
+        except ImportFormatError as e:
+            # Rapport partiel : lignes déjà écrites avant l'erreur
+            return Response({
+                'success': False,
+                'error': str(e),
+                **getattr(e, 'report', {})
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'success': not report['invalid'],
+            **report
+        }, status=status.HTTP_201_CREATED if report['created'] else status.HTTP_200_OK)
+
+
+def kpi_export(request):
+    # Export d'historique en flux : ?format=csv|jsonl&kind=kpi|stats&date_from=&date_to=
+    fmt = request.GET.get('format', 'csv')
+    kind = request.GET.get('kind', 'kpi')
+    dates = {}
+    for param in ('date_from', 'date_to'):
+        value = request.GET.get(param)
+        if value:
+            dates[param] = parse_date(value)
+            if dates[param] is None:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': f'{param} invalide (format AAAA-MM-JJ)'
+                }, status=400)
+    
+    if fmt not in EXPORT_CONTENT_TYPES or kind not in ('kpi', 'stats'):
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Paramètres format (csv, jsonl) ou kind (kpi, stats) invalides'
+        }, status=400)
+    
+    response = StreamingHttpResponse(export_lines(fmt, kind=kind, **dates), content_type=EXPORT_CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{kind}-history.{fmt}"'
+    return response
+
+
+class OcrJobView(APIView):
+    """
+    Statut / résultat d'un job OCR lancé avec POST /api/kpi-daily?async=1
+    """
+    def get(self, request, job_id, format=None):
+        try:
+            job = OcrJob.objects.defer('image_data').get(pk=job_id)
+        except OcrJob.DoesNotExist:
+            return Response({
+                'success': False,
+                'error': 'Job introuvable'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        if job.status in (OcrJob.STATUS_PENDING, OcrJob.STATUS_RUNNING):
+            return Response({
+                'success': True,
+                'job_id': str(job.id),
+                'status': job.status
+            }, status=status.HTTP_202_ACCEPTED)
+        
+        if job.status == OcrJob.STATUS_FAILED:
+            return Response({
+                'success': False,
+                'job_id': str(job.id),
+                'status': job.status,
+                'error': job.error
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        if job.missing_fields:
+            return Response({
+                'success': False,
+                'job_id': str(job.id),
+                'status': job.status,
+                'error': 'Données incomplètes',
+                'extracted_data': job.kpi_data,
+                'missing_fields': job.missing_fields,
+                'detections': job.detections_count,
+                'suggestion': 'Vérifiez la qualité/résolution de l\'image'
+            })
+        
+        return Response({
+            'success': True,
+            'job_id': str(job.id),
+            'status': job.status,
+            'data': job.kpi_data
+        })
+
+@kpi_http_cache(KpiDaily, StatsPeriod, DailyDelta)
 def index(request):
     # Calculer le delta d'aujourd'hui
-    resultat = calculer_delta_journalier(date(2025, 12, 2))
+    resultat = lire_deltas(date(2025, 12, 2), date(2025, 12, 2))[0]
 
     if resultat['success']:
         # Retourner en JSON (plus pratique)
@@ -109,4 +508,112 @@ def index(request):
         return JsonResponse({
             'status': 'error',
             'message': resultat.get('error', 'Données non trouvées')
-        }, status=404)
\ No newline at end of file
+        }, status=404)
+
+@kpi_http_cache(KpiDaily, StatsPeriod, DailyDelta)
+def deltas(request):
+    # Deltas journaliers sur une période : ?start=AAAA-MM-JJ&end=AAAA-MM-JJ
+    date_debut, date_fin, error = lire_periode(request, 'DELTAS_MAX_DAYS', 366)
+    if error:
+        return error
+    
+    return JsonResponse({
+        'status': 'success',
+        'data': lire_deltas(date_debut, date_fin)
+    })
+
+
+@kpi_http_cache(KpiDaily, StatsPeriod, DailyDelta)
+def rollups(request):
+    # Agrégats par semaine / mois : ?bucket=week|month&start=&end=
+    # &metrics=msg_sent_sum,msg_rr_avg,total_last&moment=&period_type=
+    date_debut, date_fin, error = lire_periode(request, 'ROLLUP_MAX_DAYS', 3660)
+    if error:
+        return error
+    
+    metrics = [m.strip() for m in request.GET.get('metrics', '').split(',') if m.strip()]
+    try:
+        data = rollup(
+            date_debut, date_fin,
+            bucket=request.GET.get('bucket', 'week'),
+            metrics=metrics or None,
+            moment=request.GET.get('moment') or None,
+            period_type=request.GET.get('period_type') or None,
+        )
+    except RollupError as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=400)
+    
+    return JsonResponse({
+        'status': 'success',
+        'data': data
+    })
+
+
+def kpi_image(request, pk, name):
+    # Miniature de la capture d'un KPI (/api/kpi-daily/<id>/image/<nom>),
+    # produite à la première demande puis réutilisée
+    specs = get_derivative_specs()
+    if name not in specs:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Miniature inconnue : {name}'
+        }, status=404)
+    
+    attachment = (
+        ImageAttachment.objects.select_related('image')
+        .filter(model=KpiDaily._meta.label_lower, object_id=str(pk), field='image_kpi', image__status=StoredImage.STATUS_DONE)
+        .first()
+    )
+    if attachment is None:
+        kpi = KpiDaily.objects.filter(pk=pk).only('image_kpi').first()
+        if kpi is None or not kpi.image_kpi:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Aucune image pour ce KPI'
+            }, status=404)
+        # Image envoyée avant le stockage dédupliqué : pas de miniature, original
+        return HttpResponseRedirect(kpi.image_kpi.build_url(secure=True))
+    
+    backend = get_backend()
+    try:
+        reference = get_derivative(attachment.image, name)
+        url = backend.url(reference)
+        response = HttpResponseRedirect(url) if url else HttpResponse(
+            backend.read(reference), content_type=CONTENT_TYPES[specs[name]['format']]
+        )
+    except OSError as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': f'Miniature indisponible : {e}'
+        }, status=502)
+    patch_cache_control(response, public=True, max_age=getattr(settings, 'IMAGE_DERIVATIVE_MAX_AGE', 3600))
+    return response
+
+
+def ocr_metrics(request):
+    # Métriques : pool de Readers (warm-up, attente), cache des détections OCR,
+    # cache des réponses KPI, file d'envoi des images, pool de processus OCR
+    # latence par moteur OCR, relectures des zones manquées et dépendances
+    # lourdes chargées
+    return JsonResponse({
+        'status': 'success',
+        'data': {
+            'reader_pool': get_reader_pool().stats(),
+            'ocr_cache': cache_stats(),
+            'response_cache': response_cache_stats(),
+            'image_store': upload_stats(),
+            'process_pool': get_ocr_process_pool().stats(),
+            'ocr_backends': ocr_stack.backend_stats(),
+            'ocr_retry': ocr_stack.retry_stats(),
+            'ocr_stack': ocr_stack.stack_status()
+        }
+    })
+
+
+
+def metrics(request):
+    # Histogrammes des traces (durée par étape) au format texte Prometheus
+    return HttpResponse(registry.render_prometheus(), content_type='text/plain; version=0.0.4')